@@ -0,0 +1,71 @@
+"""Module analysis_queue runs data file analysis in the background on a bounded worker pool."""
+
+import threading
+import weakref
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import Engine
+
+_ANALYSIS_QUEUES: "weakref.WeakKeyDictionary[Engine, AnalysisQueue]" = weakref.WeakKeyDictionary()
+_ANALYSIS_QUEUES_LOCK = threading.Lock()
+
+
+class AnalysisQueue:
+    """Pool of worker threads with a bounded number of pending jobs.
+    A job first reserves a slot, which fails when max_pending jobs are already queued or
+    running, so callers can turn work away instead of piling it up. With no workers, jobs
+    run inline when they are submitted."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._idle = threading.Condition()
+        self._executor = (
+            ThreadPoolExecutor(workers, thread_name_prefix="analysis") if workers > 0 else None
+        )
+
+    def reserve(self) -> bool:
+        """Reserve a slot for a job. Returns False if the queue is full."""
+        with self._idle:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            return True
+
+    def cancel(self):
+        """Give back a reserved slot that will not be used."""
+        with self._idle:
+            self.pending -= 1
+            self._idle.notify_all()
+
+    def submit(self, job: Callable[[], None]):
+        """Run a job in a reserved slot. The slot is given back when the job finishes."""
+        if self._executor is None:
+            self._run(job)
+        else:
+            self._executor.submit(self._run, job)
+
+    def _run(self, job: Callable[[], None]):
+        """Run a job and give back its slot."""
+        try:
+            job()
+        finally:
+            self.cancel()
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait until no jobs are pending. Returns False if timeout ran out first."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self.pending == 0, timeout)
+
+
+def get_analysis_queue(engine: Engine, workers: int, max_pending: int) -> AnalysisQueue:
+    """Get the analysis queue for an engine, creating it with workers and max_pending on
+    first use."""
+    with _ANALYSIS_QUEUES_LOCK:
+        queue = _ANALYSIS_QUEUES.get(engine)
+        if queue is None:
+            queue = AnalysisQueue(workers, max_pending)
+            _ANALYSIS_QUEUES[engine] = queue
+        return queue
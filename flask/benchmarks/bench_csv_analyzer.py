@@ -0,0 +1,144 @@
+"""Module bench_csv_analyzer compares the csv stats engine with the same stats computed by
+pandas column by column, which its stats must match exactly. It also times the engine with
+its column groups split across threads.
+
+Run from the flask directory with `python -m benchmarks.bench_csv_analyzer`.
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from data import csv_analyzer
+
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark csv_analyzer.analyze_dataframe")
+    parser.add_argument(
+        "--shapes",
+        nargs="+",
+        default=["100000x20", "20000x200", "5000x1000"],
+        help="Frame shapes to benchmark, as ROWSxCOLUMNS.",
+    )
+    parser.add_argument(
+        "--null-fraction", type=float, default=0.05, help="Fraction of numeric cells left empty."
+    )
+    parser.add_argument(
+        "--string-fraction",
+        type=float,
+        default=0.1,
+        help="Fraction of columns holding strings.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of threads for the parallel run.",
+    )
+    return parser.parse_args(args)
+
+
+def analyze_with_pandas(df: pd.DataFrame) -> dict[str, Any]:
+    """Compute the stats of each column with pandas, as the reference for analyze_dataframe.
+    Means and standard deviations skip nulls over the whole column, so they are summed in
+    row order like analyze_dataframe sums them."""
+    column_stats = []
+    for col in df.columns:
+        col_data = df[col]
+        data_type = "numeric" if pd.api.types.is_numeric_dtype(col_data) else "string"
+        stats = {
+            "column_name": col,
+            "data_type": data_type,
+            "num_rows": int(len(col_data)),
+            "num_unique_values": int(col_data.nunique()),
+            "num_null_values": int(col_data.isnull().sum()),
+        }
+        if data_type == "numeric":
+            if col_data.notna().any():
+                stats["num_zeros_values"] = int(col_data.eq(0).sum())
+                stats["std_dev"] = float(col_data.std())
+                stats["mean"] = float(col_data.mean())
+                stats["median"] = float(col_data.median())
+                stats["min_value"] = float(col_data.min())
+                stats["max_value"] = float(col_data.max())
+        else:
+            string_data = col_data.dropna().astype(str)
+            stats["num_empty_values"] = int((string_data == "").sum())
+        column_stats.append(stats)
+    return {"num_columns": len(df.columns), "num_rows": len(df), "column_stats": column_stats}
+
+
+def make_frame(
+    num_rows: int, num_columns: int, null_fraction: float, string_fraction: float
+) -> pd.DataFrame:
+    """Make a frame of random floats, small integers and strings."""
+    rng = np.random.default_rng(0)
+    columns = {}
+    for i in range(num_columns):
+        if i < num_columns * string_fraction:
+            columns[f"column-{i}"] = rng.choice(["a", "b", "c", ""], num_rows)
+        elif i % 2:
+            columns[f"column-{i}"] = rng.integers(-5, 5, num_rows)
+        else:
+            values = rng.normal(size=num_rows)
+            values[rng.random(num_rows) < null_fraction] = np.nan
+            columns[f"column-{i}"] = values
+    return pd.DataFrame(columns)
+
+
+def assert_same_stats(got: dict[str, Any], want: dict[str, Any]):
+    """Check that two analyses have exactly the same stats, on the stats in want, which
+    leaves out the serialized sketches.
+    Raises AssertionError if they differ."""
+    assert got.keys() == want.keys()
+    for got_col, want_col in zip(got["column_stats"], want["column_stats"], strict=True):
+        assert got_col.keys() >= want_col.keys(), got_col["column_name"]
+        for key, want_value in want_col.items():
+            got_value = got_col[key]
+            if isinstance(want_value, float) and math.isnan(want_value):
+                assert math.isnan(got_value), (got_col["column_name"], key)
+            else:
+                assert got_value == want_value, (got_col["column_name"], key)
+
+
+def main(args: list[str]):
+    """Main function."""
+    args = parse_args(args)
+    print(
+        f"{'shape':>12} {'pandas (s)':>11} {'analyzer (s)':>13} {'speedup':>8} "
+        f"{f'{args.workers} workers (s)':>16}"
+    )
+    for shape in args.shapes:
+        num_rows, num_columns = (int(x) for x in shape.split("x"))
+        df = make_frame(num_rows, num_columns, args.null_fraction, args.string_fraction)
+
+        start = time.perf_counter()
+        # Bottleneck, if installed, sums differently from numpy.
+        with pd.option_context("compute.use_bottleneck", False):
+            want = analyze_with_pandas(df)
+        with_pandas = time.perf_counter() - start
+
+        start = time.perf_counter()
+        got = csv_analyzer.analyze_dataframe(df)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        got_parallel = csv_analyzer.analyze_dataframe(df, workers=args.workers)
+        parallel = time.perf_counter() - start
+        assert got_parallel == got, "parallel stats differ from serial stats"
+
+        assert_same_stats(got, want)
+        print(
+            f"{shape:>12} {with_pandas:>11.3f} {serial:>13.3f} "
+            f"{with_pandas / serial:>7.1f}x {parallel:>16.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
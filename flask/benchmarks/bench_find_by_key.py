@@ -0,0 +1,85 @@
+"""Module bench_find_by_key measures metadata lookup latency as the catalog grows.
+
+Run from the flask directory with `python -m benchmarks.bench_find_by_key`.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+from db import db_interface
+from db.models import FileMetadata
+from sqlalchemy import Engine, insert
+from sqlalchemy.orm import Session
+
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark FileMetadata.find_by_key")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 50000],
+        help="Number of file_metadata rows to benchmark against.",
+    )
+    parser.add_argument(
+        "--lookups", type=int, default=2000, help="Number of lookups per table size."
+    )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Drop the path index to compare against a full table scan.",
+    )
+    return parser.parse_args(args)
+
+
+def populate(engine: Engine, num_files: int):
+    """Insert num_files file_metadata rows."""
+    with engine.begin() as connection:
+        connection.execute(
+            insert(FileMetadata),
+            [
+                {
+                    "name": f"file-{i}",
+                    "path": f"folder-{i % 100}/file-{i}",
+                    "data_file_type": "csv",
+                    "data_file_path": f"{i}.csv",
+                }
+                for i in range(num_files)
+            ],
+        )
+
+
+def time_lookups(engine: Engine, num_files: int, num_lookups: int) -> float:
+    """Time num_lookups random path lookups and return the mean latency in microseconds."""
+    rng = random.Random(0)
+    paths = [f"folder-{i % 100}/file-{i}" for i in rng.choices(range(num_files), k=num_lookups)]
+    with Session(engine) as session:
+        start = time.perf_counter()
+        for path in paths:
+            assert FileMetadata.find_by_key(session, "path", path) is not None
+        elapsed = time.perf_counter() - start
+    return elapsed / num_lookups * 1e6
+
+
+def main(args: list[str]):
+    """Main function."""
+    args = parse_args(args)
+    print(f"{'rows':>10} {'mean lookup (us)':>18}")
+    for num_files in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            engine = db_interface.make_engine(f"{tmp_dir}/metadata.sqlite")
+            if args.no_index:
+                with engine.begin() as connection:
+                    connection.exec_driver_sql("DROP INDEX ix_file_metadata_path")
+            populate(engine, num_files)
+            latency = time_lookups(engine, num_files, args.lookups)
+            engine.dispose()
+        print(f"{num_files:>10} {latency:>18.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
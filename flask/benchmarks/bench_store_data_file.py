@@ -0,0 +1,79 @@
+"""Module bench_store_data_file measures how long storing an upload takes as the data file
+directory grows, next to the directory scan that used to pick each data file name.
+
+Run from the flask directory with `python -m benchmarks.bench_store_data_file`.
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+from db import data_interface
+
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark storing uploaded data files")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="Number of existing data files to benchmark against.",
+    )
+    parser.add_argument(
+        "--uploads", type=int, default=200, help="Number of uploads per directory size."
+    )
+    return parser.parse_args(args)
+
+
+def populate(data_file_dir: str, num_files: int):
+    """Create num_files empty data files with numbered names."""
+    for i in range(num_files):
+        with open(os.path.join(data_file_dir, f"{i}.csv"), "wb"):
+            pass
+
+
+def scan_next_name(data_file_dir: str) -> str:
+    """Pick the next numbered data file name by scanning the directory."""
+    last = -1
+    for name in os.listdir(data_file_dir):
+        stem, _, extension = name.partition(".")
+        if extension == "csv" and stem.isdigit():
+            last = max(last, int(stem))
+    return f"{last + 1}.csv"
+
+
+def time_uploads(data_file_dir: str, num_uploads: int) -> tuple[float, float]:
+    """Time num_uploads small uploads and as many directory scans, and return the mean
+    latency of each in microseconds."""
+    contents = [f"step,loss\n{i},{1 / (i + 1)}\n".encode() for i in range(num_uploads)]
+    start = time.perf_counter()
+    for content in contents:
+        tmp_path, path = data_interface.save_data_file(io.BytesIO(content), "csv", data_file_dir)
+        assert data_interface.store_data_file(tmp_path, path, data_file_dir)
+    store = (time.perf_counter() - start) / num_uploads * 1e6
+
+    start = time.perf_counter()
+    for _ in range(num_uploads):
+        scan_next_name(data_file_dir)
+    scan = (time.perf_counter() - start) / num_uploads * 1e6
+    return store, scan
+
+
+def main(args: list[str]):
+    """Main function."""
+    args = parse_args(args)
+    print(f"{'files':>10} {'mean store (us)':>17} {'mean scan (us)':>16}")
+    for num_files in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            populate(tmp_dir, num_files)
+            store, scan = time_uploads(tmp_dir, args.uploads)
+        print(f"{num_files:>10} {store:>17.1f} {scan:>16.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
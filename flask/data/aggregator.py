@@ -0,0 +1,259 @@
+"""Module aggregator computes chart series from the columns of a data file.
+
+The series have the reaviz data shapes the frontend charts take, the same ones
+react/src/data-viewer/graph/dataTransformers.js builds from raw rows:
+    shallow: [{"key", "data", "metadata"}, ...]
+    nested:  [{"key", "data": shallow}, ...]
+Cells parse the way the frontend parses them: empty or non-numeric values are skipped
+where numbers are needed, and category keys are the exact cell text. The metadata of each
+point holds the index of the data row it came from, or the indices of the first rows
+of a bin or group, for drilling down into the rows behind a point.
+Line and area series can be downsampled to a budget of points (see the downsample module),
+and each kept point keeps the index of its data row.
+"""
+
+import math
+import os
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from data import downsample, sketches
+
+CHART_TYPES = ["histogram", "heatmap", "bar", "line", "scatter", "area"]
+X_TYPES = ["numeric", "date", "string"]
+DEFAULT_BINS = 20
+MAX_BINS = 1000
+# Most row indices kept in the metadata of a histogram bin.
+MAX_BIN_ROW_INDICES = int(os.environ.get("MAX_BIN_ROW_INDICES", "100"))
+# Fewest points a line or area series can be downsampled to.
+MIN_POINTS = 3
+
+
+def _numbers(column: pd.Series) -> np.ndarray:
+    """Get a column as floats, with NaN for cells that are not numbers."""
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        return column.to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.to_numeric(column, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _text(column: pd.Series) -> pd.Series:
+    """Get a column as its cell text, with "" for empty cells."""
+    if pd.api.types.is_float_dtype(column):
+        column = column.map(repr, na_action="ignore")
+    return column.astype(object).where(column.notna(), "").astype(str)
+
+
+def _number_text(value: float) -> str:
+    """Format a number the way JavaScript's String does."""
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def histogram(column: pd.Series, bins: int = DEFAULT_BINS) -> list[dict[str, Any]]:
+    """Count the finite numeric values of a column in bins of equal width between their min
+    and max."""
+    values = _numbers(column)
+    rows = np.flatnonzero(np.isfinite(values))
+    values = values[rows]
+    if not len(values):
+        return []
+    low, high = float(values.min()), float(values.max())
+    if low == high:
+        return [
+            {
+                "key": _number_text(low),
+                "data": len(values),
+                "metadata": {
+                    "low": low,
+                    "high": high,
+                    "rowIndices": rows[:MAX_BIN_ROW_INDICES].tolist(),
+                },
+            }
+        ]
+
+    bin_numbers = sketches.bin_values(values, low, high, bins)
+    counts = np.bincount(bin_numbers, minlength=bins)
+    width = (high - low) / bins
+    if math.isfinite(width):
+        edges = [low + i * width for i in range(bins + 1)]
+    else:
+        edges = sketches.Histogram(low, high, counts).edges.tolist()
+    # Row indices sorted by bin, keeping the row order within each bin.
+    rows_by_bin = rows[np.argsort(bin_numbers, kind="stable")]
+    starts = np.concatenate(([0], np.cumsum(counts)))
+    series = []
+    for i in range(bins):
+        bin_low, bin_high = edges[i], edges[i + 1]
+        first_rows = rows_by_bin[starts[i] : min(starts[i + 1], starts[i] + MAX_BIN_ROW_INDICES)]
+        series.append(
+            {
+                "key": f"{bin_low:.1f}-{bin_high:.1f}",
+                "data": int(counts[i]),
+                "metadata": {"low": bin_low, "high": bin_high, "rowIndices": first_rows.tolist()},
+            }
+        )
+    return series
+
+
+def stored_histogram(histogram: sketches.Histogram) -> list[dict[str, Any]]:
+    """Get the series of a histogram stored with the stats of a column, binned the same way
+    as histogram bins its values but without their row indices."""
+    if histogram.low == histogram.high:
+        return [
+            {
+                "key": _number_text(histogram.low),
+                "data": int(histogram.counts.sum()),
+                "metadata": {"low": histogram.low, "high": histogram.high},
+            }
+        ]
+    edges = histogram.edges.tolist()
+    return [
+        {
+            "key": f"{low:.1f}-{high:.1f}",
+            "data": count,
+            "metadata": {"low": low, "high": high},
+        }
+        for low, high, count in zip(edges, edges[1:], histogram.counts.tolist(), strict=False)
+    ]
+
+
+def stored_top_values(top_values: sketches.TopValues) -> list[dict[str, Any]]:
+    """Get the bar series of the most frequent values stored with the stats of a column,
+    most frequent first."""
+    top = top_values.top(len(top_values.counts))
+    return [
+        {"key": value, "data": count}
+        for value, count in zip(top.index.tolist(), top.tolist(), strict=True)
+    ]
+
+
+def bar(x: pd.Series, y: pd.Series) -> list[dict[str, Any]]:
+    """Sum the numeric y values of each distinct x value, in order of first appearance."""
+    keys = _text(x)
+    values = _numbers(y)
+    frame = pd.DataFrame({"key": keys, "data": values, "row": np.arange(len(values))})
+    frame = frame[(keys != "").to_numpy() & ~np.isnan(values)]
+    groups = frame.groupby("key", sort=False).agg(data=("data", "sum"), row=("row", "first"))
+    return [
+        {"key": key, "data": float(data), "metadata": {"rowIndex": int(row)}}
+        for key, data, row in zip(groups.index, groups["data"], groups["row"], strict=True)
+    ]
+
+
+def heatmap(x: pd.Series, y: pd.Series, value: pd.Series) -> list[dict[str, Any]]:
+    """Sum the numeric values of each (y, x) cell, nested by y value, in order of first
+    appearance."""
+    values = _numbers(value)
+    frame = pd.DataFrame(
+        {"y": _text(y), "x": _text(x), "data": values, "row": np.arange(len(values))}
+    )
+    frame = frame[~np.isnan(values)]
+    groups = frame.groupby(["y", "x"], sort=False).agg(data=("data", "sum"), row=("row", "first"))
+    nested: dict[str, list[dict[str, Any]]] = {}
+    for (y_key, x_key), data, row in zip(groups.index, groups["data"], groups["row"], strict=True):
+        nested.setdefault(y_key, []).append(
+            {"key": x_key, "data": float(data), "metadata": {"rowIndex": int(row)}}
+        )
+    return [{"key": y_key, "data": cells} for y_key, cells in nested.items()]
+
+
+def _keys(x: pd.Series, x_type: str) -> tuple[list[Any], np.ndarray, np.ndarray]:
+    """Get the keys of the points of a line chart, which rows have one, and the position
+    of each key on the x axis, which is the row index for string keys."""
+    if x_type == "numeric":
+        keys = _numbers(x)
+        valid = ~np.isnan(keys)
+        return keys.tolist(), valid, keys
+    text = _text(x)
+    if x_type == "date":
+        dates = pd.to_datetime(text.where(text != ""), errors="coerce", format="mixed")
+        valid = dates.notna().to_numpy()
+        keys = [None] * len(dates)
+        positions = np.full(len(dates), np.nan)
+        for row in np.flatnonzero(valid).tolist():
+            keys[row] = dates[row].isoformat()
+            positions[row] = dates[row].timestamp()
+        return keys, valid, positions
+    return text.tolist(), (text != "").to_numpy(), np.arange(len(text), dtype=np.float64)
+
+
+def _points(
+    keys: list[Any],
+    valid: np.ndarray,
+    positions: np.ndarray,
+    y: pd.Series,
+    max_points: int | None,
+    method: str,
+) -> list[dict[str, Any]]:
+    """Get the points of one series of a line chart, downsampled to max_points if given."""
+    values = _numbers(y)
+    rows = np.flatnonzero(valid & ~np.isnan(values))
+    if max_points is not None and len(rows) > max_points:
+        rows = rows[downsample.downsample(method, positions[rows], values[rows], max_points)]
+    return [
+        {"key": keys[row], "data": data, "metadata": {"rowIndex": row}}
+        for row, data in zip(rows.tolist(), values[rows].tolist(), strict=True)
+    ]
+
+
+def line(
+    x: pd.Series,
+    ys: list[pd.Series],
+    x_type: str = "numeric",
+    max_points: int | None = None,
+    method: str = "lttb",
+) -> list[dict[str, Any]]:
+    """Get the points of one or more numeric series against x, as a shallow series for one
+    y column or a nested series per y column for several. If max_points is given, each
+    series is downsampled to at most that many points with the given method."""
+    keys, valid, positions = _keys(x, x_type)
+    if len(ys) == 1:
+        return _points(keys, valid, positions, ys[0], max_points, method)
+    return [
+        {"key": y.name, "data": _points(keys, valid, positions, y, max_points, method)} for y in ys
+    ]
+
+
+def scatter(x: pd.Series, y: pd.Series) -> list[dict[str, Any]]:
+    """Get the points of a scatter plot of two numeric columns."""
+    return line(x, [y], "numeric")
+
+
+_AGGREGATIONS: dict[str, Callable[..., list[dict[str, Any]]]] = {
+    "histogram": lambda columns, bins, x_type, max_points, method: histogram(columns[0], bins),
+    "heatmap": lambda columns, bins, x_type, max_points, method: heatmap(*columns),
+    "bar": lambda columns, bins, x_type, max_points, method: bar(*columns),
+    "line": lambda columns, bins, x_type, max_points, method: line(
+        columns[0], columns[1:], x_type, max_points, method
+    ),
+    "scatter": lambda columns, bins, x_type, max_points, method: scatter(*columns),
+    "area": lambda columns, bins, x_type, max_points, method: line(
+        columns[0], columns[1:], x_type, max_points, method
+    ),
+}
+
+# The number of columns each chart type takes, as (fewest, most).
+COLUMN_COUNTS = {
+    "histogram": (1, 1),
+    "heatmap": (3, 3),
+    "bar": (2, 2),
+    "line": (2, None),
+    "scatter": (2, 2),
+    "area": (2, None),
+}
+
+
+def aggregate(
+    chart_type: str,
+    columns: list[pd.Series],
+    bins: int = DEFAULT_BINS,
+    x_type: str = "numeric",
+    max_points: int | None = None,
+    method: str = "lttb",
+) -> list[dict[str, Any]]:
+    """Compute the series of a chart from its columns, in the order the frontend passes them:
+    histogram (value), heatmap (x, y, value), bar (x, y), scatter (x, y) and line or area
+    (x, y, ...). Only line and area series are downsampled."""
+    return _AGGREGATIONS[chart_type](columns, bins, x_type, max_points, method)
@@ -0,0 +1,233 @@
+"""Module columnar_cache builds and reads typed, compressed columnar copies of csv data files.
+
+The cache is a Parquet sidecar next to its data file. A column is stored as integers or
+floats only if every value in it is the canonical text of its number, and as strings
+otherwise, so the exact text of every cell can be read back from the cache. Empty cells
+of numeric columns are stored as nulls. The size of the data file is kept in the file
+metadata so a cache that no longer matches its data file is never used.
+"""
+
+import os
+import tempfile
+from collections.abc import Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+COLUMNAR_CACHE_SUFFIX = ".parquet"
+# Bytes of csv text parsed at once, which is also about the size of a row group.
+READ_BLOCK_SIZE = 4 * 1024 * 1024
+
+_FORMAT_VERSION = b"1"
+_VERSION_KEY = b"data-visualizer.columnar-cache"
+_SIZE_KEY = b"data-visualizer.data-file-size"
+
+
+def columnar_cache_path(data_file_full_path: str) -> str:
+    """Get the path of the columnar cache for a data file."""
+    return data_file_full_path + COLUMNAR_CACHE_SUFFIX
+
+
+def _open_csv(data_file_full_path: str, column_types: dict[str, pa.DataType] | None = None):
+    """Open a streaming reader of a csv file, parsed the way the csv module splits it."""
+    return pa_csv.open_csv(
+        data_file_full_path,
+        read_options=pa_csv.ReadOptions(block_size=READ_BLOCK_SIZE),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True, ignore_empty_lines=False),
+        convert_options=pa_csv.ConvertOptions(column_types=column_types),
+    )
+
+
+def _float_text(values: pa.Array) -> pa.Array:
+    """Format floats the way Python does, which is how pandas writes them."""
+    return pa.array(
+        [None if value is None else repr(value) for value in values.to_pylist()], pa.string()
+    )
+
+
+def _is_canonical_float_text(values: pa.Array) -> bool:
+    """Tell whether every value is the text Python formats its float as.
+    Arrow formats the same shortest digits as Python, so values Arrow formats the same way
+    that Python writes with a decimal point are checked without leaving Arrow, and only the
+    rest are formatted in Python."""
+    try:
+        numbers = pc.cast(values, pa.float64())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return False
+    magnitudes = pc.abs(numbers)
+    positional = pc.and_(
+        pc.and_(pc.greater_equal(magnitudes, 1e-4), pc.less(magnitudes, 1e16)),
+        pc.and_(pc.match_substring(values, "."), pc.equal(pc.cast(numbers, pa.string()), values)),
+    )
+    rest = pc.invert(positional)
+    return _float_text(numbers.filter(rest)).equals(values.filter(rest))
+
+
+def _numeric_kinds(values: pa.Array, is_int: bool, is_float: bool) -> tuple[bool, bool]:
+    """Tell whether all the non-empty cells of a string column are canonical integers and
+    whether they are all canonical floats, only checking the kinds still possible."""
+    values = values.filter(pc.not_equal(values, ""))
+    if is_int:
+        try:
+            is_int = pc.cast(pc.cast(values, pa.int64()), pa.string()).equals(values)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            is_int = False
+    # Integer columns are stored as integers, so they need no float check.
+    if is_float and not is_int:
+        is_float = _is_canonical_float_text(values)
+    return is_int, is_float
+
+
+def _column_types(data_file_full_path: str) -> dict[str, pa.DataType] | None:
+    """Pick the type each column is stored as by reading the whole file once.
+    Returns None if the file cannot be cached, such as when it has duplicate column names."""
+    with _open_csv(data_file_full_path) as reader:
+        names = reader.schema.names
+        if len(set(names)) != len(names):
+            return None
+        string_types = dict.fromkeys(names, pa.string())
+    kinds = {name: [True, True, False] for name in names}
+    with _open_csv(data_file_full_path, string_types) as reader:
+        for batch in reader:
+            for name, column in zip(names, batch.columns, strict=True):
+                kind = kinds[name]
+                if kind[0] or kind[1]:
+                    kind[0], kind[1] = _numeric_kinds(column, kind[0], kind[1])
+                    kind[2] = kind[2] or bool(pc.any(pc.not_equal(column, "")).as_py())
+    types = {}
+    for name, (is_int, is_float, has_values) in kinds.items():
+        if has_values and is_int:
+            types[name] = pa.int64()
+        elif has_values and is_float:
+            types[name] = pa.float64()
+        else:
+            types[name] = pa.string()
+    return types
+
+
+def build_columnar_cache(data_file_full_path: str, num_rows: int | None = None) -> bool:
+    """Build and write the columnar cache of a csv file, replacing any existing cache.
+    If num_rows is given, the cache is only kept if it has that many rows, which guards
+    against files the csv module splits differently. Returns whether a cache was written."""
+    cache_path = columnar_cache_path(data_file_full_path)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(cache_path), prefix=f"{os.path.basename(cache_path)}.", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        types = _column_types(data_file_full_path)
+        if types is None:
+            return False
+        schema = pa.schema(
+            [pa.field(name, data_type) for name, data_type in types.items()],
+            metadata={
+                _VERSION_KEY: _FORMAT_VERSION,
+                _SIZE_KEY: str(os.path.getsize(data_file_full_path)).encode(),
+            },
+        )
+        string_types = dict.fromkeys(types, pa.string())
+        cached_rows = 0
+        with (
+            _open_csv(data_file_full_path, string_types) as reader,
+            pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer,
+        ):
+            for batch in reader:
+                columns = [
+                    column
+                    if data_type == pa.string()
+                    else pc.cast(pc.if_else(pc.equal(column, ""), None, column), data_type)
+                    for column, data_type in zip(batch.columns, types.values(), strict=True)
+                ]
+                writer.write_batch(pa.record_batch(columns, schema=schema))
+                cached_rows += batch.num_rows
+        if num_rows is not None and cached_rows != num_rows:
+            return False
+        os.replace(tmp_path, cache_path)
+        return True
+    except (pa.ArrowInvalid, OSError):
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def open_columnar_cache(data_file_full_path: str) -> pq.ParquetFile | None:
+    """Open the columnar cache of a data file, memory-mapped.
+    Returns None if there is no cache or it does not match the data file."""
+    path = columnar_cache_path(data_file_full_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        cache = pq.ParquetFile(path, memory_map=True)
+    except (pa.ArrowInvalid, OSError):
+        return None
+    metadata = cache.schema_arrow.metadata or {}
+    if (
+        metadata.get(_VERSION_KEY) != _FORMAT_VERSION
+        or metadata.get(_SIZE_KEY) != str(os.path.getsize(data_file_full_path)).encode()
+    ):
+        cache.close()
+        return None
+    return cache
+
+
+def read_columns(data_file_full_path: str, columns: list[str] | None = None) -> pd.DataFrame | None:
+    """Read typed columns of a csv file from its columnar cache, without parsing the csv.
+    Returns None if the file has no valid cache.
+    Raises KeyError if a column is not in the file."""
+    cache = open_columnar_cache(data_file_full_path)
+    if cache is None:
+        return None
+    with cache:
+        for column in columns or []:
+            if column not in cache.schema_arrow.names:
+                raise KeyError(f"Column {column} not found.")
+        return cache.read(columns=columns).to_pandas()
+
+
+def _text_columns(batch: pa.RecordBatch | pa.Table) -> list[list[str]]:
+    """Get the exact csv text of every cell of a batch, column by column."""
+    columns = []
+    for column in batch.columns:
+        if isinstance(column, pa.ChunkedArray):
+            column = column.combine_chunks()
+        if pa.types.is_floating(column.type):
+            column = _float_text(column)
+        elif not pa.types.is_string(column.type):
+            column = pc.cast(column, pa.string())
+        columns.append(pc.fill_null(column, "").to_pylist())
+    return columns
+
+
+def iter_text_rows(
+    cache: pq.ParquetFile,
+    offset: int = 0,
+    limit: int | None = None,
+    columns: list[str] | None = None,
+) -> Iterator[list[str]]:
+    """Iterate over the (projected) header and a window of data rows of a cached csv file,
+    as the csv module would read them, except that blank lines are rows of empty cells
+    rather than empty rows. Only the row groups overlapping the window are read.
+    Raises KeyError if a column is not in the file."""
+    names = cache.schema_arrow.names
+    for column in columns or []:
+        if column not in names:
+            raise KeyError(f"Column {column} not found.")
+    yield list(columns if columns is not None else names)
+
+    stop = cache.metadata.num_rows if limit is None else offset + limit
+    group_start = 0
+    for i in range(cache.num_row_groups):
+        group_rows = cache.metadata.row_group(i).num_rows
+        group_stop = group_start + group_rows
+        if group_stop > offset and group_start < stop:
+            group = cache.read_row_group(i, columns=columns)
+            start = max(offset - group_start, 0)
+            group = group.slice(start, min(stop, group_stop) - group_start - start)
+            yield from (list(row) for row in zip(*_text_columns(group), strict=True))
+        if group_stop >= stop:
+            break
+        group_start = group_stop
@@ -1,48 +1,569 @@
 """Module csv_analyzer analyzes the stats of a csv file."""
 
+import contextlib
+import math
+import os
+from collections.abc import Callable
+from concurrent.futures import Executor, ThreadPoolExecutor
 from typing import Any
 
+import numpy as np
 import pandas as pd
 
+from data import sketches
 
-def analyze_csv_stats(file_path: str) -> dict[str, Any]:
-    """Analyze a csv file for its stats."""
-    df = pd.read_csv(file_path)
+CHUNKED_ANALYSIS_THRESHOLD = int(
+    os.environ.get("CHUNKED_ANALYSIS_THRESHOLD", str(256 * 1024 * 1024))
+)
+ANALYSIS_MEMORY_LIMIT = int(os.environ.get("ANALYSIS_MEMORY_LIMIT", str(512 * 1024 * 1024)))
+APPROXIMATE_ANALYSIS = os.environ.get("APPROXIMATE_ANALYSIS", "false").lower() == "true"
 
-    column_stats = []
-    for col in df.columns:
-        col_data = df[col]
+# Integers beyond this are not exactly representable as float64, so distinct values of
+# such columns are counted by pandas instead of from the sorted float64 values.
+_MAX_EXACT_FLOAT_INT = 2**53
 
-        data_type = "numeric" if pd.api.types.is_numeric_dtype(col_data) else "string"
+# Blank lines are read as rows of nulls, so the number of rows matches the rows the csv
+# module and the row index see when the file is paged.
+_READ_CSV_OPTIONS = {"skip_blank_lines": False}
 
-        num_rows = len(col_data)
-        num_null = col_data.isnull().sum()
-        num_unique = col_data.nunique()
+_FIRST_CHUNK_ROWS = 1000
+# Bytes of temporaries used while analyzing each byte of a parsed chunk.
+_CHUNK_MEMORY_FACTOR = 4
+# Bytes taken by one distinct value and its count, and the fewest values always counted.
+_VALUE_COUNT_BYTES = 64
+_MIN_EXACT_VALUES = 1024
 
-        stats = {
-            "column_name": col,
-            "data_type": data_type,
-            "num_rows": int(num_rows),
-            "num_unique_values": int(num_unique),
-            "num_null_values": int(num_null),
+
+def _distribution_stats(
+    values: np.ndarray, counts: np.ndarray | None = None, digest: sketches.TDigest | None = None
+) -> dict[str, bytes]:
+    """Get the serialized histogram and quantile sketch of the finite values of a numeric
+    column, from its distinct values and their counts, or estimated from a t-digest of its
+    finite values. Both are built from the same distinct values and counts whether the
+    column was analyzed whole or in chunks, so they come out the same either way.
+    Returns neither if the column has no finite values."""
+    if digest is None:
+        finite = np.isfinite(values)
+        values, counts = values[finite], counts[finite]
+        if not len(values):
+            return {}
+        digest = sketches.TDigest()
+        digest.add(values, counts.astype(np.float64))
+        histogram = sketches.Histogram.from_values(values, counts)
+    elif digest.count:
+        histogram = sketches.Histogram.from_digest(digest)
+    else:
+        return {}
+    return {"histogram": histogram.to_bytes(), "quantile_sketch": digest.to_bytes()}
+
+
+def _sorted_value_counts(values: np.ndarray, changes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Get the distinct values of sorted values and their counts, given where they change."""
+    starts = np.flatnonzero(np.concatenate(([True], changes)))
+    return values[starts], np.diff(np.append(starts, len(values)))
+
+
+def _numeric_stats(df: pd.DataFrame, columns: list[str]) -> dict[str, dict[str, Any]]:
+    """Compute the stats of numeric columns of a dataframe, one column at a time.
+    Each column is copied into a float64 array and reduced on its own, so no copy or
+    temporary spans more than one column. The mean and standard deviation are summed in row
+    order, then the column is sorted in place for the median, min, max and number of
+    distinct values."""
+    stats = {}
+    for col in columns:
+        column = df[col].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+        nulls = np.isnan(column)
+        count = len(column) - int(np.count_nonzero(nulls))
+        # Nulls count as 0 in the sums, which run in row order before the column is sorted.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sums = np.where(nulls, 0.0, column)
+            mean = sums.sum() / count
+            deviations = np.subtract(column, mean, out=sums)
+            deviations[nulls] = 0.0
+            std_dev = np.sqrt(np.square(deviations, out=deviations).sum() / (count - 1))
+        del nulls, sums, deviations
+        # NaNs sort to the end, leaving the first count rows as the sorted values.
+        column.sort()
+        present = column[:count]
+        changes = present[1:] != present[:-1]
+        col_stats = {
+            "num_null_values": len(column) - count,
+            "num_unique_values": int(np.count_nonzero(changes)) + (count > 0),
         }
+        if count > 0:
+            middle = count // 2
+            median = present[middle] if count % 2 else (present[middle - 1] + present[middle]) / 2
+            col_stats.update(
+                {
+                    "num_zeros_values": int(np.count_nonzero(present == 0)),
+                    "std_dev": float(std_dev),
+                    "mean": float(mean),
+                    "median": float(median),
+                    "min_value": float(present[0]),
+                    "max_value": float(present[-1]),
+                    **_distribution_stats(*_sorted_value_counts(present, changes)),
+                }
+            )
+            if (
+                pd.api.types.is_integer_dtype(df[col])
+                and max(abs(col_stats["min_value"]), abs(col_stats["max_value"]))
+                >= _MAX_EXACT_FLOAT_INT
+            ):
+                col_stats["num_unique_values"] = int(df[col].nunique())
+        stats[col] = col_stats
+    return stats
 
-        if data_type == "numeric":
-            numeric_data = col_data.dropna()
-            if len(numeric_data) > 0:
-                stats["num_zeros_values"] = int(numeric_data.eq(0).sum())
-                stats["std_dev"] = float(numeric_data.std())
-                stats["mean"] = float(numeric_data.mean())
-                stats["median"] = float(numeric_data.median())
-                stats["min_value"] = float(numeric_data.min())
-                stats["max_value"] = float(numeric_data.max())
-        else:
-            string_data = col_data.dropna().astype(str)
-            stats["num_empty_values"] = int((string_data == "").sum())
 
-        column_stats.append(stats)
+def _top_values_stats(counts: pd.Series, error: int = 0) -> dict[str, bytes]:
+    """Get the serialized most frequent values of a string column from value counts."""
+    top_values = sketches.TopValues()
+    top_values.counts, top_values.error = counts, error
+    return {"top_values": top_values.to_bytes()}
+
+
+def _string_stats(df: pd.DataFrame, columns: list[str]) -> dict[str, dict[str, Any]]:
+    """Compute the stats of non-numeric columns of a dataframe, one column at a time.
+    The value counts of each column give its number of distinct and empty values and its
+    most frequent values."""
+    stats = {}
+    for col in columns:
+        col_data = df[col]
+        counts = col_data.value_counts(sort=False)
+        stats[col] = {
+            "num_null_values": len(col_data) - int(counts.sum()),
+            "num_unique_values": len(counts),
+            "num_empty_values": int(counts.get("", 0)),
+            **_top_values_stats(counts.astype(np.int64)),
+        }
+    return stats
+
+
+def _column_groups(columns: list[str], workers: int) -> list[list[str]]:
+    """Split columns into at most workers contiguous groups of about the same size."""
+    if not columns:
+        return []
+    size = math.ceil(len(columns) / max(1, min(workers, len(columns))))
+    return [columns[i : i + size] for i in range(0, len(columns), size)]
+
+
+def _executor(workers: int) -> contextlib.AbstractContextManager[Executor | None]:
+    """Make a thread pool for analyzing column groups, or None to analyze them serially.
+    Threads are enough because the numpy kernels doing the work release the GIL."""
+    if workers > 1:
+        return ThreadPoolExecutor(workers, thread_name_prefix="csv-analyzer")
+    return contextlib.nullcontext()
+
+
+def _run_tasks(executor: Executor | None, tasks: list[Callable[[], Any]]) -> list[Any]:
+    """Run tasks on the executor, or serially without one, returning results in task order."""
+    if executor is None:
+        return [task() for task in tasks]
+    return list(executor.map(lambda task: task(), tasks))
+
+
+def analyze_dataframe(df: pd.DataFrame, workers: int = 1) -> dict[str, Any]:
+    """Analyze a dataframe for its stats.
+    Columns are analyzed one at a time, so at most one column is copied at once per worker.
+    With more than one worker, the columns are split into groups analyzed in parallel;
+    every column's stats are computed the same way in either case, so the results match
+    the serial ones exactly."""
+    is_numeric = [pd.api.types.is_numeric_dtype(df[col]) for col in df.columns]
+    numeric_columns = [col for col, numeric in zip(df.columns, is_numeric, strict=True) if numeric]
+    string_columns = [
+        col for col, numeric in zip(df.columns, is_numeric, strict=True) if not numeric
+    ]
+    tasks = [
+        lambda group=group, analyze=analyze: analyze(df, group)
+        for analyze, columns in ((_numeric_stats, numeric_columns), (_string_stats, string_columns))
+        for group in _column_groups(columns, workers)
+    ]
+    stats = {}
+    with _executor(workers) as executor:
+        for group_stats in _run_tasks(executor, tasks):
+            stats.update(group_stats)
+
+    column_stats = []
+    for col, numeric in zip(df.columns, is_numeric, strict=True):
+        col_stats = stats[col]
+        column_stats.append(
+            {
+                "column_name": col,
+                "data_type": "numeric" if numeric else "string",
+                "num_rows": len(df),
+                "num_unique_values": col_stats.pop("num_unique_values"),
+                "num_null_values": col_stats.pop("num_null_values"),
+                **col_stats,
+            }
+        )
     return {
         "num_columns": len(df.columns),
         "num_rows": len(df),
         "column_stats": column_stats,
     }
+
+
+class ColumnKindChanged(Exception):
+    """Raised when a column parses as numbers in one chunk and as strings in another."""
+
+    def __init__(self, column: str):
+        super().__init__(column)
+        self.column = column
+
+
+def _column_kind(col_data: pd.Series) -> str | None:
+    """Get how a chunk of a column parsed, or None if it has no values to tell from."""
+    if not col_data.notna().any():
+        return None
+    if pd.api.types.is_bool_dtype(col_data):
+        return "bool"
+    return "numeric" if pd.api.types.is_numeric_dtype(col_data) else "string"
+
+
+class _ColumnAccumulator:
+    """Partial stats of one column, merged chunk by chunk.
+    In approximate mode distinct values and quantiles only go into fixed-size sketches.
+    Otherwise the histogram, quantile sketch and most frequent values come from the exact
+    value counts, and once a column has too many distinct values to count, from a t-digest
+    or Misra-Gries summary seeded with the last counts."""
+
+    def __init__(self, values_limit: int, approximate: bool = False):
+        self.approximate = approximate
+        self.kind: str | None = None
+        self.num_nulls = 0
+        self.count = 0
+        self.num_zeros = 0
+        self.total = 0.0
+        self.m2 = 0.0
+        self.min_value = math.inf
+        self.max_value = -math.inf
+        self.num_empty = 0
+        self.digest = sketches.TDigest()
+        self.top_values = sketches.TopValues()
+        if approximate:
+            self.hll = sketches.HyperLogLog()
+        else:
+            self.distinct = sketches.DistinctCounter()
+            self.value_counts = sketches.ValueCounts(values_limit)
+            self.sample = sketches.ValueSample()
+
+    def add_moments(self, count: int, total: float, m2: float):
+        """Merge in the count, sum and sum of squared deviations of a chunk (Chan et al.)."""
+        if count == 0:
+            return
+        if self.count:
+            delta = total / count - self.total / self.count
+            self.m2 += m2 + delta * delta * self.count * count / (self.count + count)
+        else:
+            self.m2 = m2
+        self.count += count
+        self.total += total
+
+    def add_values(self, values: np.ndarray):
+        """Merge in the distinct values of a chunk."""
+        if self.approximate:
+            self.hll.add(values)
+            self._add_distribution(values)
+            return
+        self.distinct.add(values)
+        counts = self.value_counts.counts
+        self.value_counts.add(values)
+        if self.kind != "string":
+            self.sample.add(values)
+        if self.value_counts.overflowed:
+            if counts is not None:
+                self._add_distribution(counts.index.to_numpy(), counts.to_numpy())
+            self._add_distribution(values)
+
+    def _add_distribution(self, values: np.ndarray, counts: np.ndarray | None = None):
+        """Merge values, each repeated by its count if counts are given, into the t-digest
+        of a numeric column, leaving out infinities, or the most frequent values of a
+        string column."""
+        if self.kind == "string":
+            if counts is None:
+                self.top_values.add(values)
+            else:
+                self.top_values.merge_counts(pd.Series(counts, index=values))
+        else:
+            values = values.astype(np.float64)
+            finite = np.isfinite(values)
+            weights = None if counts is None else counts[finite].astype(np.float64)
+            self.digest.add(values[finite], weights)
+
+    def num_unique(self) -> int:
+        """Get the (estimated) number of distinct values."""
+        if self.approximate:
+            return self.hll.count()
+        if self.value_counts.overflowed:
+            return self.distinct.count()
+        return len(self.value_counts.counts)
+
+    def median(self) -> float:
+        """Get the (estimated) median."""
+        if self.approximate:
+            return self.digest.quantile(0.5)
+        if self.value_counts.overflowed:
+            return self.sample.median()
+        return self.value_counts.median()
+
+    def stats(self, col: str, num_rows: int) -> dict[str, Any]:
+        """Get the final stats of the column."""
+        data_type = "string" if self.kind == "string" else "numeric"
+        stats = {
+            "column_name": col,
+            "data_type": data_type,
+            "num_rows": num_rows,
+            "num_unique_values": self.num_unique(),
+            "num_null_values": self.num_nulls,
+        }
+        exact_counts = not self.approximate and not self.value_counts.overflowed
+        if data_type == "string":
+            stats["num_empty_values"] = self.num_empty
+            if exact_counts:
+                stats.update(_top_values_stats(self.value_counts.counts))
+            else:
+                stats["top_values"] = self.top_values.to_bytes()
+        elif self.count > 0:
+            stats["num_zeros_values"] = self.num_zeros
+            stats["std_dev"] = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+            stats["mean"] = self.total / self.count
+            stats["median"] = self.median()
+            stats["min_value"] = self.min_value
+            stats["max_value"] = self.max_value
+            if exact_counts:
+                counts = self.value_counts.counts
+                stats.update(
+                    _distribution_stats(counts.index.to_numpy(np.float64), counts.to_numpy())
+                )
+            else:
+                stats.update(_distribution_stats(None, digest=self.digest))
+        if self.approximate:
+            stats["distinct_sketch"] = self.hll.to_bytes()
+            if data_type == "numeric":
+                stats["quantile_sketch"] = self.digest.to_bytes()
+        return stats
+
+
+def _add_numeric_chunk(df: pd.DataFrame, accumulators: list[_ColumnAccumulator]):
+    """Merge the numeric columns of a chunk into their accumulators.
+    The partial aggregates are computed for all the columns at once."""
+    values = np.asfortranarray(df.to_numpy(dtype=np.float64, na_value=np.nan, copy=True))
+    nulls = np.isnan(values)
+    counts = values.shape[0] - nulls.sum(axis=0)
+    filled = np.where(nulls, 0.0, values)
+    totals = filled.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = totals / counts
+    deviations = np.where(nulls, 0.0, values - means)
+    m2s = (deviations * deviations).sum(axis=0)
+    del filled, deviations
+    zeros = (values == 0).sum(axis=0)
+    mins = np.where(nulls, np.inf, values).min(axis=0, initial=np.inf)
+    maxs = np.where(nulls, -np.inf, values).max(axis=0, initial=-np.inf)
+
+    for i, accumulator in enumerate(accumulators):
+        accumulator.num_nulls += int(nulls[:, i].sum())
+        accumulator.add_moments(int(counts[i]), float(totals[i]), float(m2s[i]))
+        accumulator.num_zeros += int(zeros[i])
+        accumulator.min_value = min(accumulator.min_value, float(mins[i]))
+        accumulator.max_value = max(accumulator.max_value, float(maxs[i]))
+        accumulator.add_values(values[~nulls[:, i], i])
+
+
+def _add_string_chunk(df: pd.DataFrame, accumulators: list[_ColumnAccumulator]):
+    """Merge the string columns of a chunk into their accumulators."""
+    num_nulls = df.isna().sum()
+    num_empty = df.eq("").sum()
+    for col, accumulator in zip(df.columns, accumulators, strict=True):
+        accumulator.num_nulls += int(num_nulls[col])
+        accumulator.num_empty += int(num_empty[col])
+        col_data = df[col]
+        accumulator.add_values(col_data[col_data.notna()].to_numpy(dtype=object))
+
+
+class ChunkAnalysis:
+    """Stats of a table merged chunk by chunk, for use as a context manager.
+    Columns may first appear in a later chunk, in which case they count as null in all the
+    earlier rows. Half of the memory limit is left for the chunks being analyzed and half
+    goes to the per-column state, of which the exact value counts are the only unbounded
+    part, so they are capped by the number of columns in the first chunk."""
+
+    def __init__(self, memory_limit: int, approximate: bool = False, workers: int = 1):
+        self.memory_limit = memory_limit
+        self.approximate = approximate
+        self.workers = workers
+        self.num_rows = 0
+        self.accumulators: dict[str, _ColumnAccumulator] = {}
+        self._values_limit: int | None = None
+        self._executor_context = _executor(workers)
+        self._executor: Executor | None = None
+
+    def __enter__(self) -> "ChunkAnalysis":
+        self._executor = self._executor_context.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self._executor = None
+        return self._executor_context.__exit__(*args)
+
+    def add(self, df: pd.DataFrame):
+        """Merge a chunk into the column accumulators, splitting the columns into groups
+        for the executor. Each accumulator is only updated by the task of its group.
+        Raises ColumnKindChanged if a column parsed differently than in earlier chunks."""
+        if self._values_limit is None:
+            self._values_limit = max(
+                _MIN_EXACT_VALUES,
+                self.memory_limit // 2 // max(len(df.columns), 1) // _VALUE_COUNT_BYTES,
+            )
+        numeric_columns, string_columns = [], []
+        for col in df.columns:
+            accumulator = self.accumulators.get(col)
+            if accumulator is None:
+                accumulator = _ColumnAccumulator(self._values_limit, self.approximate)
+                accumulator.num_nulls = self.num_rows
+                self.accumulators[col] = accumulator
+            kind = _column_kind(df[col])
+            if kind is None:
+                accumulator.num_nulls += len(df)
+                continue
+            if accumulator.kind not in (None, kind):
+                raise ColumnKindChanged(col)
+            accumulator.kind = kind
+            (string_columns if kind == "string" else numeric_columns).append(col)
+        for col, accumulator in self.accumulators.items():
+            if col not in df.columns:
+                accumulator.num_nulls += len(df)
+        tasks = [
+            lambda group=group, add=add: add(df[group], [self.accumulators[col] for col in group])
+            for add, columns in (
+                (_add_numeric_chunk, numeric_columns),
+                (_add_string_chunk, string_columns),
+            )
+            for group in _column_groups(columns, self.workers)
+        ]
+        _run_tasks(self._executor, tasks)
+        self.num_rows += len(df)
+
+    def stats(self) -> dict[str, Any]:
+        """Get the stats of the whole table."""
+        return {
+            "num_columns": len(self.accumulators),
+            "num_rows": self.num_rows,
+            "column_stats": [
+                accumulator.stats(col, self.num_rows)
+                for col, accumulator in self.accumulators.items()
+            ],
+        }
+
+
+def _analyze_chunks(
+    file_path: str,
+    memory_limit: int,
+    approximate: bool,
+    workers: int,
+    string_columns: set[str],
+) -> dict[str, Any]:
+    """Analyze a csv file chunk by chunk, reading the given columns as strings."""
+    reader = pd.read_csv(
+        file_path, iterator=True, dtype=dict.fromkeys(string_columns, str), **_READ_CSV_OPTIONS
+    )
+    with reader, ChunkAnalysis(memory_limit, approximate, workers) as analysis:
+        chunk = reader.get_chunk(_FIRST_CHUNK_ROWS)
+        row_bytes = max(int(chunk.memory_usage(deep=True).sum()) // max(len(chunk), 1), 1)
+        chunk_rows = max(_FIRST_CHUNK_ROWS, memory_limit // 2 // (row_bytes * _CHUNK_MEMORY_FACTOR))
+        while True:
+            analysis.add(chunk)
+            try:
+                chunk = reader.get_chunk(chunk_rows)
+            except StopIteration:
+                break
+    return analysis.stats()
+
+
+def analyze_csv_stats_chunked(
+    file_path: str,
+    memory_limit: int = ANALYSIS_MEMORY_LIMIT,
+    approximate: bool = False,
+    workers: int = 1,
+) -> dict[str, Any]:
+    """Analyze a csv file for its stats without reading it into memory at once.
+    The file is read in chunks sized to fit memory_limit bytes, and the count, nulls, zeros,
+    sum, sum of squared deviations, min and max of each chunk are merged into the stats of
+    the whole file. Distinct values are counted exactly while they fit in the memory limit;
+    past that, the number of unique values comes from a sketch with about 1.6% error and
+    the median from a uniform sample of the column.
+    In approximate mode the number of unique values always comes from a HyperLogLog sketch
+    (1.6% standard error) and the median from a t-digest (typically within 1% in rank), and
+    the serialized sketches are returned with the stats of each column so that they can be
+    combined with combine_column_stats later."""
+    string_columns = set()
+    while True:
+        try:
+            return _analyze_chunks(file_path, memory_limit, approximate, workers, string_columns)
+        except ColumnKindChanged as e:
+            # The whole column would have parsed as strings, so read it as strings throughout.
+            string_columns.add(e.column)
+
+
+def analyze_csv_stats(
+    file_path: str,
+    chunked: bool | None = None,
+    approximate: bool | None = None,
+    workers: int = 1,
+) -> dict[str, Any]:
+    """Analyze a csv file for its stats, splitting the columns across workers threads.
+    Files larger than CHUNKED_ANALYSIS_THRESHOLD bytes are analyzed in chunks unless chunked
+    is given. Approximate analysis, which is always chunked, is used if approximate is set
+    or, when it is not given, if APPROXIMATE_ANALYSIS is set."""
+    if approximate is None:
+        approximate = APPROXIMATE_ANALYSIS
+    if approximate:
+        return analyze_csv_stats_chunked(file_path, approximate=True, workers=workers)
+    if chunked is None:
+        chunked = os.path.getsize(file_path) > CHUNKED_ANALYSIS_THRESHOLD
+    if chunked:
+        return analyze_csv_stats_chunked(file_path, workers=workers)
+    return analyze_dataframe(pd.read_csv(file_path, **_READ_CSV_OPTIONS), workers)
+
+
+def combine_column_stats(column_stats: list[dict[str, Any]]) -> dict[str, Any]:
+    """Combine the approximate stats of the same column from several files or chunks into
+    the stats of all of them, without reading the data again.
+    Raises ValueError if the stats have no sketches or the columns have different types."""
+    if not column_stats:
+        raise ValueError("No column stats to combine.")
+    data_types = {stats["data_type"] for stats in column_stats}
+    if len(data_types) != 1:
+        raise ValueError("Cannot combine the stats of columns with different data types.")
+    if not all(stats.get("distinct_sketch") for stats in column_stats):
+        raise ValueError("Only stats from approximate analysis can be combined.")
+
+    accumulator = _ColumnAccumulator(0, approximate=True)
+    accumulator.kind = "string" if "string" in data_types else "numeric"
+    num_rows = 0
+    for stats in column_stats:
+        num_rows += stats["num_rows"]
+        accumulator.num_nulls += stats["num_null_values"]
+        accumulator.hll.merge(sketches.HyperLogLog.from_bytes(stats["distinct_sketch"]))
+        accumulator.num_empty += stats.get("num_empty_values", 0)
+        if accumulator.kind == "string":
+            if stats.get("top_values"):
+                accumulator.top_values.merge(sketches.TopValues.from_bytes(stats["top_values"]))
+            continue
+        count = stats["num_rows"] - stats["num_null_values"]
+        if count == 0:
+            continue
+        std_dev = stats["std_dev"] if count > 1 else 0.0
+        accumulator.add_moments(count, stats["mean"] * count, std_dev * std_dev * (count - 1))
+        accumulator.num_zeros += stats["num_zeros_values"]
+        accumulator.min_value = min(accumulator.min_value, stats["min_value"])
+        accumulator.max_value = max(accumulator.max_value, stats["max_value"])
+        accumulator.digest.merge(sketches.TDigest.from_bytes(stats["quantile_sketch"]))
+    return accumulator.stats(column_stats[0]["column_name"], num_rows)
+
+
+def column_quantiles(column_stats: dict[str, Any], quantiles: list[float]) -> list[float]:
+    """Estimate quantiles of a numeric column from the quantile sketch of its stats.
+    Raises ValueError if the stats have no quantile sketch."""
+    if not column_stats.get("quantile_sketch"):
+        raise ValueError("Only the stats of numeric columns with values have quantiles.")
+    return sketches.TDigest.from_bytes(column_stats["quantile_sketch"]).quantiles(quantiles)
@@ -0,0 +1,77 @@
+"""Module downsample picks the points of a series to draw when it has more than fit a chart.
+
+Both methods keep the first and last points and return the positions of the kept points
+in their original order, so each kept point can still be traced back to its data row:
+    lttb:   largest-triangle-three-buckets, which keeps the shape of the line.
+    minmax: the min and max of each bucket, which keeps the envelope of the line,
+            including every spike.
+"""
+
+import numpy as np
+
+METHODS = ["lttb", "minmax"]
+
+
+def _bucket_starts(num_values: int, num_buckets: int) -> np.ndarray:
+    """Get the start of each of num_buckets buckets of about equal size over the values
+    between the first and the last, followed by the end of the last bucket."""
+    return 1 + (np.arange(num_buckets + 1) * (num_values - 2)) // num_buckets
+
+
+def lttb(x: np.ndarray, y: np.ndarray, num_points: int) -> np.ndarray:
+    """Get the positions of num_points points picked by largest-triangle-three-buckets.
+    The values between the first and last are split into num_points - 2 buckets, and from
+    each bucket the point forming the largest triangle with the point kept from the bucket
+    before and the average of the bucket after is kept. All points are kept if there are
+    no more than num_points of them, or if num_points is less than 3."""
+    num_values = len(x)
+    if num_points >= num_values or num_points < 3:
+        return np.arange(num_values)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    starts = _bucket_starts(num_values, num_points - 2)
+    sizes = np.diff(starts)
+    # The average of each bucket, then of the last point, which is the bucket after the last.
+    next_x = np.append(np.add.reduceat(x[:-1], starts[:-1]) / sizes, x[-1])
+    next_y = np.append(np.add.reduceat(y[:-1], starts[:-1]) / sizes, y[-1])
+
+    kept = np.empty(num_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, num_values - 1
+    a = 0
+    for i in range(num_points - 2):
+        start, stop = starts[i], starts[i + 1]
+        ax, ay, cx, cy = x[a], y[a], next_x[i + 1], next_y[i + 1]
+        # Twice the area of each triangle (a, b, c) for the points b of the bucket.
+        areas = np.abs((x[start:stop] - ax) * (cy - ay) - (cx - ax) * (y[start:stop] - ay))
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+    return kept
+
+
+def min_max(x: np.ndarray, y: np.ndarray, num_points: int) -> np.ndarray:
+    """Get the positions of at most num_points points keeping the min and max y value of
+    each bucket. The values between the first and last are split into (num_points - 2) // 2
+    buckets. All points are kept if there are no more than num_points of them."""
+    num_values = len(y)
+    if num_points >= num_values:
+        return np.arange(num_values)
+    num_buckets = (num_points - 2) // 2
+    if num_buckets < 1:
+        return np.array([0, num_values - 1][:num_points], dtype=np.int64)
+    inner = np.asarray(y, dtype=np.float64)[1:-1]
+    starts = _bucket_starts(num_values, num_buckets) - 1
+    buckets = np.repeat(np.arange(num_buckets), np.diff(starts))
+    kept = [np.array([0, num_values - 1])]
+    for extreme in [np.minimum, np.maximum]:
+        # The first value of each bucket equal to its extreme.
+        hits = np.flatnonzero(inner == extreme.reduceat(inner, starts[:-1])[buckets])
+        kept.append(1 + hits[np.searchsorted(hits, starts[:-1])])
+    return np.unique(np.concatenate(kept))
+
+
+_METHODS = {"lttb": lttb, "minmax": min_max}
+
+
+def downsample(method: str, x: np.ndarray, y: np.ndarray, num_points: int) -> np.ndarray:
+    """Get the positions of the points of a series kept by a downsampling method."""
+    return _METHODS[method](x, y, num_points)
@@ -0,0 +1,205 @@
+"""Module json_analyzer analyzes the stats of a json result file.
+
+Result files (see docs/data-formats.md) are parsed one result at a time, so memory grows
+with the number of distinct keys rather than the number of results. Every key of the
+metadata and of each section becomes a column named "<section>.<key>", with the metadata
+as the section "metadata", and the stats of each column are computed like those of a
+csv column.
+"""
+
+import json
+import re
+from collections.abc import Iterator
+from typing import Any, TextIO
+
+import pandas as pd
+
+from data import csv_analyzer
+
+READ_CHUNK_SIZE = 1024 * 1024
+JSON_BATCH_RESULTS = 1000
+
+_NOT_RESULT_FILE = "Only json result files can be analyzed."
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _JsonStream:
+    """Reads the values in a json text one at a time, holding only a chunk of it at once."""
+
+    def __init__(self, f: TextIO, chunk_size: int = READ_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """Drop the consumed text and read more. Returns False at the end of the file.
+        A value that did not fit in the buffer at least doubles it, so reading a value
+        larger than a chunk stays linear in its size."""
+        if self.eof:
+            return False
+        chunk = self.f.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return not self.eof
+
+    def peek(self) -> str:
+        """Skip whitespace and get the next character, or "" at the end of the file."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        """Consume the next character, which must be one of chars.
+        Raises ValueError if it is not."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(_NOT_RESULT_FILE)
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Parse the next value.
+        Raises ValueError if it is not valid json."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may continue in the next chunk.
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_results(f: TextIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[dict[str, Any]]:
+    """Iterate over the results in "data" of a json result file, parsing one at a time.
+    Raises ValueError if the file is not a json result file."""
+    stream = _JsonStream(f, chunk_size)
+    stream.expect("{")
+    found_data = False
+    if stream.peek() == "}":
+        stream.pos += 1
+    else:
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == "data":
+                found_data = True
+                stream.expect("[")
+                if stream.peek() == "]":
+                    stream.pos += 1
+                else:
+                    while True:
+                        result = stream.value()
+                        if not isinstance(result, dict):
+                            raise ValueError(_NOT_RESULT_FILE)
+                        yield result
+                        if stream.expect(",]") == "]":
+                            break
+            elif key == "type":
+                file_type = stream.value()
+                if file_type != "result":
+                    raise ValueError(f"Unsupported json file type: {file_type}.")
+            else:
+                stream.value()
+            if stream.expect(",}") == "}":
+                break
+    if stream.peek() or not found_data:
+        raise ValueError(_NOT_RESULT_FILE)
+
+
+def _flatten_result(result: dict[str, Any]) -> dict[str, Any]:
+    """Flatten a result into one row of "<section>.<key>" columns.
+    Lists and objects are kept as their json text."""
+    row = {}
+    sections = result.get("sections") or {}
+    if not isinstance(sections, dict):
+        raise ValueError("The sections of a result must be an object.")
+    for section, values in [("metadata", result.get("metadata") or {}), *sections.items()]:
+        if not isinstance(values, dict):
+            raise ValueError(f"Section {section} of a result must be an object.")
+        for key, value in values.items():
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, sort_keys=True)
+            row[f"{section}.{key}"] = value
+    return row
+
+
+def _to_string(value: Any) -> Any:
+    """Convert a non-null value to the string it is analyzed as."""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _make_frame(rows: list[dict[str, Any]], string_columns: set[str]) -> pd.DataFrame:
+    """Make a frame of a batch of rows, converting the given columns to strings.
+    Raises ColumnKindChanged for a column mixing strings with other values, which must be
+    analyzed as strings throughout."""
+    df = pd.DataFrame.from_records(rows)
+    for col in df.columns:
+        if col in string_columns:
+            df[col] = pd.Series([_to_string(row.get(col)) for row in rows], dtype=object)
+        elif df[col].dtype == object:
+            values = df[col].dropna()
+            if values.map(lambda value: isinstance(value, bool)).all():
+                df[col] = df[col].astype("boolean")
+            elif not values.map(lambda value: isinstance(value, str)).all():
+                raise csv_analyzer.ColumnKindChanged(col)
+    return df
+
+
+def _analyze_results(
+    file_path: str,
+    memory_limit: int,
+    approximate: bool,
+    workers: int,
+    string_columns: set[str],
+) -> dict[str, Any]:
+    """Analyze a json result file in batches of results, with the given columns as strings."""
+    with (
+        open(file_path, encoding="utf-8") as f,
+        csv_analyzer.ChunkAnalysis(memory_limit, approximate, workers) as analysis,
+    ):
+        rows = []
+        for result in iter_results(f):
+            rows.append(_flatten_result(result))
+            if len(rows) == JSON_BATCH_RESULTS:
+                analysis.add(_make_frame(rows, string_columns))
+                rows = []
+        if rows:
+            analysis.add(_make_frame(rows, string_columns))
+    return analysis.stats()
+
+
+def analyze_json_stats(
+    file_path: str,
+    memory_limit: int = csv_analyzer.ANALYSIS_MEMORY_LIMIT,
+    approximate: bool | None = None,
+    workers: int = 1,
+) -> dict[str, Any]:
+    """Analyze a json result file for its stats, one batch of results at a time.
+    Each result is a row, and each key of its metadata and sections a column, so the
+    number of rows is the number of results and a key missing from a result counts as
+    null. Columns with only numbers or booleans are numeric, and others are strings.
+    Distinct values and medians are exact until the memory limit is reached, as in
+    csv_analyzer.analyze_csv_stats_chunked, and approximate mode works the same way.
+    Raises ValueError if the file is not a json result file."""
+    if approximate is None:
+        approximate = csv_analyzer.APPROXIMATE_ANALYSIS
+    string_columns = set()
+    while True:
+        try:
+            return _analyze_results(file_path, memory_limit, approximate, workers, string_columns)
+        except csv_analyzer.ColumnKindChanged as e:
+            string_columns.add(e.column)
@@ -0,0 +1,181 @@
+"""Module row_index builds and reads byte-offset indexes of the rows of csv data files.
+
+A row index is a sidecar file next to its data file. It holds a fixed header followed by
+the byte offset of every Nth data row as little-endian unsigned 64-bit integers, so it
+can be memory-mapped and read without parsing. A file whose rows cannot be indexed gets
+an index with a stride of 0 and no offsets, so it is not scanned again to find that out.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+import numpy as np
+
+ROW_INDEX_SUFFIX = ".rowidx"
+ROW_INDEX_STRIDE = int(os.environ.get("ROW_INDEX_STRIDE", "1024"))
+READ_CHUNK_SIZE = 1024 * 1024
+
+_MAGIC = b"DVROWIDX"
+_FORMAT_VERSION = 1
+# magic, format version, stride, number of data rows, size of the data file.
+_HEADER = struct.Struct("<8sIIQQ")
+
+_NEWLINE = ord("\n")
+_QUOTE = ord('"')
+
+
+def row_index_path(data_file_full_path: str) -> str:
+    """Get the path of the row index for a data file."""
+    return data_file_full_path + ROW_INDEX_SUFFIX
+
+
+class RowIndexBuilder:
+    """Builds a row index from the bytes of a csv file, fed in order in chunks of any size.
+    Rows end at newlines outside of quoted fields, which matches how the csv module splits
+    files whose quotes only appear around fields."""
+
+    def __init__(self, stride: int = ROW_INDEX_STRIDE):
+        self.stride = stride
+        self.offsets = array("Q")
+        self.num_rows = 0
+        self.size = 0
+        self._row_start = 0
+        self._in_quotes = False
+        self._header_done = False
+
+    @property
+    def valid(self) -> bool:
+        """Whether every quoted field was closed, so the row boundaries can be trusted."""
+        return not self._in_quotes
+
+    def feed(self, chunk: bytes):
+        """Feed the next chunk of the file."""
+        if not chunk:
+            return
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        newlines = np.flatnonzero(data == _NEWLINE)
+        quotes = data == _QUOTE
+        if self._in_quotes or quotes.any():
+            # Quote parity after each byte tells which newlines are inside quoted fields.
+            parity = np.bitwise_xor.accumulate(quotes.view(np.uint8)) ^ np.uint8(self._in_quotes)
+            newlines = newlines[parity[newlines] == 0]
+            self._in_quotes = bool(parity[-1])
+
+        row_ends = newlines.astype(np.uint64) + np.uint64(self.size + 1)
+        self.size += len(chunk)
+        if not len(row_ends):
+            return
+        row_starts = np.concatenate(([self._row_start], row_ends[:-1])).astype(np.uint64)
+        self._row_start = int(row_ends[-1])
+        if not self._header_done:
+            self._header_done = True
+            row_starts = row_starts[1:]
+        self._add_rows(row_starts)
+
+    def finish(self):
+        """Finish the index after the last chunk, counting a final row with no newline."""
+        if self.size > self._row_start:
+            row_starts = np.array([self._row_start], dtype=np.uint64)
+            self._row_start = self.size
+            if not self._header_done:
+                self._header_done = True
+                return
+            self._add_rows(row_starts)
+
+    def _add_rows(self, row_starts: np.ndarray):
+        """Count completed data rows, keeping the offsets of every stride-th one."""
+        row_numbers = np.arange(self.num_rows, self.num_rows + len(row_starts))
+        self.offsets.extend(row_starts[row_numbers % self.stride == 0].tolist())
+        self.num_rows += len(row_starts)
+
+    def write(self, path: str):
+        """Write the index to path, replacing any existing index atomically. An invalid
+        index is written with a stride of 0 and no offsets, marking the file as unindexable."""
+        offsets = array("Q", self.offsets if self.valid else [])
+        if sys.byteorder != "little":
+            offsets.byteswap()  # pragma: no cover
+        stride = self.stride if self.valid else 0
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.", suffix=".tmp"
+        )
+        try:
+            with open(fd, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, stride, self.num_rows, self.size))
+                f.write(offsets.tobytes())
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def build_row_index(
+    data_file_full_path: str, stride: int = ROW_INDEX_STRIDE
+) -> RowIndexBuilder | None:
+    """Build and write the row index of a csv file.
+    Returns None if the file has an unclosed quoted field, after writing an index that
+    marks the file as unindexable."""
+    builder = RowIndexBuilder(stride)
+    with open(data_file_full_path, "rb") as f:
+        while chunk := f.read(READ_CHUNK_SIZE):
+            builder.feed(chunk)
+    builder.finish()
+    builder.write(row_index_path(data_file_full_path))
+    return builder if builder.valid else None
+
+
+class RowIndex:
+    """Memory-mapped row index of a csv data file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.stride, self.num_rows, self.size = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a row index.")
+        if sys.byteorder == "little":
+            self.offsets = memoryview(self._mmap)[_HEADER.size :].cast("Q")
+        else:  # pragma: no cover
+            self.offsets = array("Q", self._mmap[_HEADER.size :])
+            self.offsets.byteswap()
+
+    def close(self):
+        """Unmap the index."""
+        if isinstance(getattr(self, "offsets", None), memoryview):
+            self.offsets.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "RowIndex":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def locate(self, row: int) -> tuple[int, int]:
+        """Get the byte offset of the nearest indexed row at or before a data row, and the
+        number of rows to skip from there to reach it."""
+        block = min(row // self.stride, len(self.offsets) - 1)
+        if block < 0:
+            return self.size, 0
+        return self.offsets[block], row - block * self.stride
+
+
+def open_row_index(data_file_full_path: str) -> RowIndex | None:
+    """Open the row index of a data file.
+    Returns None if there is no index, it does not match the data file or it marks the
+    file as unindexable."""
+    path = row_index_path(data_file_full_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        index = RowIndex(path)
+    except ValueError:
+        return None
+    if not index.stride or index.size != os.path.getsize(data_file_full_path):
+        index.close()
+        return None
+    return index
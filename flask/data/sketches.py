@@ -0,0 +1,461 @@
+"""Module sketches contains small mergeable summaries of column values.
+
+Each summary has a fixed memory bound no matter how many values it has seen, and two
+summaries of different parts of a column can be merged into the summary of the whole.
+"""
+
+import math
+import struct
+
+import numpy as np
+import pandas as pd
+
+DISTINCT_SKETCH_SIZE = 4096
+VALUE_SAMPLE_SIZE = 4096
+HLL_PRECISION = 12
+TDIGEST_COMPRESSION = 200
+HISTOGRAM_BINS = 20
+TOP_VALUES = 20
+TOP_VALUES_CAPACITY = 1024
+
+_HASH_SPACE = float(2**64)
+# precision
+_HLL_HEADER = struct.Struct("<B")
+# compression, number of centroids, min value, max value
+_TDIGEST_HEADER = struct.Struct("<dQdd")
+# low, high, number of bins
+_HISTOGRAM_HEADER = struct.Struct("<ddQ")
+# number of values, error bound
+_TOP_VALUES_HEADER = struct.Struct("<QQ")
+
+
+def _sort_counts(counts: pd.Series) -> pd.Series:
+    """Sort value counts by value. Values of mixed types, as in a csv column holding both
+    numbers and text, cannot be compared, so they are sorted by their text instead."""
+    try:
+        return counts.sort_index()
+    except TypeError:
+        return counts.sort_index(key=lambda index: index.astype(str))
+
+
+def bin_values(values: np.ndarray, low: float, high: float, num_bins: int) -> np.ndarray:
+    """Get the bin of each finite value in num_bins bins of equal width from low to high,
+    with high in the last bin."""
+    if high <= low:
+        return np.zeros(len(values), dtype=np.int64)
+    width = (high - low) / num_bins
+    if math.isfinite(width):
+        positions = (values - low) / width
+    else:
+        # The range overflows float64, so the values are scaled down before subtracting.
+        positions = (values / num_bins - low / num_bins) / (high / num_bins - low / num_bins)
+        positions *= num_bins
+    return np.minimum(positions.astype(np.int64), num_bins - 1)
+
+
+def hash_values(values: np.ndarray) -> np.ndarray:
+    """Hash non-null column values to uint64.
+    Floats are normalized first so that 0.0 and -0.0 hash the same, as they compare equal."""
+    if values.dtype.kind == "f":
+        values = values + 0.0
+    return pd.util.hash_array(np.asarray(values))
+
+
+class DistinctCounter:
+    """K-minimum-values sketch of the number of distinct values.
+    Keeps the smallest size hashes seen. The count is exact while fewer than size distinct
+    values have been seen, and otherwise has a relative standard error of about
+    1 / sqrt(size - 2)."""
+
+    def __init__(self, size: int = DISTINCT_SKETCH_SIZE):
+        self.size = size
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def add(self, values: np.ndarray):
+        """Add non-null values."""
+        self.add_hashes(hash_values(values))
+
+    def add_hashes(self, hashes: np.ndarray):
+        """Add hashed values."""
+        if len(self.hashes) == self.size:
+            hashes = hashes[hashes < self.hashes[-1]]
+        if not len(hashes):
+            return
+        hashes = np.sort(hashes)
+        hashes = hashes[np.concatenate(([True], hashes[1:] != hashes[:-1]))][: self.size]
+        self.hashes = np.union1d(self.hashes, hashes)[: self.size]
+
+    def merge(self, other: "DistinctCounter"):
+        """Merge in the counter of another part of the column."""
+        self.add_hashes(other.hashes)
+
+    @property
+    def exact(self) -> bool:
+        """Whether the count is exact."""
+        return len(self.hashes) < self.size
+
+    def count(self) -> int:
+        """Get the (estimated) number of distinct values."""
+        if self.exact:
+            return len(self.hashes)
+        return round((self.size - 1) / (float(self.hashes[-1]) / _HASH_SPACE))
+
+
+class ValueSample:
+    """Uniform random sample of at most size values, without replacement.
+    Every value gets a random key and the values with the smallest keys are kept, so merging
+    two samples keeps a uniform sample of both parts."""
+
+    def __init__(self, size: int = VALUE_SAMPLE_SIZE, seed: int = 0):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.keys = np.empty(0, dtype=np.float64)
+        self.values = np.empty(0, dtype=np.float64)
+
+    def add(self, values: np.ndarray):
+        """Add non-null values."""
+        self._keep(self.rng.random(len(values)), values)
+
+    def merge(self, other: "ValueSample"):
+        """Merge in the sample of another part of the column."""
+        self._keep(other.keys, other.values)
+
+    def _keep(self, keys: np.ndarray, values: np.ndarray):
+        """Keep the values with the smallest keys out of the sample and new values."""
+        keys = np.concatenate([self.keys, keys])
+        values = np.concatenate([self.values, values])
+        if len(keys) > self.size:
+            kept = np.argpartition(keys, self.size)[: self.size]
+            keys, values = keys[kept], values[kept]
+        self.keys, self.values = keys, values
+
+    def median(self) -> float:
+        """Get the median of the sampled values."""
+        return float(np.median(self.values))
+
+
+class ValueCounts:
+    """Exact count of each distinct value, kept while there are at most limit distinct values.
+    Once the limit is passed the counts are dropped and overflowed is set."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.counts: pd.Series | None = pd.Series(dtype=np.int64)
+
+    @property
+    def overflowed(self) -> bool:
+        """Whether the column had too many distinct values to count exactly."""
+        return self.counts is None
+
+    def add(self, values: np.ndarray):
+        """Add non-null values."""
+        if self.counts is not None:
+            self.merge_counts(pd.Series(values).value_counts())
+
+    def merge_counts(self, counts: pd.Series | None):
+        """Merge in the counts of another part of the column."""
+        if self.counts is None:
+            return
+        if counts is None:
+            self.counts = None
+            return
+        merged = _sort_counts(pd.concat([self.counts, counts]).groupby(level=0, sort=False).sum())
+        self.counts = merged if len(merged) <= self.limit else None
+
+    def median(self) -> float:
+        """Get the exact median of the counted numeric values."""
+        values = self.counts.index.to_numpy(dtype=np.float64)
+        cumulative = np.cumsum(self.counts.to_numpy())
+        total = int(cumulative[-1])
+        lower = values[np.searchsorted(cumulative, (total - 1) // 2, side="right")]
+        upper = values[np.searchsorted(cumulative, total // 2, side="right")]
+        return float(lower if total % 2 else (lower + upper) / 2)
+
+
+class HyperLogLog:
+    """HyperLogLog sketch of the number of distinct values.
+    Uses 2**precision one-byte registers (4 KiB by default). The count has a relative
+    standard error of 1.04 / sqrt(2**precision), 1.6% by default, and is close to exact
+    for small counts, where linear counting is used instead."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        # The hash bits left after the register index must fit exactly in a float64.
+        if not 11 <= precision <= 18:
+            raise ValueError(f"HyperLogLog precision must be between 11 and 18, not {precision}.")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, values: np.ndarray):
+        """Add non-null values."""
+        self.add_hashes(hash_values(values))
+
+    def add_hashes(self, hashes: np.ndarray):
+        """Add hashed values."""
+        if not len(hashes):
+            return
+        remaining_bits = 64 - self.precision
+        index = (hashes >> np.uint64(remaining_bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << remaining_bits) - 1)
+        # The rank is the position of the first set bit of the rest of the hash.
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        ranks = (remaining_bits + 1 - bit_length).astype(np.uint8)
+        np.maximum.at(self.registers, index, ranks)
+
+    def merge(self, other: "HyperLogLog"):
+        """Merge in the sketch of another part of the column, or of another file."""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precisions.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        """Get the estimated number of distinct values."""
+        num_registers = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / num_registers)
+        estimate = alpha * num_registers**2 / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+        num_empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * num_registers and num_empty:
+            estimate = num_registers * math.log(num_registers / num_empty)
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        """Serialize the sketch."""
+        return _HLL_HEADER.pack(self.precision) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        """Deserialize a sketch made by to_bytes."""
+        (precision,) = _HLL_HEADER.unpack_from(data)
+        sketch = cls(precision)
+        sketch.registers = np.frombuffer(data, dtype=np.uint8, offset=_HLL_HEADER.size).copy()
+        return sketch
+
+
+class TDigest:
+    """Merging t-digest of numeric values, for estimating quantiles.
+    Values are clustered into centroids that are small near the tails and larger near the
+    median, keeping about compression / 2 centroids (1.6 KiB by default). With the default
+    compression the rank of an estimated quantile is typically within 1% of the requested
+    one, and closer in the tails. The min and max are exact, and so are quantiles of fewer
+    values than there are centroids."""
+
+    def __init__(self, compression: float = TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.min_value = math.inf
+        self.max_value = -math.inf
+
+    @property
+    def count(self) -> float:
+        """Number of values added."""
+        return float(self.weights.sum())
+
+    def add(self, values: np.ndarray, weights: np.ndarray | None = None):
+        """Add non-null values, optionally weighted."""
+        if not len(values):
+            return
+        values = np.asarray(values, dtype=np.float64)
+        weights = np.ones(len(values)) if weights is None else weights
+        self.min_value = min(self.min_value, float(values.min()))
+        self.max_value = max(self.max_value, float(values.max()))
+        self._compress(
+            np.concatenate([self.means, values]), np.concatenate([self.weights, weights])
+        )
+
+    def merge(self, other: "TDigest"):
+        """Merge in the digest of another part of the column, or of another file."""
+        if other.count:
+            self.add(other.means, other.weights)
+            self.min_value = min(self.min_value, other.min_value)
+            self.max_value = max(self.max_value, other.max_value)
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        """Cluster sorted centroids so each spans at most one unit of the k1 scale function."""
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        q_left = (cumulative - weights) / cumulative[-1]
+        k = self.compression / (2 * math.pi) * np.arcsin(np.clip(2 * q_left - 1, -1, 1))
+        groups = np.floor(k)
+        starts = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantiles(self, quantiles: list[float]) -> list[float]:
+        """Estimate quantiles, each between 0 and 1."""
+        if not self.count:
+            return [math.nan for _ in quantiles]
+        centers = np.cumsum(self.weights) - self.weights / 2
+        ranks = np.asarray(quantiles, dtype=np.float64) * self.count
+        estimates = np.interp(
+            ranks,
+            np.concatenate(([0.0], centers, [self.count])),
+            np.concatenate(([self.min_value], self.means, [self.max_value])),
+        )
+        return [float(estimate) for estimate in estimates]
+
+    def cdf(self, values: np.ndarray) -> np.ndarray:
+        """Estimate the fraction of values at or below each of the given values."""
+        values = np.asarray(values, dtype=np.float64)
+        if not self.count:
+            return np.full(len(values), math.nan)
+        centers = np.cumsum(self.weights) - self.weights / 2
+        ranks = np.interp(
+            values,
+            np.concatenate(([self.min_value], self.means, [self.max_value])),
+            np.concatenate(([0.0], centers, [self.count])),
+        )
+        return ranks / self.count
+
+    def quantile(self, quantile: float) -> float:
+        """Estimate a quantile between 0 and 1."""
+        return self.quantiles([quantile])[0]
+
+    def to_bytes(self) -> bytes:
+        """Serialize the digest."""
+        header = _TDIGEST_HEADER.pack(
+            self.compression, len(self.means), self.min_value, self.max_value
+        )
+        return header + self.means.astype("<f8").tobytes() + self.weights.astype("<f8").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        """Deserialize a digest made by to_bytes."""
+        compression, size, min_value, max_value = _TDIGEST_HEADER.unpack_from(data)
+        digest = cls(compression)
+        centroids = np.frombuffer(data, dtype="<f8", offset=_TDIGEST_HEADER.size)
+        digest.means = centroids[:size].astype(np.float64)
+        digest.weights = centroids[size : 2 * size].astype(np.float64)
+        digest.min_value, digest.max_value = min_value, max_value
+        return digest
+
+
+class Histogram:
+    """Counts of numeric values in bins of equal width between their min and max, binned
+    the way the frontend bins them: each bin holds the values from its low edge up to its
+    high edge, and the last bin also holds the max. All the values are in one bin if the
+    min and max are equal."""
+
+    def __init__(self, low: float, high: float, counts: np.ndarray):
+        self.low = low
+        self.high = high
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    @property
+    def edges(self) -> np.ndarray:
+        """Get the low edge of every bin, followed by the high edge of the last one."""
+        num_bins = len(self.counts)
+        if math.isfinite(self.high - self.low):
+            return np.linspace(self.low, self.high, num_bins + 1)
+        # The range overflows float64, so each edge is a weighted mean of the low and high ones.
+        fractions = np.arange(num_bins + 1) / num_bins
+        return self.low * (1 - fractions) + self.high * fractions
+
+    @staticmethod
+    def _num_bins(low: float, high: float, num_bins: int) -> int:
+        """Get the number of bins of a histogram of values from low to high."""
+        return 1 if low == high else num_bins
+
+    @classmethod
+    def from_values(
+        cls, values: np.ndarray, counts: np.ndarray | None = None, num_bins: int = HISTOGRAM_BINS
+    ) -> "Histogram":
+        """Count non-null values exactly, each repeated by its count if counts are given."""
+        values = np.asarray(values, dtype=np.float64)
+        low, high = float(values.min()), float(values.max())
+        num_bins = cls._num_bins(low, high, num_bins)
+        bin_numbers = bin_values(values, low, high, num_bins)
+        return cls(low, high, np.bincount(bin_numbers, weights=counts, minlength=num_bins))
+
+    @classmethod
+    def from_digest(cls, digest: "TDigest", num_bins: int = HISTOGRAM_BINS) -> "Histogram":
+        """Estimate the counts from a t-digest, which has the exact min, max and count."""
+        low, high = digest.min_value, digest.max_value
+        histogram = cls(low, high, np.zeros(cls._num_bins(low, high, num_bins)))
+        ranks = np.round(digest.cdf(histogram.edges) * digest.count)
+        ranks[0], ranks[-1] = 0, digest.count
+        histogram.counts = np.diff(ranks).astype(np.int64)
+        return histogram
+
+    def to_bytes(self) -> bytes:
+        """Serialize the histogram."""
+        header = _HISTOGRAM_HEADER.pack(self.low, self.high, len(self.counts))
+        return header + self.counts.astype("<u8").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Histogram":
+        """Deserialize a histogram made by to_bytes."""
+        low, high, num_bins = _HISTOGRAM_HEADER.unpack_from(data)
+        counts = np.frombuffer(data, dtype="<u8", count=num_bins, offset=_HISTOGRAM_HEADER.size)
+        return cls(low, high, counts.astype(np.int64))
+
+
+class TopValues:
+    """Misra-Gries summary of the most frequent string values.
+    Counts at most capacity values. When there are more, the count of the (capacity + 1)th
+    most frequent value is subtracted from every count and the values left without a count
+    are dropped, so every count is exact while there are at most capacity distinct values,
+    and otherwise low by at most error, which is at most the number of values divided by
+    capacity + 1. Any value more frequent than that is always kept. A value without a count
+    occurs at most error times."""
+
+    def __init__(self, capacity: int = TOP_VALUES_CAPACITY):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+        self.error = 0
+
+    def add(self, values: np.ndarray):
+        """Add non-null values."""
+        self.merge_counts(pd.Series(values, dtype=object).value_counts(), 0)
+
+    def merge(self, other: "TopValues"):
+        """Merge in the summary of another part of the column, or of another file."""
+        self.merge_counts(other.counts, other.error)
+
+    def merge_counts(self, counts: pd.Series, error: int = 0):
+        """Merge in the counts of values of another part of the column, which may be low
+        by up to error."""
+        counts = _sort_counts(pd.concat([self.counts, counts]).groupby(level=0, sort=False).sum())
+        self.error += error
+        if len(counts) > self.capacity:
+            dropped = int(counts.nlargest(self.capacity + 1).iloc[-1])
+            counts = counts[counts > dropped] - dropped
+            self.error += dropped
+        self.counts = counts.astype(np.int64)
+
+    def top(self, k: int = TOP_VALUES) -> pd.Series:
+        """Get the k values with the highest counts, highest first, with ties by value."""
+        return _sort_counts(self.counts).sort_values(ascending=False, kind="stable").head(k)
+
+    def to_bytes(self, k: int = TOP_VALUES) -> bytes:
+        """Serialize the k values with the highest counts. The values left out count as 0,
+        so the next highest count is added to the error."""
+        top = self.top(k + 1)
+        error = self.error + (int(top.iloc[k]) if len(top) > k else 0)
+        top = top.head(k)
+        encoded = [str(value).encode("utf-8") for value in top.index]
+        lengths = np.array([len(value) for value in encoded], dtype="<u4")
+        return (
+            _TOP_VALUES_HEADER.pack(len(top), error)
+            + top.to_numpy().astype("<u8").tobytes()
+            + lengths.tobytes()
+            + b"".join(encoded)
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes, capacity: int = TOP_VALUES_CAPACITY) -> "TopValues":
+        """Deserialize a summary made by to_bytes."""
+        size, error = _TOP_VALUES_HEADER.unpack_from(data)
+        offset = _TOP_VALUES_HEADER.size
+        counts = np.frombuffer(data, dtype="<u8", count=size, offset=offset).astype(np.int64)
+        offset += 8 * size
+        lengths = np.frombuffer(data, dtype="<u4", count=size, offset=offset)
+        offset += 4 * size
+        values = []
+        for length in lengths.tolist():
+            values.append(data[offset : offset + length].decode("utf-8"))
+            offset += length
+        summary = cls(capacity)
+        summary.counts = pd.Series(counts, index=pd.Index(values, dtype=object))
+        summary.error = error
+        return summary
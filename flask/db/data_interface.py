@@ -1,11 +1,45 @@
 """Module data_interface contains functions to interface with data files."""
 
 import csv
+import hashlib
+import io
+import itertools
 import json
+import lzma
 import os
-from typing import Any
+import stat
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from collections.abc import Iterator
+from typing import Any, BinaryIO
 
-from data import csv_analyzer
+import pandas as pd
+from data import columnar_cache, csv_analyzer, json_analyzer, row_index
+
+STREAM_MIMETYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+# The format each type of data file is streamed in when none is asked for.
+DEFAULT_STREAM_FORMATS = {"csv": "ndjson", "json": "json"}
+STREAM_BATCH_ROWS = 1000
+STREAM_CHUNK_SIZE = 64 * 1024
+ARCHIVE_SUFFIXES = {
+    ".zip": "zip",
+    ".tar": "tar",
+    ".tar.gz": "tar",
+    ".tgz": "tar",
+    ".tar.bz2": "tar",
+    ".tar.xz": "tar",
+}
+# Errors raised while reading the entries of a damaged archive.
+ARCHIVE_READ_ERRORS = (
+    zipfile.BadZipFile,
+    tarfile.TarError,
+    zlib.error,
+    lzma.LZMAError,
+    EOFError,
+    RuntimeError,
+)
 
 
 def load_data_file(path: str, data_file_type: str, data_file_dir: str) -> tuple[Any, str]:
@@ -26,27 +60,386 @@ def load_data_file(path: str, data_file_type: str, data_file_dir: str) -> tuple[
             return None, f"Unsupported data file type: {data_file_type}."
 
 
-def new_data_file_path(data_file_type: str, data_file_dir: str) -> str:
-    """Creates a new data file path."""
-    files = os.listdir(data_file_dir)
-    files = [x.replace(f".{data_file_type}", "") for x in files if x.endswith(data_file_type)]
-    last_filename = 0
-    for file in files:
+def _column_indices(header: list[str], columns: list[str] | None) -> list[int] | None:
+    """Get the indices of the requested columns in a CSV header."""
+    if columns is None:
+        return None
+    indices = []
+    for column in columns:
+        if column not in header:
+            raise KeyError(f"Column {column} not found.")
+        indices.append(header.index(column))
+    return indices
+
+
+def _iter_csv_rows_from(full_path: str, position: int, skip: int, limit: int | None):
+    """Iterate over the rows of a CSV file starting at a byte position, after skipping rows."""
+    with open(full_path, "rb") as raw:
+        raw.seek(position)
+        reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8"))
+        stop = None if limit is None else skip + limit
+        yield from itertools.islice(reader, skip, stop)
+
+
+def iter_csv_rows(
+    full_path: str,
+    offset: int = 0,
+    limit: int | None = None,
+    columns: list[str] | None = None,
+) -> Iterator[list[str]]:
+    """Iterate over the header and then a window of rows of a CSV file.
+    Selected columns are read from the columnar cache when the file has one, so the other
+    columns are never parsed. Otherwise, if the file has a row index, reading seeks to the
+    nearest indexed row before the window instead of parsing every row before it. Rows
+    after the window are never read.
+    Raises KeyError for unknown columns."""
+    cache = columnar_cache.open_columnar_cache(full_path) if columns is not None else None
+    if cache is not None:
+        with cache:
+            yield from columnar_cache.iter_text_rows(cache, offset, limit, columns)
+        return
+    with open(full_path, encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        indices = _column_indices(header, columns)
+
+        index = row_index.open_row_index(full_path) if offset else None
+        if index is None:
+            stop = None if limit is None else offset + limit
+            rows = itertools.islice(reader, offset, stop)
+        else:
+            with index:
+                position, skip = index.locate(offset)
+            rows = _iter_csv_rows_from(full_path, position, skip, limit)
+
+        for row in itertools.chain([header], rows):
+            if indices is None:
+                yield row
+            else:
+                yield [row[i] if i < len(row) else "" for i in indices]
+
+
+def count_csv_rows(full_path: str) -> int:
+    """Count the rows of a CSV file, not including the header."""
+    index = row_index.open_row_index(full_path)
+    if index is not None:
+        with index:
+            return index.num_rows
+    with open(full_path, encoding="utf-8") as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+
+def _ensure_row_index(full_path: str, offset: int):
+    """Build the row index of a CSV file that has none when reading deep into it.
+    Files that cannot be indexed get an index marking them so, so they are only tried once."""
+    if offset >= row_index.ROW_INDEX_STRIDE and not os.path.exists(
+        row_index.row_index_path(full_path)
+    ):
+        row_index.build_row_index(full_path)
+
+
+def load_data_page(
+    path: str,
+    data_file_type: str,
+    data_file_dir: str,
+    offset: int = 0,
+    limit: int | None = None,
+    columns: list[str] | None = None,
+    num_rows: int | None = None,
+) -> tuple[dict[str, Any] | None, str]:
+    """Loads a window of rows from a data file along with the total number of rows.
+    For CSV files the data is the (projected) header followed by the rows in the window,
+    and num_rows saves counting the rows when it is already known. For JSON result files
+    the window applies to the results in "data"."""
+    full_path = os.path.join(data_file_dir, path)
+    if not os.path.exists(full_path):
+        return None, f"Data file not found for path {path}."
+    match data_file_type:
+        case "json":
+            if columns is not None:
+                return None, "Columns can only be selected from csv data files."
+            with open(full_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict) or not isinstance(data.get("data"), list):
+                return None, "Only json result files can be paged."
+            stop = None if limit is None else offset + limit
+            return {
+                "data": {**data, "data": data["data"][offset:stop]},
+                "total_rows": len(data["data"]),
+            }, ""
+        case "csv":
+            _ensure_row_index(full_path, offset)
+            try:
+                data = list(iter_csv_rows(full_path, offset, limit, columns))
+            except KeyError as e:
+                return None, e.args[0]
+            if num_rows is None:
+                num_rows = count_csv_rows(full_path)
+            return {"data": data, "total_rows": num_rows}, ""
+        case _:
+            return None, f"Unsupported data file type: {data_file_type}."
+
+
+def load_data_columns(
+    path: str, data_file_type: str, data_file_dir: str, columns: list[str]
+) -> tuple[list[pd.Series] | None, str]:
+    """Loads whole columns of a CSV data file as pandas series, in the order asked for.
+    Columns are read from the columnar cache when the file has one, typed where their text
+    allows, and otherwise parsed from the CSV as strings, with "" for empty cells."""
+    full_path = os.path.join(data_file_dir, path)
+    if not os.path.exists(full_path):
+        return None, f"Data file not found for path {path}."
+    if data_file_type != "csv":
+        return None, "Only csv data files have columns."
+    unique_columns = list(dict.fromkeys(columns))
+    try:
+        df = columnar_cache.read_columns(full_path, unique_columns)
+        if df is None:
+            with open(full_path, encoding="utf-8") as f:
+                _column_indices(next(csv.reader(f), []), unique_columns)
+            # Blank lines are rows of empty cells, as in the columnar cache and when paging.
+            df = pd.read_csv(
+                full_path,
+                usecols=unique_columns,
+                dtype=str,
+                keep_default_na=False,
+                skip_blank_lines=False,
+            )
+    except KeyError as e:
+        return None, e.args[0]
+    return [df[column] for column in columns], ""
+
+
+def _iter_stream_chunks(rows: Iterator[list[str]], stream_format: str) -> Iterator[str]:
+    """Serialize rows in batches, as NDJSON lines or as the items of a JSON array."""
+    if stream_format == "json":
+        yield "["
+    separator = ""
+    while batch := list(itertools.islice(rows, STREAM_BATCH_ROWS)):
+        if stream_format == "ndjson":
+            yield "".join(json.dumps(row) + "\n" for row in batch)
+        else:
+            yield separator + ",".join(json.dumps(row) for row in batch)
+            separator = ","
+    if stream_format == "json":
+        yield "]"
+
+
+def _iter_file_chunks(full_path: str) -> Iterator[bytes]:
+    """Iterate over the raw bytes of a file."""
+    with open(full_path, "rb") as f:
+        while chunk := f.read(STREAM_CHUNK_SIZE):
+            yield chunk
+
+
+def stream_data_file(
+    path: str,
+    data_file_type: str,
+    data_file_dir: str,
+    stream_format: str | None = None,
+    offset: int = 0,
+    limit: int | None = None,
+    columns: list[str] | None = None,
+) -> tuple[Iterator[str | bytes] | None, str]:
+    """Streams a data file as chunks of serialized JSON.
+    CSV files are streamed as the (projected) header followed by the rows in the window,
+    either one JSON array per line (ndjson, the default) or as a single JSON array (json).
+    Only one batch of rows is held in memory at a time. JSON files are streamed as is, in
+    the json format."""
+    full_path = os.path.join(data_file_dir, path)
+    if not os.path.exists(full_path):
+        return None, f"Data file not found for path {path}."
+    if stream_format is None:
+        stream_format = DEFAULT_STREAM_FORMATS.get(data_file_type, "ndjson")
+    if stream_format not in STREAM_MIMETYPES:
+        return None, f"Unsupported stream format: {stream_format}."
+    match data_file_type:
+        case "json":
+            if stream_format != "json":
+                return None, "Json data files can only be streamed as json."
+            if offset or limit is not None or columns is not None:
+                return None, "Only csv data files can be streamed in windows."
+            return _iter_file_chunks(full_path), ""
+        case "csv":
+            _ensure_row_index(full_path, offset)
+            rows = iter_csv_rows(full_path, offset, limit, columns)
+            try:
+                # Read the header up front so unknown columns are reported before streaming.
+                header = next(rows, None)
+            except KeyError as e:
+                return None, e.args[0]
+            if header is not None:
+                rows = itertools.chain([header], rows)
+            return _iter_stream_chunks(rows, stream_format), ""
+        case _:
+            return None, f"Unsupported data file type: {data_file_type}."
+
+
+def data_file_sidecar_paths(full_path: str) -> list[str]:
+    """Get the paths of the derived files kept next to a data file."""
+    return [row_index.row_index_path(full_path), columnar_cache.columnar_cache_path(full_path)]
+
+
+def index_data_file(
+    data_file_type: str, full_path: str, index: row_index.RowIndexBuilder | None = None
+):
+    """Builds the row index kept next to a newly saved data file, using the row index built
+    while the file was saved if given."""
+    if data_file_type == "csv":
+        if index is None:
+            row_index.build_row_index(full_path)
+        else:
+            index.write(row_index.row_index_path(full_path))
+
+
+def cache_data_file(data_file_type: str, full_path: str):
+    """Builds the columnar cache of a stored data file that has none. Building it takes
+    most of the time of saving a large csv file, so it is built along with the analysis
+    instead, and reads use the csv file until then. The cache is only kept if it has the
+    same rows as the row index."""
+    cache_path = columnar_cache.columnar_cache_path(full_path)
+    if data_file_type != "csv" or os.path.exists(cache_path):
+        return
+    index = row_index.open_row_index(full_path)
+    if index is None:
+        return
+    with index:
+        num_rows = index.num_rows
+    if not columnar_cache.build_columnar_cache(full_path, num_rows):
+        return
+    # The data file may have been deleted while its cache was built.
+    if not os.path.exists(full_path) and os.path.exists(cache_path):
+        os.remove(cache_path)
+
+
+def delete_data_file(path: str, data_file_dir: str):
+    """Deletes a data file along with its derived files."""
+    full_path = os.path.join(data_file_dir, path)
+    for sidecar_path in data_file_sidecar_paths(full_path):
+        if os.path.exists(sidecar_path):
+            os.remove(sidecar_path)
+    os.remove(full_path)
+
+
+def save_data_file(
+    stream: BinaryIO, data_file_type: str, data_file_dir: str, max_size: int | None = None
+) -> tuple[str, str]:
+    """Saves an uploaded data file to a temporary file in the data file directory in one
+    pass over its content, which is hashed and, for csv files, row indexed as it streams in.
+    Unless a data file with the same content is already stored, the row index of the
+    temporary file is written next to it, so storing it only has to move it. Returns the
+    full path of the temporary file and the content-addressed path the data file is stored
+    at, named by its SHA-256 hash.
+    Raises ValueError if the file is larger than max_size bytes."""
+    content_hash = hashlib.sha256()
+    index = row_index.RowIndexBuilder() if data_file_type == "csv" else None
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=data_file_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            size = 0
+            while chunk := stream.read(STREAM_CHUNK_SIZE):
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise ValueError(f"File is larger than the upload limit of {max_size} bytes.")
+                content_hash.update(chunk)
+                if index is not None:
+                    index.feed(chunk)
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        path = f"{content_hash.hexdigest()}.{data_file_type}"
+        if not os.path.exists(os.path.join(data_file_dir, path)):
+            if index is not None:
+                index.finish()
+            index_data_file(data_file_type, tmp_path, index)
+    except BaseException:
+        delete_data_file(os.path.basename(tmp_path), data_file_dir)
+        raise
+    return tmp_path, path
+
+
+def store_data_file(tmp_path: str, path: str, data_file_dir: str) -> bool:
+    """Moves a saved data file and its derived files to its content-addressed path.
+    If a data file with the same content is already stored, the saved file is dropped
+    instead. Returns whether the data file was stored."""
+    full_path = os.path.join(data_file_dir, path)
+    if os.path.exists(full_path):
+        delete_data_file(os.path.basename(tmp_path), data_file_dir)
+        return False
+    # The derived files are moved first, so a stored data file always has them.
+    for tmp_sidecar_path, sidecar_path in zip(
+        data_file_sidecar_paths(tmp_path), data_file_sidecar_paths(full_path), strict=True
+    ):
+        if os.path.exists(tmp_sidecar_path):
+            os.replace(tmp_sidecar_path, sidecar_path)
+    os.replace(tmp_path, full_path)
+    return True
+
+
+def archive_type(filename: str) -> str | None:
+    """Get the type of archive a file is from its name, or None if it is not an archive."""
+    name = filename.lower()
+    for suffix, kind in ARCHIVE_SUFFIXES.items():
+        if name.endswith(suffix):
+            return kind
+    return None
+
+
+def archive_entry_path(name: str) -> str | None:
+    """Get the path of an archive entry relative to the folder the archive is expanded into.
+    Returns None if the entry would leave that folder, as absolute paths, drive letters and
+    '..' parts do."""
+    parts = name.replace("\\", "/").split("/")
+    if parts[0] == "" or parts[0].endswith(":") or ".." in parts:
+        return None
+    parts = [part for part in parts if part not in ("", ".")]
+    return "/".join(parts) or None
+
+
+def iter_archive_entries(stream: BinaryIO, kind: str) -> Iterator[tuple[str, BinaryIO | None]]:
+    """Iterate over the names and content streams of the entries of a zip or tar archive,
+    in archive order. Directories are skipped, and entries that are not regular files,
+    such as links, have no stream. Each stream is only valid until the next entry.
+    Raises ValueError if the stream is not an archive of that kind, and one of
+    ARCHIVE_READ_ERRORS if the archive is damaged."""
+    if kind == "zip":
         try:
-            cur_filename = int(file)
-            if cur_filename >= last_filename:
-                last_filename = cur_filename + 1
-        except ValueError:
-            continue
-    return f"{last_filename}.{data_file_type}"
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile as e:
+            raise ValueError("File is not a valid zip archive.") from e
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                if stat.S_ISLNK(info.external_attr >> 16):
+                    yield info.filename, None
+                    continue
+                with archive.open(info) as f:
+                    yield info.filename, f
+        return
+    try:
+        archive = tarfile.open(fileobj=stream, mode="r:*")  # noqa: SIM115
+    except tarfile.TarError as e:
+        raise ValueError("File is not a valid tar archive.") from e
+    with archive:
+        for member in archive:
+            if member.isdir():
+                continue
+            if not member.isfile():
+                yield member.name, None
+                continue
+            with archive.extractfile(member) as f:
+                yield member.name, f
 
 
-def analyze_data_file(data_file_type: str, data_file_path: str) -> dict[str, Any]:
-    """Analyzes a data file."""
+def analyze_data_file(data_file_type: str, data_file_path: str, workers: int = 1) -> dict[str, Any]:
+    """Analyzes a data file, splitting the work across workers threads where possible."""
     match data_file_type:
         case "csv":
-            return csv_analyzer.analyze_csv_stats(data_file_path)
+            return csv_analyzer.analyze_csv_stats(data_file_path, workers=workers)
         case "json":
-            raise NotImplementedError
+            return json_analyzer.analyze_json_stats(data_file_path, workers=workers)
         case _:
             raise KeyError(f"Unknown data_file_type '{data_file_type}'")
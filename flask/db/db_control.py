@@ -4,7 +4,6 @@ import argparse
 import json
 import os
 import shutil
-import subprocess
 import sys
 
 from sqlalchemy.orm import Session
@@ -27,6 +26,13 @@ def parse_args(args: list[str]) -> argparse.Namespace:
         default=os.path.join("untracked", "data"),
         help="Path to the data file directory.",
     )
+    parser.add_argument(
+        "--sqlite-profile",
+        type=str,
+        choices=sorted(db_interface.SQLITE_PROFILES),
+        default=db_interface.SQLITE_PROFILE,
+        help="SQLite connection profile to open the database with.",
+    )
 
     subparsers = parser.add_subparsers(dest="subcommand")
     create_parser = subparsers.add_parser("create", help="Create the database.")
@@ -58,8 +64,9 @@ def parse_args(args: list[str]) -> argparse.Namespace:
     )
     delete_parser.set_defaults(control="delete")
 
-    migrate_parser = subparsers.add_parser("migrate", help="Migrate the database.")
-    migrate_parser.add_argument("--message", type=str, help="Message for the migration.")
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Migrate the database to the current schema."
+    )
     migrate_parser.set_defaults(control="migrate")
 
     export_parser = subparsers.add_parser("export", help="Export the database.")
@@ -86,6 +93,7 @@ def create(
     delete_existing: bool,
     db_seed_data: str,
     data_seed_dir: str,
+    sqlite_profile: str | None = None,
 ):
     """Create the database."""
     if delete_existing and os.path.exists(db_path):
@@ -94,7 +102,7 @@ def create(
         shutil.rmtree(data_file_dir)
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     os.makedirs(data_file_dir, exist_ok=True)
-    engine = db_interface.make_engine(db_path)
+    engine = db_interface.make_engine(db_path, sqlite_profile)
     if db_seed_data:
         with open(db_seed_data, encoding="utf-8") as file:
             db_seed_data = json.load(file)
@@ -112,15 +120,25 @@ def delete_db(db_path: str, data_file_dir: str, delete_data_files: bool):
     os.remove(db_path)
 
 
-def migrate(message: str):
-    """Migrate the database."""
-    subprocess.check_output(["alembic", "revision", "--autogenerate", "--message", message])
-    subprocess.check_output(["alembic", "upgrade", "head"])
+def migrate(db_path: str, sqlite_profile: str | None = None):
+    """Migrate the database to the current schema."""
+    engine = db_interface.make_engine(db_path, sqlite_profile)
+    applied = db_interface.migrate_schema(engine)
+    for change in applied:
+        print(change)
+    if not applied:
+        print("Database schema is up to date.")
 
 
-def export(db_path: str, data_file_dir: str, output_db_file: str, output_data_file_dir: str):
+def export(
+    db_path: str,
+    data_file_dir: str,
+    output_db_file: str,
+    output_data_file_dir: str,
+    sqlite_profile: str | None = None,
+):
     """Export the database."""
-    engine = db_interface.make_engine(db_path)
+    engine = db_interface.make_engine(db_path, sqlite_profile)
     with Session(engine) as session:
         db_objects = db_interface.export_db_objects(session)
     os.makedirs(os.path.dirname(output_db_file), exist_ok=True)
@@ -143,17 +161,19 @@ def main(args: list[str]):
                 args.delete_existing,
                 args.db_seed_data,
                 args.data_seed_dir,
+                args.sqlite_profile,
             )
         case "delete":
             delete_db(args.db_path, args.data_file_dir, args.delete_data_files)
         case "migrate":
-            migrate(args.message)
+            migrate(args.db_path, args.sqlite_profile)
         case "export":
             export(
                 args.db_path,
                 args.data_file_dir,
                 args.output_db_file,
                 args.output_data_file_dir,
+                args.sqlite_profile,
             )
         case _:
             raise ValueError(f"Invalid control: {args.control}")
@@ -1,11 +1,14 @@
 """Module db_interface contains functions to interface with metadata database."""
 
+import json
+import os
+import threading
 from typing import Any, Union
 
-from sqlalchemy import Engine, create_engine
-from sqlalchemy.orm import Session
+from sqlalchemy import Column, Engine, create_engine, event, func, inspect, select
+from sqlalchemy.orm import Session, load_only, selectinload
 
-from db.models import Base, BaseModel, ColumnStats, FileMetadata, FileStats, Tag
+from db.models import Base, BaseModel, ColumnStats, FileMetadata, FileStats, Tag, TreeChange
 
 
 def _name_to_model(model_name: str) -> Union["BaseModel", None]:
@@ -19,17 +22,144 @@ def _name_to_model(model_name: str) -> Union["BaseModel", None]:
             return FileStats
         case "column_stats":
             return ColumnStats
+        case "tree_change":
+            return TreeChange
         case _:
             return None
 
 
-def make_engine(db_path: str) -> Engine:
-    """Create a new engine for the database."""
+# Connection profiles are the PRAGMAs applied to every new SQLite connection.
+# "wal" lets readers run alongside a committing writer and only fsyncs at checkpoints,
+# "durable" keeps WAL but fsyncs every commit, and "none" leaves SQLite's defaults.
+SQLITE_PROFILES: dict[str, dict[str, str | int]] = {
+    "none": {},
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,
+        "mmap_size": 0,
+        "busy_timeout": 10000,
+        "temp_store": "DEFAULT",
+    },
+}
+SQLITE_PROFILE = os.environ.get("SQLITE_PROFILE", "wal")
+
+_ENGINES: dict[str, Engine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_sqlite_pragmas(profile: str) -> dict[str, str | int]:
+    """Get the PRAGMAs for a SQLite connection profile."""
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile '{profile}'")
+    return SQLITE_PROFILES[profile]
+
+
+def make_engine(db_path: str, profile: str | None = None) -> Engine:
+    """Create a new engine for the database.
+    The connection profile defaults to the SQLITE_PROFILE environment variable."""
+    pragmas = get_sqlite_pragmas(SQLITE_PROFILE if profile is None else profile)
     engine = create_engine(f"sqlite:///{db_path}")
+    if pragmas:
+
+        @event.listens_for(engine, "connect")
+        def _apply_pragmas(dbapi_connection, _connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
     Base.metadata.create_all(engine)
     return engine
 
 
+def get_engine(db_path: str) -> Engine:
+    """Get the process-wide engine for the database, creating it on first use.
+    The schema is only created when the engine is first made, so later requests
+    reuse the engine's connection pool without touching the schema."""
+    engine = _ENGINES.get(db_path)
+    if engine is not None:
+        return engine
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(db_path)
+        if engine is None:
+            engine = make_engine(db_path)
+            _ENGINES[db_path] = engine
+    return engine
+
+
+def dispose_engine(db_path: str | None = None, close: bool = True):
+    """Dispose of the registered engine for db_path, or every engine if db_path is None.
+    The next get_engine call re-creates the engine. Pass close=False after a fork so
+    the child drops the pooled connections inherited from the parent without closing them."""
+    with _ENGINES_LOCK:
+        db_paths = list(_ENGINES) if db_path is None else [db_path]
+        for path in db_paths:
+            engine = _ENGINES.pop(path, None)
+            if engine is not None:
+                engine.dispose(close=close)
+
+
+def _reset_engines_after_fork():
+    """Drop engines inherited from the parent process in a forked child."""
+    global _ENGINES_LOCK  # pylint: disable=global-statement
+    _ENGINES_LOCK = threading.Lock()
+    dispose_engine(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_engines_after_fork)
+
+
+def _add_column_ddl(engine: Engine, table_name: str, column: Column) -> str:
+    """Build the ALTER TABLE statement that adds a column to an existing table.
+    SQLite cannot add a NOT NULL column without a default, so the column is only
+    declared NOT NULL when it has a scalar default to backfill existing rows with."""
+    column_type = column.type.compile(dialect=engine.dialect)
+    ddl = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}"
+    if column.default is not None and column.default.is_scalar:
+        ddl += f" DEFAULT {column.default.arg!r}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def migrate_schema(engine: Engine) -> list[str]:
+    """Migrate an existing database to the current models.
+    Creates missing tables, adds missing columns and creates missing indexes.
+    Returns a description of each change that was applied."""
+    applied = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                table.create(connection)
+                applied.append(f"Created table {table.name}.")
+                continue
+
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    connection.exec_driver_sql(_add_column_ddl(engine, table.name, column))
+                    applied.append(f"Added column {table.name}.{column.name}.")
+
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    applied.append(f"Created index {index.name}.")
+    return applied
+
+
 def get_all_of_model(engine: Engine, model_name: str) -> None | list[dict[str, Any]]:
     """Get all objects of a given model from the database."""
     model = _name_to_model(model_name)
@@ -39,6 +169,159 @@ def get_all_of_model(engine: Engine, model_name: str) -> None | list[dict[str, A
         return [object.to_dict() for object in session.query(model).all()]
 
 
+def get_tree_entries(engine: Engine) -> list[dict[str, Any]]:
+    """Get the path and tags of every file for the directory tree.
+    Tags are loaded with a single extra query and file stats are never loaded,
+    so the cost grows with the number of files rather than the number of columns."""
+    with Session(engine) as session:
+        files = session.scalars(
+            select(FileMetadata)
+            .options(
+                load_only(FileMetadata.path),
+                selectinload(FileMetadata.tags).load_only(Tag.name),
+            )
+            .order_by(FileMetadata.id)
+        ).all()
+        return [{"path": file.path, "tags": file.get_tags()} for file in files]
+
+
+def _prefix_range_end(prefix: str) -> str:
+    """Get the smallest string greater than every string that starts with prefix.
+    prefix always ends in "/", so bumping that character gives the end of the range."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def get_folder_children(
+    engine: Engine, folder: str, cursor: str | None, limit: int
+) -> tuple[list[dict[str, Any]], str | None]:
+    """Get up to limit immediate children of a folder, in path order, and the cursor of
+    the next page or None if this is the last page.
+    Every query is a range scan of the path index. Runs of files are read in batches and
+    each subfolder is counted and then skipped over, so a page never reads the files
+    nested below the subfolders in it."""
+    prefix = f"{folder}/" if folder else ""
+    in_folder = [FileMetadata.path < _prefix_range_end(prefix)] if prefix else []
+    seek = cursor or prefix
+    children = []
+    file_paths = []
+    with Session(engine) as session:
+        while len(children) < limit:
+            paths = session.scalars(
+                select(FileMetadata.path)
+                .where(FileMetadata.path >= seek, *in_folder)
+                .order_by(FileMetadata.path)
+                .limit(limit - len(children))
+            ).all()
+            if not paths:
+                break
+            for path in paths:
+                name, separator, _ = path[len(prefix) :].partition("/")
+                if not separator:
+                    children.append({"type": "file", "name": name, "full-path": path})
+                    file_paths.append(path)
+                    seek = path + "\x00"
+                    continue
+                sub_prefix = f"{prefix}{name}/"
+                seek = _prefix_range_end(sub_prefix)
+                file_count = session.scalar(
+                    select(func.count())
+                    .select_from(FileMetadata)
+                    .where(FileMetadata.path >= sub_prefix, FileMetadata.path < seek)
+                )
+                children.append(
+                    {
+                        "type": "folder",
+                        "name": name,
+                        "full-path": prefix + name,
+                        "file_count": file_count,
+                    }
+                )
+                break
+
+        next_cursor = None
+        if len(children) >= limit:
+            next_path = session.scalar(
+                select(FileMetadata.path).where(FileMetadata.path >= seek, *in_folder).limit(1)
+            )
+            next_cursor = seek if next_path is not None else None
+
+        tags = {}
+        if file_paths:
+            files = session.scalars(
+                select(FileMetadata)
+                .options(
+                    load_only(FileMetadata.path),
+                    selectinload(FileMetadata.tags).load_only(Tag.name),
+                )
+                .where(FileMetadata.path.in_(file_paths))
+            )
+            tags = {file.path: file.get_tags() for file in files}
+    for child in children:
+        if child["type"] == "file":
+            child["tags"] = tags.get(child["full-path"], [])
+    return children, next_cursor
+
+
+def get_tag_names(engine: Engine) -> list[str]:
+    """Get the names of all tags."""
+    with Session(engine) as session:
+        return list(session.scalars(select(Tag.name).order_by(Tag.id)))
+
+
+def record_tree_change(
+    session: Session, action: str, path: str, tags: list[str], dest: str | None = None
+) -> dict[str, Any]:
+    """Append a change to the tree change log.
+    The change is flushed so its version is known, and is committed with the session."""
+    change = TreeChange(action=action, path=path, dest=dest, tags=json.dumps(tags))
+    session.add(change)
+    session.flush()
+    return change.to_dict()
+
+
+def get_tree_version(engine: Engine) -> int:
+    """Get the latest tree version, or 0 if the tree has never changed."""
+    with Session(engine) as session:
+        return session.scalar(select(func.max(TreeChange.id))) or 0
+
+
+def get_tree_changes(engine: Engine, since: int, limit: int) -> list[dict[str, Any]]:
+    """Get up to limit tree changes made after version since, oldest first."""
+    with Session(engine) as session:
+        changes = session.scalars(
+            select(TreeChange).where(TreeChange.id > since).order_by(TreeChange.id).limit(limit)
+        )
+        return [change.to_dict() for change in changes]
+
+
+def get_files_awaiting_analysis(
+    session: Session, data_file_path: str | None = None
+) -> list[FileMetadata]:
+    """Get the files whose data file has not been analyzed yet, optionally only those
+    using one data file."""
+    query = session.query(FileMetadata).filter(FileMetadata.status == "pending")
+    if data_file_path is not None:
+        query = query.filter(FileMetadata.data_file_path == data_file_path)
+    return query.order_by(FileMetadata.id).all()
+
+
+def count_data_file_references(session: Session, data_file_path: str) -> int:
+    """Count the files using a data file, which is only deleted once none do."""
+    return session.query(FileMetadata).filter(FileMetadata.data_file_path == data_file_path).count()
+
+
+def get_analyzed_file(session: Session, data_file_path: str) -> FileMetadata | None:
+    """Get a file using a data file whose stats are ready, so that other files using the
+    same data file can share them."""
+    return (
+        session.query(FileMetadata)
+        .filter(FileMetadata.data_file_path == data_file_path, FileMetadata.status == "ready")
+        .filter(FileMetadata.file_stats.has())
+        .order_by(FileMetadata.id)
+        .first()
+    )
+
+
 def get_db_object_by_key(
     session: Session, model_name: str, key: str, value: Any
 ) -> None | FileMetadata | Tag:
@@ -83,17 +366,25 @@ def get_object_counts(engine: Engine) -> dict[str, int]:
         return {table.name: session.query(table).count() for table in Base.metadata.tables.values()}
 
 
+def update_db_object(session: Session, model_name: str, new_data: dict[str, Any]) -> str:
+    """Update object in db within an open session, without committing."""
+    model = _name_to_model(model_name)
+    if not model:
+        return f"Could not find model class with name: '{model_name}'"
+
+    primary_key = model.get_primary_key()
+    model_object = model.find_by_primary_key(session, new_data.get(primary_key))
+    if not model_object:
+        return "Could not find model object."
+    model_object.update_object(session, new_data)
+    return ""
+
+
 def update_object(engine: Engine, model_name: str, new_data: dict[str, Any]) -> str:
     """Update object in db."""
     with Session(engine) as session:
-        model = _name_to_model(model_name)
-        if not model:
-            return f"Could not find model class with name: '{model_name}'"
-
-        primary_key = model.get_primary_key()
-        model_object = model.find_by_primary_key(session, new_data.get(primary_key))
-        if not model_object:
-            return "Could not find model object."
-        model_object.update_object(session, new_data)
+        error = update_db_object(session, model_name, new_data)
+        if error:
+            return error
         session.commit()
     return ""
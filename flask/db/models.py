@@ -1,8 +1,9 @@
 """Module models contains the models for the metadata database."""
 
+import json
 from typing import Any, Union
 
-from sqlalchemy import Column, Float, ForeignKey, Integer, String, Table
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, LargeBinary, String, Table
 from sqlalchemy.orm import (
     Mapped,
     Session,
@@ -18,6 +19,7 @@ file_tags = Table(
     Base.metadata,
     Column("file_id", Integer, ForeignKey("file_metadata.id"), primary_key=True),
     Column("tag_id", Integer, ForeignKey("tag.id"), primary_key=True),
+    Index("ix_file_tags_tag_id", "tag_id"),
 )
 
 
@@ -81,9 +83,14 @@ class FileMetadata(BaseModel):  # pylint: disable=too-few-public-methods
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String, nullable=False)
-    path: Mapped[str] = mapped_column(String, nullable=False)
+    path: Mapped[str] = mapped_column(String, nullable=False, unique=True, index=True)
     data_file_type: Mapped[str] = mapped_column(String, nullable=False)
-    data_file_path: Mapped[str] = mapped_column(String, nullable=False)
+    # Uploaded data files are named by the hash of their content, so files with the same
+    # content share a data file.
+    data_file_path: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    # Analysis status of the data file: "pending", "ready" or "failed".
+    status: Mapped[str] = mapped_column(String, nullable=False, default="ready")
+    analysis_error: Mapped[str] = mapped_column(String, nullable=True)
 
     tags: Mapped[list["Tag"]] = relationship(
         "Tag",
@@ -155,7 +162,7 @@ class Tag(BaseModel):  # pylint: disable=too-few-public-methods
     _primary_key = "name"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String, nullable=False)
+    name: Mapped[str] = mapped_column(String, nullable=False, unique=True, index=True)
 
     file_metadata: Mapped[list["FileMetadata"]] = relationship(
         "FileMetadata",
@@ -173,7 +180,7 @@ class FileStats(BaseModel):  # pylint: disable=too-few-public-methods
     _primary_key = "path"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    path: Mapped[str] = mapped_column(String, nullable=False)
+    path: Mapped[str] = mapped_column(String, nullable=False, index=True)
     file_metadata_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("file_metadata.id"), unique=True, nullable=True
     )
@@ -191,13 +198,16 @@ class FileStats(BaseModel):  # pylint: disable=too-few-public-methods
         back_populates="file_stats",
     )
 
-    def to_dict(self) -> dict[str, Any]:
-        """Converts the file stats to a dictionary."""
+    def to_dict(self, include_sketches: bool = False) -> dict[str, Any]:
+        """Converts the file stats to a dictionary, leaving out the serialized sketches of
+        its columns unless include_sketches is set."""
         return {
             "path": self.path,
             "num_columns": self.num_columns,
             "num_rows": self.num_rows,
-            "column_stats": [column_stat.to_dict() for column_stat in self.column_stats],
+            "column_stats": [
+                column_stat.to_dict(include_sketches) for column_stat in self.column_stats
+            ],
         }
 
     @classmethod
@@ -241,11 +251,20 @@ class ColumnStats(BaseModel):  # pylint: disable=too-few-public-methods
     """Column stats model."""
 
     __tablename__ = "column_stats"
+    __table_args__ = (
+        Index(
+            "ix_column_stats_file_stats_id_column_name",
+            "file_stats_id",
+            "column_name",
+            unique=True,
+        ),
+    )
     _primary_key = "column_name"
+    _BINARY_COLUMNS = ["distinct_sketch", "quantile_sketch", "histogram", "top_values"]
 
     id: Mapped[int] = mapped_column(primary_key=True)
     file_stats_id: Mapped[int] = mapped_column(Integer, ForeignKey("file_stats.id"), nullable=True)
-    column_name: Mapped[str] = mapped_column(String, nullable=False)
+    column_name: Mapped[str] = mapped_column(String, nullable=False, index=True)
     data_type: Mapped[str] = mapped_column(String, nullable=False)
     num_rows: Mapped[int] = mapped_column(Integer, nullable=False)
     num_unique_values: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -262,13 +281,52 @@ class ColumnStats(BaseModel):  # pylint: disable=too-few-public-methods
     # Categorical stats
     num_empty_values: Mapped[int] = mapped_column(Integer, default=0)
 
+    # Serialized sketches, see data.sketches. The distinct sketch is only kept by
+    # approximate analysis, the quantile sketch and histogram only for numeric columns and
+    # the top values only for string columns.
+    distinct_sketch: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
+    quantile_sketch: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
+    histogram: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
+    top_values: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
+
     file_stats: Mapped["FileStats"] = relationship(
         "FileStats",
         back_populates="column_stats",
     )
 
-    def to_dict(self) -> dict[str, Any]:
-        """Converts the column stats to a dictionary."""
+    def to_dict(self, include_sketches: bool = False) -> dict[str, Any]:
+        """Converts the column stats to a dictionary, leaving out the serialized sketches
+        unless include_sketches is set."""
         output = super().to_dict()
         output.pop("file_stats_id")
+        if not include_sketches:
+            for column in self._BINARY_COLUMNS:
+                output.pop(column)
         return output
+
+
+class TreeChange(BaseModel):  # pylint: disable=too-few-public-methods
+    """Tree change model.
+    Append-only log of changes to the directory tree. The id of each change is the tree
+    version it produced, so clients can sync with the changes after a version they hold.
+    """
+
+    __tablename__ = "tree_change"
+    __table_args__ = {"sqlite_autoincrement": True}
+    _primary_key = "id"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    action: Mapped[str] = mapped_column(String, nullable=False)
+    path: Mapped[str] = mapped_column(String, nullable=False)
+    dest: Mapped[str] = mapped_column(String, nullable=True)
+    tags: Mapped[str] = mapped_column(String, nullable=False, default="[]")
+
+    def to_dict(self) -> dict[str, Any]:
+        """Converts the tree change to a dictionary."""
+        return {
+            "version": self.id,
+            "action": self.action,
+            "path": self.path,
+            "dest": self.dest,
+            "tags": json.loads(self.tags),
+        }
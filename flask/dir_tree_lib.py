@@ -1,11 +1,19 @@
 """Module dir_tree_lib contains functions to view and modify the folder tree."""
 
+import copy as copy_lib
 import os
-from typing import Any
+import threading
+from collections.abc import Iterator
+from typing import Any, BinaryIO
 
+import analysis_queue
 import logging_helper
+import tree_cache
+import upload_staging
+from data import aggregator, downsample, sketches
 from db import data_interface, db_interface
 from sqlalchemy import Engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 VERBOSE = os.environ.get("VERBOSE_LOGGING", "false").lower() == "true"
@@ -14,13 +22,55 @@ DB_PATH = os.environ.get("DB_PATH", os.path.join("untracked", "metadata.sqlite")
 DATA_FILE_DIR = os.environ.get("DATA_FILE_DIR", os.path.join("untracked", "data"))
 
 SUPPORTED_FILE_TYPES = ["csv", "json"]
+CHANGES_PAGE_SIZE = int(os.environ.get("CHANGES_PAGE_SIZE", "1000"))
+FOLDER_PAGE_SIZE = int(os.environ.get("FOLDER_PAGE_SIZE", "500"))
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", str(min(os.cpu_count() or 1, 8))))
+ANALYSIS_QUEUE_WORKERS = int(os.environ.get("ANALYSIS_QUEUE_WORKERS", "2"))
+ANALYSIS_QUEUE_SIZE = int(os.environ.get("ANALYSIS_QUEUE_SIZE", "16"))
+# Largest data file that can be uploaded, in bytes, or 0 for no limit.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", "0"))
+# Most files an uploaded archive can hold, and most bytes they can expand to in total.
+MAX_ARCHIVE_ENTRIES = int(os.environ.get("MAX_ARCHIVE_ENTRIES", "10000"))
+MAX_ARCHIVE_BYTES = int(os.environ.get("MAX_ARCHIVE_BYTES", str(4 * 1024**3)))
+DEFAULT_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# Held while a data file is stored or deleted along with the files using it, so a data file
+# is never deleted while an upload of the same content starts using it. Other processes are
+# kept out by storing and deleting data files only while the database write lock is held,
+# taken by writing the file metadata first.
+_DATA_FILES_LOCK = threading.Lock()
 
 logger = logging_helper.init_logging(__name__, VERBOSE, LOG_DIRECTORY, "dir_tree_lib.log")
 
 
 def get_all_tags(engine: Engine) -> list[str]:
     """Gets all tags from the database."""
-    return [tag["name"] for tag in db_interface.get_all_of_model(engine, "tag")]
+    return db_interface.get_tag_names(engine)
+
+
+def sync_tree_cache(engine: Engine) -> tree_cache.TreeCache:
+    """Brings the cached tree up to date with the tree change log, which also holds the
+    changes made by other processes, and returns the cache.
+    The tree is only read from the database the first time it is requested."""
+    cache = tree_cache.get_tree_cache(engine)
+    with cache.lock:
+        if not cache.loaded:
+            version = db_interface.get_tree_version(engine)
+            cache.load(db_interface.get_tree_entries(engine), get_all_tags(engine), version)
+            return cache
+    since = cache.version
+    while True:
+        tree_changes = db_interface.get_tree_changes(engine, since, CHANGES_PAGE_SIZE)
+        for change in tree_changes:
+            cache.apply_change(change)
+            since = change["version"]
+        if len(tree_changes) < CHANGES_PAGE_SIZE:
+            return cache
+
+
+def get_tree_snapshot(engine: Engine) -> tuple[dict[str, dict[str, Any] | list[str]], int]:
+    """Gets the cached tree and tags with their version, up to date with the database."""
+    return sync_tree_cache(engine).snapshot()
 
 
 def list_tree(
@@ -28,31 +78,32 @@ def list_tree(
 ) -> dict[str, dict[str, Any] | list[str]]:
     """List all files and folders in the tree."""
     logger.debug("control=%s", "list")
-
-    files = db_interface.get_all_of_model(engine, "file_metadata")
-    tags = get_all_tags(engine)
-
-    structure = {}
-    for file in files:
-        path = file["path"].split("/")
-        cur_folder = structure
-        cur_path = ""
-        for folder in path[:-1]:
-            cur_path = os.path.join(cur_path, folder) if cur_path else folder
-            if folder not in cur_folder:
-                cur_folder[folder] = {
-                    "type": "folder",
-                    "full-path": cur_path,
-                    "children": {},
-                }
-            cur_folder = cur_folder[folder]["children"]
-        cur_folder[path[-1]] = {
-            "type": "file",
-            "full-path": file["path"],
-            "tags": file["tags"],
-        }
-
-    return {"tree": structure, "tags": tags}
+    return get_tree_snapshot(engine)[0]
+
+
+def list_folder(engine: Engine, request_json: dict[str, Any]) -> dict[str, Any]:
+    """List one page of the immediate children of a folder."""
+    folder = request_json.get("folder", "")
+    cursor = request_json.get("cursor")
+    limit = request_json.get("limit", FOLDER_PAGE_SIZE)
+    if not isinstance(folder, str):
+        logger.error("Folder must be a string.")
+        return {"error": "Folder must be a string."}
+    folder = folder.strip("/")
+    if cursor is not None and (
+        not isinstance(cursor, str) or (folder and not cursor.startswith(f"{folder}/"))
+    ):
+        logger.error("Invalid cursor for folder %s.", folder)
+        return {"error": f"Invalid cursor for folder {folder}."}
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        logger.error("Limit must be a positive integer.")
+        return {"error": "Limit must be a positive integer."}
+    logger.debug("control=%s, folder=%s, cursor=%s", "list_folder", folder, cursor)
+
+    children, next_cursor = db_interface.get_folder_children(
+        engine, folder, cursor, min(limit, FOLDER_PAGE_SIZE)
+    )
+    return {"folder": folder, "children": children, "cursor": next_cursor}
 
 
 def tree_delete(
@@ -76,26 +127,37 @@ def tree_delete(
         data_file_path = file_metadata.data_file_path
         data_file_full_path = os.path.join(data_file_dir, data_file_path)
         force = request_json.get("force", False)
-        if not os.path.exists(data_file_full_path):
-            if not force:
-                logger.warning(
-                    "Data file not found for path %s.",
+        with _DATA_FILES_LOCK:
+            data_file_exists = os.path.exists(data_file_full_path)
+            if not data_file_exists:
+                if not force:
+                    logger.warning(
+                        "Data file not found for path %s.",
+                        data_file_path,
+                    )
+                    return {
+                        "error": f"Data file not found for path {data_file_path}.",
+                        "error_type": "file_not_found",
+                    }
+                logger.info(
+                    "Force deleting metadata for missing data file %s.",
                     data_file_path,
                 )
-                return {
-                    "error": f"Data file not found for path {data_file_path}.",
-                    "error_type": "file_not_found",
-                }
-            logger.info(
-                "Force deleting metadata for missing data file %s.",
-                data_file_path,
-            )
-        else:
-            os.remove(data_file_full_path)
-            logger.info("Deleted data file %s.", data_file_full_path)
 
-        session.delete(file_metadata)
-        session.commit()
+            change = db_interface.record_tree_change(
+                session, "remove", path, file_metadata.get_tags()
+            )
+            session.delete(file_metadata)
+            session.flush()
+            # Copies and identical uploads share the data file, so it is only deleted along
+            # with the last file using it.
+            if data_file_exists and not db_interface.count_data_file_references(
+                session, data_file_path
+            ):
+                data_interface.delete_data_file(data_file_path, data_file_dir)
+                logger.info("Deleted data file %s.", data_file_full_path)
+            session.commit()
+    tree_cache.get_tree_cache(engine).apply_change(change)
     return {}
 
 
@@ -124,10 +186,22 @@ def move(engine: Engine, request_json: dict[str, Any]) -> dict[str, str]:
             logger.error("Dest file metadata already exists for path %s.", dest)
             return {"error": f"Dest file metadata already exists for path {dest}."}
         source_file_metadata.path = dest
+        change = db_interface.record_tree_change(
+            session, "move", source, source_file_metadata.get_tags(), dest=dest
+        )
         session.commit()
+    tree_cache.get_tree_cache(engine).apply_change(change)
     return {}
 
 
+def _shared_file_stats(file_metadata: Any, path: str) -> dict[str, Any] | None:
+    """Gets the stats of a file, with their sketches, for another file at path using the
+    same data file."""
+    if not file_metadata.file_stats:
+        return None
+    return {**file_metadata.file_stats.to_dict(include_sketches=True), "path": path}
+
+
 def copy(engine: Engine, request_json: dict[str, Any]) -> dict[str, str]:
     """Moves a file."""
     source = request_json.get("source", "")
@@ -158,25 +232,53 @@ def copy(engine: Engine, request_json: dict[str, Any]) -> dict[str, str]:
             {
                 **source_file_metadata.to_dict(),
                 "path": dest,
-                "file_stats": {
-                    **source_file_metadata.file_stats.to_dict(),
-                    "path": dest,
-                },
+                "status": source_file_metadata.status,
+                "analysis_error": source_file_metadata.analysis_error,
+                "file_stats": _shared_file_stats(source_file_metadata, dest),
             },
         )
+        change = db_interface.record_tree_change(
+            session, "add", dest, source_file_metadata.get_tags()
+        )
         session.commit()
+    tree_cache.get_tree_cache(engine).apply_change(change)
     return {}
 
 
+def parse_window(request_json: dict[str, Any]) -> tuple[dict[str, Any] | None, str]:
+    """Parses the offset, limit and columns of a data window from a request.
+    Returns None if the request does not ask for a window."""
+    if not {"offset", "limit", "columns"} & request_json.keys():
+        return None, ""
+    offset = request_json.get("offset", 0)
+    limit = request_json.get("limit")
+    columns = request_json.get("columns")
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        return None, "Offset must be a non-negative integer."
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 1):
+        return None, "Limit must be a positive integer."
+    if columns is not None and (
+        not isinstance(columns, list) or not all(isinstance(column, str) for column in columns)
+    ):
+        return None, "Columns must be a list of column names."
+    return {"offset": offset, "limit": limit, "columns": columns}, ""
+
+
 def load(
     engine: Engine, request_json: dict[str, Any], data_file_dir: str = DATA_FILE_DIR
 ) -> dict[str, str | Any]:
-    """Loads a data file."""
+    """Loads a data file.
+    If the request has an offset, limit or columns, only that window of the data is
+    loaded and the total number of rows is returned with it."""
     path = request_json.get("path", "")
     if not path:
         logger.error("Path cannot be empty.")
         return {"error": "Path cannot be empty."}
-    logger.debug("control=%s, path=%s", "load", path)
+    window, error = parse_window(request_json)
+    if error:
+        logger.error(error)
+        return {"error": error}
+    logger.debug("control=%s, path=%s, window=%s", "load", path, window)
     with Session(engine) as session:
         file_metadata = db_interface.get_db_object_by_key(session, "file_metadata", "path", path)
         if file_metadata is None:
@@ -189,13 +291,162 @@ def load(
             logger.error("Data file not found for path %s.", data_file_path)
             return {"error": f"Data file not found for path {data_file_path}."}
 
-        data, error = data_interface.load_data_file(
-            data_file_path, file_metadata.data_file_type, data_file_dir
+        if window is None:
+            data, error = data_interface.load_data_file(
+                data_file_path, file_metadata.data_file_type, data_file_dir
+            )
+            if error:
+                logger.error(error)
+                return {"error": error}
+            return {**file_metadata.to_dict(), "data": data}
+
+        page, error = data_interface.load_data_page(
+            data_file_path,
+            file_metadata.data_file_type,
+            data_file_dir,
+            num_rows=file_metadata.file_stats.num_rows if file_metadata.file_stats else None,
+            **window,
         )
         if error:
             logger.error(error)
             return {"error": error}
-        return {**file_metadata.to_dict(), "data": data}
+        return {
+            **file_metadata.to_dict(),
+            "data": page["data"],
+            "offset": window["offset"],
+            "limit": window["limit"],
+            "total_rows": page["total_rows"],
+        }
+
+
+def parse_query_window(request_args: Any) -> tuple[dict[str, Any] | None, str]:
+    """Parses a data window from query string arguments.
+    Columns are given by repeating the columns argument."""
+    request_json = {}
+    for key in ["offset", "limit"]:
+        if key in request_args:
+            value = request_args[key]
+            request_json[key] = int(value) if value.isdigit() else value
+    if "columns" in request_args:
+        request_json["columns"] = request_args.getlist("columns")
+    return parse_window(request_json)
+
+
+def stream_data(
+    engine: Engine, path: str, request_args: Any, data_file_dir: str = DATA_FILE_DIR
+) -> tuple[dict[str, Any], Iterator[str | bytes] | None]:
+    """Streams a data file.
+    Returns the stream format and total number of rows along with the chunks to send, or
+    an error and no chunks. The database session is closed before any chunk is read."""
+    if not path:
+        logger.error("Path cannot be empty.")
+        return {"error": "Path cannot be empty."}, None
+    stream_format = request_args.get("format")
+    window, error = parse_query_window(request_args)
+    if error:
+        logger.error(error)
+        return {"error": error}, None
+    logger.debug("control=%s, path=%s, window=%s", "stream", path, window)
+    with Session(engine) as session:
+        file_metadata = db_interface.get_db_object_by_key(session, "file_metadata", "path", path)
+        if file_metadata is None:
+            logger.error("File metadata not found for path %s.", path)
+            return {"error": f"File metadata not found for path {path}."}, None
+        data_file_path = file_metadata.data_file_path
+        data_file_type = file_metadata.data_file_type
+        num_rows = file_metadata.file_stats.num_rows if file_metadata.file_stats else None
+    if stream_format is None:
+        stream_format = data_interface.DEFAULT_STREAM_FORMATS.get(data_file_type, "ndjson")
+
+    chunks, error = data_interface.stream_data_file(
+        data_file_path, data_file_type, data_file_dir, stream_format, **(window or {})
+    )
+    if error:
+        logger.error(error)
+        return {"error": error}, None
+    return {"format": stream_format, "total_rows": num_rows}, chunks
+
+
+def parse_aggregation(request_json: dict[str, Any]) -> tuple[dict[str, Any] | None, str]:
+    """Parses the chart type, columns, number of bins, x type and downsampling of an
+    aggregation request."""
+    chart_type = request_json.get("chart_type")
+    columns = request_json.get("columns")
+    bins = request_json.get("bins", aggregator.DEFAULT_BINS)
+    x_type = request_json.get("x_type", "numeric")
+    if chart_type not in aggregator.CHART_TYPES:
+        return None, f"Unsupported chart type: {chart_type}."
+    if not isinstance(columns, list) or not all(isinstance(column, str) for column in columns):
+        return None, "Columns must be a list of column names."
+    fewest, most = aggregator.COLUMN_COUNTS[chart_type]
+    if len(columns) < fewest or (most is not None and len(columns) > most):
+        count = str(fewest) if fewest == most else f"at least {fewest}"
+        return None, f"A {chart_type} chart takes {count} columns."
+    if not isinstance(bins, int) or isinstance(bins, bool) or not 1 <= bins <= aggregator.MAX_BINS:
+        return None, f"Bins must be an integer from 1 to {aggregator.MAX_BINS}."
+    if x_type not in aggregator.X_TYPES:
+        return None, f"Unsupported x type: {x_type}."
+    max_points = request_json.get("max_points")
+    method = request_json.get("downsample", "lttb")
+    if max_points is not None and (
+        not isinstance(max_points, int)
+        or isinstance(max_points, bool)
+        or max_points < aggregator.MIN_POINTS
+    ):
+        return None, f"Max points must be an integer of at least {aggregator.MIN_POINTS}."
+    if method not in downsample.METHODS:
+        return None, f"Unsupported downsampling method: {method}."
+    return {
+        "chart_type": chart_type,
+        "columns": columns,
+        "bins": bins,
+        "x_type": x_type,
+        "max_points": max_points,
+        "method": method,
+    }, ""
+
+
+def aggregate(
+    engine: Engine, request_json: dict[str, Any], data_file_dir: str = DATA_FILE_DIR
+) -> dict[str, Any]:
+    """Aggregates the columns of a data file into the series of a chart, so only the
+    series are sent rather than every row."""
+    path = request_json.get("path", "")
+    if not path:
+        logger.error("Path cannot be empty.")
+        return {"error": "Path cannot be empty."}
+    params, error = parse_aggregation(request_json)
+    if error:
+        logger.error(error)
+        return {"error": error}
+    logger.debug("control=%s, path=%s, params=%s", "aggregate", path, params)
+    with Session(engine) as session:
+        file_metadata = db_interface.get_db_object_by_key(session, "file_metadata", "path", path)
+        if file_metadata is None:
+            logger.error("File metadata not found for path %s.", path)
+            return {"error": f"File metadata not found for path {path}."}
+        data_file_path = file_metadata.data_file_path
+        data_file_type = file_metadata.data_file_type
+
+    columns, error = data_interface.load_data_columns(
+        data_file_path, data_file_type, data_file_dir, params["columns"]
+    )
+    if error:
+        logger.error(error)
+        return {"error": error}
+    return {
+        "path": path,
+        "chart_type": params["chart_type"],
+        "num_rows": len(columns[0]),
+        "data": aggregator.aggregate(
+            params["chart_type"],
+            columns,
+            params["bins"],
+            params["x_type"],
+            params["max_points"],
+            params["method"],
+        ),
+    }
 
 
 def upload(
@@ -213,52 +464,517 @@ def upload(
         logger.error("File has no filename.")
         return {"error": "File has no filename."}
 
+    archive_type = data_interface.archive_type(file.filename)
     extension = os.path.splitext(file.filename)[1].replace(".", "").lower()
-    if extension not in SUPPORTED_FILE_TYPES:
+    if archive_type is None and extension not in SUPPORTED_FILE_TYPES:
         logger.error("File type %s is not supported.", extension)
         return {"error": f"File type {extension} is not supported."}
 
     if "path" not in request_form:
         logger.error("Path not found in request.")
         return {"error": "Path not found in request."}
-    path = request_form["path"]
+    if archive_type is not None:
+        return _add_archive(engine, request_form["path"], archive_type, file.stream, data_file_dir)
+    return _add_data_file(engine, request_form["path"], extension, file.stream, data_file_dir)
+
+
+def start_chunked_upload(
+    engine: Engine, request_json: dict[str, Any], data_file_dir: str = DATA_FILE_DIR
+) -> dict[str, Any]:
+    """Starts a resumable upload of a file sent in chunks, which are then put in any order
+    and finished once all have arrived."""
+    path = request_json.get("path", "")
+    filename = request_json.get("filename", "")
+    size = request_json.get("size")
+    if not path:
+        logger.error("Path not found in request.")
+        return {"error": "Path not found in request."}
+    if not filename:
+        logger.error("File has no filename.")
+        return {"error": "File has no filename."}
+    extension = os.path.splitext(filename)[1].replace(".", "").lower()
+    if extension not in SUPPORTED_FILE_TYPES:
+        logger.error("File type %s is not supported.", extension)
+        return {"error": f"File type {extension} is not supported."}
+    if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+        logger.error("Size must be a non-negative integer.")
+        return {"error": "Size must be a non-negative integer."}
+    if MAX_UPLOAD_BYTES and size > MAX_UPLOAD_BYTES:
+        logger.error("Upload of %d bytes is over the limit.", size)
+        return {"error": f"File is larger than the upload limit of {MAX_UPLOAD_BYTES} bytes."}
+
+    with Session(engine) as session:
+        if db_interface.get_db_object_by_key(session, "file_metadata", "path", path) is not None:
+            logger.error("Path %s already exists.", path)
+            return {"error": f"Path {path} already exists."}
+
+    removed = upload_staging.remove_stale_uploads(data_file_dir)
+    if removed:
+        logger.info("Removed %d abandoned uploads.", removed)
+    chunk_size = upload_staging.UPLOAD_CHUNK_SIZE
+    upload_id = upload_staging.create_upload(
+        data_file_dir,
+        {"path": path, "data_file_type": extension, "size": size, "chunk_size": chunk_size},
+    )
+    logger.info("Started upload %s of %d bytes to %s.", upload_id, size, path)
+    return {
+        "upload_id": upload_id,
+        "chunk_size": chunk_size,
+        "num_chunks": upload_staging.num_chunks(size, chunk_size),
+    }
+
+
+def chunked_upload_status(upload_id: str, data_file_dir: str = DATA_FILE_DIR) -> dict[str, Any]:
+    """Gets a resumable upload with the chunks it is missing."""
+    upload = upload_staging.get_upload(data_file_dir, upload_id)
+    if upload is None:
+        logger.error("Upload %s not found.", upload_id)
+        return {"error": f"Upload {upload_id} not found."}
+    return {"upload_id": upload_id, **upload}
+
+
+def upload_chunk(
+    upload_id: str, index: int, stream: BinaryIO, data_file_dir: str = DATA_FILE_DIR
+) -> dict[str, str]:
+    """Puts a chunk of a resumable upload, replacing it if it was put before."""
+    error = upload_staging.write_chunk(data_file_dir, upload_id, index, stream)
+    if error:
+        logger.error(error)
+        return {"error": error}
+    return {}
 
+
+def finish_chunked_upload(
+    engine: Engine, upload_id: str, data_file_dir: str = DATA_FILE_DIR
+) -> dict[str, str]:
+    """Assembles the chunks of a resumable upload into a data file and adds the uploaded
+    file. If that fails, the chunks are kept so that finishing can be retried."""
+    upload, error = upload_staging.start_finishing(data_file_dir, upload_id)
+    if upload is None:
+        logger.error(error)
+        return {"error": error}
+    chunks = upload_staging.open_chunks(data_file_dir, upload_id, upload)
+    result = {"error": f"Upload {upload_id} failed."}
+    try:
+        result = _add_data_file(
+            engine, upload["path"], upload["data_file_type"], chunks, data_file_dir
+        )
+    finally:
+        chunks.close()
+        upload_staging.stop_finishing(data_file_dir, upload_id, "error" not in result)
+    return result
+
+
+def cancel_chunked_upload(upload_id: str, data_file_dir: str = DATA_FILE_DIR) -> dict[str, str]:
+    """Cancels a resumable upload, deleting the chunks put so far."""
+    if not upload_staging.delete_upload(data_file_dir, upload_id):
+        logger.error("Upload %s not found.", upload_id)
+        return {"error": f"Upload {upload_id} not found."}
+    return {}
+
+
+def _add_data_file(
+    engine: Engine, path: str, extension: str, stream: BinaryIO, data_file_dir: str
+) -> dict[str, str]:
+    """Saves the content of an uploaded file as a data file and adds a file using it at path,
+    queueing its analysis unless a file with the same content was analyzed already."""
     with Session(engine) as session:
         file_metadata = db_interface.get_db_object_by_key(session, "file_metadata", "path", path)
         if file_metadata is not None:
             logger.error("Path %s already exists.", path)
             return {"error": f"Path {path} already exists."}
 
-        data_filename = data_interface.new_data_file_path(extension, data_file_dir)
-        full_path = os.path.join(data_file_dir, data_filename)
+        queue = get_analysis_queue(engine)
+        if not queue.reserve():
+            logger.error("Analysis queue is full.")
+            return {"error": "Analysis queue is full. Try again later."}
+        analyzed = None
+        tmp_path = None
+        try:
+            try:
+                tmp_path, data_filename = data_interface.save_data_file(
+                    stream, extension, data_file_dir, MAX_UPLOAD_BYTES or None
+                )
+            except ValueError as e:
+                logger.error("Upload file at %s failed: %s", path, e)
+                queue.cancel()
+                return {"error": str(e)}
+            with _DATA_FILES_LOCK:
+                file_metadata = db_interface.create_or_get_object(
+                    session,
+                    "file_metadata",
+                    {
+                        "name": os.path.basename(path),
+                        "path": path,
+                        "data_file_type": extension,
+                        "data_file_path": data_filename,
+                        "status": "pending",
+                        "tags": [],
+                    },
+                )
+                if data_interface.store_data_file(tmp_path, data_filename, data_file_dir):
+                    logger.info("Upload file at %s. Saved data file %s.", path, data_filename)
+                else:
+                    logger.info("Upload file at %s. Reusing data file %s.", path, data_filename)
+                    analyzed = db_interface.get_analyzed_file(session, data_filename)
+                if analyzed is not None:
+                    file_metadata.update_object(
+                        session,
+                        {"status": "ready", "file_stats": _shared_file_stats(analyzed, path)},
+                    )
+                change = db_interface.record_tree_change(session, "add", path, [])
+                session.commit()
+        except IntegrityError:
+            # Another process added a file at path after it was checked.
+            logger.error("Path %s already exists.", path)
+            queue.cancel()
+            return {"error": f"Path {path} already exists."}
+        except BaseException:
+            queue.cancel()
+            raise
+        finally:
+            # Storing the data file moves the temporary file, so it is only left on failure.
+            if tmp_path is not None and os.path.exists(tmp_path):
+                data_interface.delete_data_file(os.path.basename(tmp_path), data_file_dir)
+    tree_cache.get_tree_cache(engine).apply_change(change)
+    if analyzed is None:
+        queue.submit(lambda: analyze_pending_file(engine, data_filename, extension, data_file_dir))
+    else:
+        # The data file was analyzed before, so its stats are shared instead.
+        queue.cancel()
+    return {}
 
-        logger.info("Upload file at %s. Saving data file to %s.", path, full_path)
-        file.save(full_path)
-        file_stats = data_interface.analyze_data_file(extension, full_path)
-        file_stats["path"] = path
 
-        db_interface.create_or_get_object(
-            session,
-            "file_metadata",
-            {
-                "name": os.path.basename(path),
-                "path": path,
-                "data_file_type": extension,
-                "data_file_path": data_filename,
-                "tags": [],
-                "file_stats": file_stats,
-            },
+def _save_archive_entries(
+    engine: Engine, folder: str, archive_type: str, stream: BinaryIO, data_file_dir: str
+) -> tuple[list[dict[str, Any]], list[tuple[dict[str, Any], str, str, str]]]:
+    """Saves the data files of the entries of an archive to temporary files as the archive
+    is read. Returns a report of each entry, with an error for those that cannot be added,
+    and the report, temporary path, data file path and type of each saved entry.
+    Raises ValueError if the archive cannot be read or expands to more than
+    MAX_ARCHIVE_ENTRIES files or MAX_ARCHIVE_BYTES bytes, after removing the saved files."""
+    report: list[dict[str, Any]] = []
+    saved: list[tuple[dict[str, Any], str, str, str]] = []
+    expanded_bytes = 0
+    try:
+        with Session(engine) as session:
+            for name, entry in data_interface.iter_archive_entries(stream, archive_type):
+                if len(report) == MAX_ARCHIVE_ENTRIES:
+                    raise ValueError(f"Archive has more than {MAX_ARCHIVE_ENTRIES} files.")
+                entry_report: dict[str, Any] = {"entry": name}
+                report.append(entry_report)
+                relative_path = data_interface.archive_entry_path(name)
+                if relative_path is None:
+                    entry_report["error"] = f"Entry {name} is outside of the archive."
+                    continue
+                if entry is None:
+                    entry_report["error"] = f"Entry {name} is not a regular file."
+                    continue
+                stem, extension = os.path.splitext(relative_path)
+                extension = extension.replace(".", "").lower()
+                if extension not in SUPPORTED_FILE_TYPES:
+                    entry_report["error"] = f"File type {extension} is not supported."
+                    continue
+                path = f"{folder}/{stem}" if folder else stem
+                entry_report["path"] = path
+                if any(other.get("path") == path for other in report[:-1]) or (
+                    db_interface.get_db_object_by_key(session, "file_metadata", "path", path)
+                ):
+                    entry_report["error"] = f"Path {path} already exists."
+                    continue
+                remaining_bytes = MAX_ARCHIVE_BYTES - expanded_bytes
+                max_size = min(MAX_UPLOAD_BYTES or remaining_bytes, remaining_bytes)
+                try:
+                    tmp_path, data_filename = data_interface.save_data_file(
+                        entry, extension, data_file_dir, max_size
+                    )
+                except ValueError as e:
+                    if max_size == remaining_bytes:
+                        raise ValueError(
+                            f"Archive expands to more than {MAX_ARCHIVE_BYTES} bytes."
+                        ) from e
+                    entry_report["error"] = str(e)
+                    continue
+                expanded_bytes += os.path.getsize(tmp_path)
+                saved.append((entry_report, tmp_path, data_filename, extension))
+    except BaseException as e:
+        for _, tmp_path, _, _ in saved:
+            data_interface.delete_data_file(os.path.basename(tmp_path), data_file_dir)
+        if isinstance(e, data_interface.ARCHIVE_READ_ERRORS):
+            raise ValueError(f"Archive could not be read: {e}") from e
+        raise
+    return report, saved
+
+
+def _add_archive(
+    engine: Engine, folder: str, archive_type: str, stream: BinaryIO, data_file_dir: str
+) -> dict[str, Any]:
+    """Expands an uploaded zip or tar archive into files under folder. The data files of
+    its entries are saved as the archive is read, then all the files are added in one
+    transaction and one analysis job is queued for the new data files. Entries with the
+    same content share one data file and one analysis. Returns a report of each entry."""
+    folder = folder.strip("/")
+    queue = get_analysis_queue(engine)
+    if not queue.reserve():
+        logger.error("Analysis queue is full.")
+        return {"error": "Analysis queue is full. Try again later."}
+    changes = []
+    # The type of each new data file to analyze, once the files are added.
+    to_analyze: dict[str, str] = {}
+    try:
+        try:
+            report, saved = _save_archive_entries(
+                engine, folder, archive_type, stream, data_file_dir
+            )
+        except ValueError as e:
+            logger.error("Upload of archive to %s failed: %s", folder, e)
+            queue.cancel()
+            return {"error": str(e)}
+        logger.info(
+            "Upload archive to %s. Saved %d of %d entries.", folder, len(saved), len(report)
         )
+        try:
+            with Session(engine) as session, _DATA_FILES_LOCK:
+                added = []
+                for entry_report, tmp_path, data_filename, extension in saved:
+                    path = entry_report["path"]
+                    if db_interface.get_db_object_by_key(session, "file_metadata", "path", path):
+                        entry_report["error"] = f"Path {path} already exists."
+                        continue
+                    file_metadata = db_interface.create_or_get_object(
+                        session,
+                        "file_metadata",
+                        {
+                            "name": os.path.basename(path),
+                            "path": path,
+                            "data_file_type": extension,
+                            "data_file_path": data_filename,
+                            "status": "pending",
+                            "tags": [],
+                        },
+                    )
+                    added.append((entry_report, file_metadata, tmp_path))
+                    changes.append(db_interface.record_tree_change(session, "add", path, []))
+                session.flush()
+
+                # The file already analyzed for each data file, or None if it needs analysis.
+                analyzed_files: dict[str, Any] = {}
+                for entry_report, file_metadata, tmp_path in added:
+                    data_filename = file_metadata.data_file_path
+                    if data_interface.store_data_file(tmp_path, data_filename, data_file_dir):
+                        analyzed_files[data_filename] = None
+                    elif data_filename not in analyzed_files:
+                        analyzed_files[data_filename] = db_interface.get_analyzed_file(
+                            session, data_filename
+                        )
+                    analyzed = analyzed_files[data_filename]
+                    if analyzed is None:
+                        to_analyze[data_filename] = file_metadata.data_file_type
+                        entry_report["status"] = "pending"
+                        continue
+                    file_metadata.update_object(
+                        session,
+                        {
+                            "status": "ready",
+                            "file_stats": _shared_file_stats(analyzed, file_metadata.path),
+                        },
+                    )
+                    entry_report["status"] = "ready"
+                session.commit()
+        finally:
+            for _, tmp_path, _, _ in saved:
+                if os.path.exists(tmp_path):
+                    data_interface.delete_data_file(os.path.basename(tmp_path), data_file_dir)
+    except BaseException:
+        queue.cancel()
+        raise
+    cache = tree_cache.get_tree_cache(engine)
+    for change in changes:
+        cache.apply_change(change)
+    if to_analyze:
+        queue.submit(lambda: _analyze_pending_files(engine, to_analyze, data_file_dir))
+    else:
+        # Every data file was analyzed before, so their stats are shared instead.
+        queue.cancel()
+    return {"entries": report}
+
+
+def get_analysis_queue(engine: Engine) -> analysis_queue.AnalysisQueue:
+    """Gets the queue that analyzes uploaded files for an engine."""
+    return analysis_queue.get_analysis_queue(engine, ANALYSIS_QUEUE_WORKERS, ANALYSIS_QUEUE_SIZE)
+
+
+def analyze_pending_file(
+    engine: Engine, data_file_path: str, data_file_type: str, data_file_dir: str = DATA_FILE_DIR
+):
+    """Analyzes a data file and stores its stats on every file using it that is waiting for
+    them. If the analysis fails, those files are marked as failed instead. The columnar
+    cache of the data file is then built, once its files are ready."""
+    full_path = os.path.join(data_file_dir, data_file_path)
+    logger.info("Analyzing data file %s.", full_path)
+    file_stats, error = None, None
+    try:
+        file_stats = data_interface.analyze_data_file(data_file_type, full_path, ANALYSIS_WORKERS)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.exception("Analysis of data file %s failed.", full_path)
+        error = f"Analysis failed: {e!r}"
+
+    with Session(engine) as session:
+        for file_metadata in db_interface.get_files_awaiting_analysis(session, data_file_path):
+            if file_stats is None:
+                file_metadata.update_object(session, {"status": "failed", "analysis_error": error})
+                continue
+            file_metadata.update_object(
+                session,
+                {
+                    "status": "ready",
+                    "file_stats": {**copy_lib.deepcopy(file_stats), "path": file_metadata.path},
+                },
+            )
         session.commit()
-    return {}
+
+    try:
+        data_interface.cache_data_file(data_file_type, full_path)
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception("Caching data file %s failed.", full_path)
+
+
+def _analyze_pending_files(engine: Engine, data_files: dict[str, str], data_file_dir: str):
+    """Analyzes data files one after another, given with their types, as one queued job."""
+    for data_file_path, data_file_type in data_files.items():
+        analyze_pending_file(engine, data_file_path, data_file_type, data_file_dir)
+
+
+def resume_analysis(engine: Engine, data_file_dir: str = DATA_FILE_DIR) -> int:
+    """Queues the analysis of data files left pending, such as by a restart.
+    Returns the number of data files queued; files beyond the queue size stay pending."""
+    with Session(engine) as session:
+        data_files = {
+            file_metadata.data_file_path: file_metadata.data_file_type
+            for file_metadata in db_interface.get_files_awaiting_analysis(session)
+        }
+    queue = get_analysis_queue(engine)
+    queued = 0
+    for data_file_path, data_file_type in data_files.items():
+        if not queue.reserve():
+            logger.warning(
+                "Analysis queue is full, %d data files stay pending.", len(data_files) - queued
+            )
+            break
+        queue.submit(
+            lambda data_file_path=data_file_path, data_file_type=data_file_type: (
+                analyze_pending_file(engine, data_file_path, data_file_type, data_file_dir)
+            )
+        )
+        queued += 1
+    return queued
+
+
+def status(engine: Engine, request_json: dict[str, Any]) -> dict[str, Any]:
+    """Gets the analysis status of a file, or of the analysis queue if no path is given."""
+    path = request_json.get("path")
+    logger.debug("control=%s, path=%s", "status", path)
+    if path is None:
+        queue = get_analysis_queue(engine)
+        return {"pending": queue.pending, "capacity": queue.max_pending}
+    with Session(engine) as session:
+        file_metadata = db_interface.get_db_object_by_key(session, "file_metadata", "path", path)
+        if file_metadata is None:
+            logger.error("File metadata not found for path %s.", path)
+            return {"error": f"File metadata not found for path {path}."}
+        result = {"path": path, "status": file_metadata.status}
+        if file_metadata.analysis_error:
+            result["analysis_error"] = file_metadata.analysis_error
+        return result
+
+
+def distribution(engine: Engine, request_json: dict[str, Any]) -> dict[str, Any]:
+    """Gets the distribution of a column from the sketches stored with its stats, without
+    reading the data file: the histogram and quantiles of a numeric column, or the most
+    frequent values of a string column and how much their counts may be low by."""
+    path = request_json.get("path")
+    column = request_json.get("column")
+    quantiles = request_json.get("quantiles", DEFAULT_QUANTILES)
+    logger.debug("control=%s, path=%s, column=%s", "distribution", path, column)
+    if not path:
+        logger.error("Path cannot be empty.")
+        return {"error": "Path cannot be empty."}
+    if not isinstance(column, str):
+        logger.error("Column must be a column name.")
+        return {"error": "Column must be a column name."}
+    if not isinstance(quantiles, list) or not all(
+        isinstance(q, (int, float)) and not isinstance(q, bool) and 0 <= q <= 1 for q in quantiles
+    ):
+        logger.error("Quantiles must be a list of numbers from 0 to 1.")
+        return {"error": "Quantiles must be a list of numbers from 0 to 1."}
+    with Session(engine) as session:
+        file_metadata = db_interface.get_db_object_by_key(session, "file_metadata", "path", path)
+        if file_metadata is None:
+            logger.error("File metadata not found for path %s.", path)
+            return {"error": f"File metadata not found for path {path}."}
+        column_stats = None
+        if file_metadata.file_stats is not None:
+            column_stats = file_metadata.file_stats.find_column(column)
+        if column_stats is None:
+            logger.error("Column %s not found.", column)
+            return {"error": f"Column {column} not found."}
+
+        result = {"path": path, "column": column, "data_type": column_stats.data_type}
+        if column_stats.histogram:
+            result["histogram"] = aggregator.stored_histogram(
+                sketches.Histogram.from_bytes(column_stats.histogram)
+            )
+        if column_stats.quantile_sketch:
+            digest = sketches.TDigest.from_bytes(column_stats.quantile_sketch)
+            result["quantiles"] = [
+                {"key": q, "data": value}
+                for q, value in zip(quantiles, digest.quantiles(quantiles), strict=True)
+            ]
+        if column_stats.top_values:
+            top_values = sketches.TopValues.from_bytes(column_stats.top_values)
+            result["top_values"] = aggregator.stored_top_values(top_values)
+            result["top_values_error"] = top_values.error
+        return result
 
 
 def update(engine: Engine, request_json: dict[str, Any]) -> dict[str, str]:
     """Updates a file."""
     logger.debug("control=%s", "update")
 
-    error = db_interface.update_object(engine, "file_metadata", request_json)
-    if error:
-        logger.error(error)
-        return {"error": error}
+    path = request_json.get("path")
+    tags = request_json.get("tags")
+    with Session(engine) as session:
+        error = db_interface.update_db_object(session, "file_metadata", request_json)
+        if error:
+            logger.error(error)
+            return {"error": error}
+        change = None
+        if tags is not None:
+            change = db_interface.record_tree_change(session, "retag", path, tags)
+        session.commit()
+    if change is not None:
+        tree_cache.get_tree_cache(engine).apply_change(change)
     return {}
+
+
+def changes(engine: Engine, request_json: dict[str, Any]) -> dict[str, Any]:
+    """Gets the tree changes made after the version in the request."""
+    since = request_json.get("since")
+    limit = request_json.get("limit", CHANGES_PAGE_SIZE)
+    if not isinstance(since, int) or isinstance(since, bool) or since < 0:
+        logger.error("Since must be a non-negative integer.")
+        return {"error": "Since must be a non-negative integer."}
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        logger.error("Limit must be a positive integer.")
+        return {"error": "Limit must be a positive integer."}
+    logger.debug("control=%s, since=%s", "changes", since)
+
+    limit = min(limit, CHANGES_PAGE_SIZE)
+    tree_changes = db_interface.get_tree_changes(engine, since, limit + 1)
+    has_more = len(tree_changes) > limit
+    tree_changes = tree_changes[:limit]
+    return {
+        "version": tree_changes[-1]["version"] if tree_changes else since,
+        "changes": tree_changes,
+        "has_more": has_more,
+    }
@@ -17,6 +17,11 @@ if [ ! -f $DB_PATH ]; then
     --db-path $DB_PATH \
     --data-file-dir $DATA_FILE_DIR \
     create
+else
+  python -m db.db_control \
+    --db-path $DB_PATH \
+    --data-file-dir $DATA_FILE_DIR \
+    migrate
 fi
 
 python run.py --debug --port 8080 --host 0.0.0.0
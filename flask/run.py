@@ -3,18 +3,28 @@
 import argparse
 import os
 import sys
+from typing import Any
 
 import dir_tree_lib
-from db import db_interface
+import tree_cache
+from db import data_interface, db_interface
 from flask_cors import CORS
+from sqlalchemy import Engine
 
-from flask import Flask, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory
 
 VERSION_FILE = os.environ.get("VERSION_FILE", os.path.join("flask", "version"))
 STATIC_DIR = os.environ.get("STATIC_DIR", os.path.join(os.path.dirname(__file__), "static"))
 
 app = Flask(__name__, static_folder=STATIC_DIR, static_url_path="")
-CORS(app)
+CORS(app, expose_headers=["ETag", "X-Tree-Version", "X-Total-Rows"])
+
+
+def tree_response(engine: Engine, result: dict[str, Any]) -> Response:
+    """Builds a JSON response that carries the current tree version."""
+    response = jsonify(result)
+    response.headers["X-Tree-Version"] = str(tree_cache.get_tree_cache(engine).version)
+    return response
 
 
 @app.route("/")
@@ -34,41 +44,136 @@ def version():
 def tree_control():  # pylint: disable=too-many-return-statements
     """Handles tree control requests."""
     control = request.json.get("control", "")
+    engine = db_interface.get_engine(dir_tree_lib.DB_PATH)
 
     match control:
         case "list":
-            return dir_tree_lib.list_tree(db_interface.make_engine(dir_tree_lib.DB_PATH))
+            cache = dir_tree_lib.sync_tree_cache(engine)
+            structure, tree_version = cache.snapshot()
+            if request.if_none_match.contains(cache.make_etag(tree_version)):
+                response = Response(status=304)
+                response.set_etag(cache.make_etag(tree_version))
+                return response
+            response = jsonify(structure)
+            response.set_etag(cache.make_etag(tree_version))
+            response.headers["X-Tree-Version"] = str(tree_version)
+            return response
+        case "list_folder":
+            result = dir_tree_lib.list_folder(engine, request.json)
         case "delete":
-            return dir_tree_lib.tree_delete(
-                db_interface.make_engine(dir_tree_lib.DB_PATH),
+            result = dir_tree_lib.tree_delete(
+                engine,
                 request.json,
                 data_file_dir=dir_tree_lib.DATA_FILE_DIR,
             )
         case "move":
-            return dir_tree_lib.move(db_interface.make_engine(dir_tree_lib.DB_PATH), request.json)
+            result = dir_tree_lib.move(engine, request.json)
         case "load":
-            return dir_tree_lib.load(
-                db_interface.make_engine(dir_tree_lib.DB_PATH),
+            result = dir_tree_lib.load(
+                engine,
                 request.json,
                 data_file_dir=dir_tree_lib.DATA_FILE_DIR,
             )
         case "copy":
-            return dir_tree_lib.copy(db_interface.make_engine(dir_tree_lib.DB_PATH), request.json)
+            result = dir_tree_lib.copy(engine, request.json)
         case "update":
-            return dir_tree_lib.update(db_interface.make_engine(dir_tree_lib.DB_PATH), request.json)
+            result = dir_tree_lib.update(engine, request.json)
+        case "changes":
+            result = dir_tree_lib.changes(engine, request.json)
+        case "status":
+            result = dir_tree_lib.status(engine, request.json)
+        case "distribution":
+            result = dir_tree_lib.distribution(engine, request.json)
         case _:
-            return {"error": f"Invalid control: {control}"}
+            result = {"error": f"Invalid control: {control}"}
+    return tree_response(engine, result)
+
+
+@app.route("/api/data/<path:path>")
+def stream_data(path: str):
+    """Streams the rows of a data file without loading the whole file."""
+    engine = db_interface.get_engine(dir_tree_lib.DB_PATH)
+    result, chunks = dir_tree_lib.stream_data(
+        engine,
+        path,
+        request.args,
+        data_file_dir=dir_tree_lib.DATA_FILE_DIR,
+    )
+    if chunks is None:
+        return jsonify(result)
+    response = Response(chunks, mimetype=data_interface.STREAM_MIMETYPES[result["format"]])
+    if result["total_rows"] is not None:
+        response.headers["X-Total-Rows"] = str(result["total_rows"])
+    return response
+
+
+@app.route("/api/aggregate", methods=["POST"])
+def aggregate():
+    """Aggregates the columns of a data file into chart series."""
+    engine = db_interface.get_engine(dir_tree_lib.DB_PATH)
+    return jsonify(
+        dir_tree_lib.aggregate(engine, request.json, data_file_dir=dir_tree_lib.DATA_FILE_DIR)
+    )
 
 
 @app.route("/api/upload", methods=["POST"])
 def upload_file():
     """Uploads a file."""
-    return dir_tree_lib.upload(
-        db_interface.make_engine(dir_tree_lib.DB_PATH),
+    engine = db_interface.get_engine(dir_tree_lib.DB_PATH)
+    result = dir_tree_lib.upload(
+        engine,
         request.files,
         request.form,
         data_file_dir=dir_tree_lib.DATA_FILE_DIR,
     )
+    return tree_response(engine, result)
+
+
+@app.route("/api/upload/chunked", methods=["POST"])
+def start_chunked_upload():
+    """Starts a resumable upload of a file sent in chunks."""
+    engine = db_interface.get_engine(dir_tree_lib.DB_PATH)
+    return jsonify(
+        dir_tree_lib.start_chunked_upload(
+            engine, request.json, data_file_dir=dir_tree_lib.DATA_FILE_DIR
+        )
+    )
+
+
+@app.route("/api/upload/chunked/<upload_id>", methods=["GET"])
+def chunked_upload_status(upload_id: str):
+    """Gets a resumable upload with the chunks it is missing."""
+    return jsonify(
+        dir_tree_lib.chunked_upload_status(upload_id, data_file_dir=dir_tree_lib.DATA_FILE_DIR)
+    )
+
+
+@app.route("/api/upload/chunked/<upload_id>/<int:index>", methods=["PUT"])
+def upload_chunk(upload_id: str, index: int):
+    """Puts a chunk of a resumable upload, sent as the raw request body."""
+    return jsonify(
+        dir_tree_lib.upload_chunk(
+            upload_id, index, request.stream, data_file_dir=dir_tree_lib.DATA_FILE_DIR
+        )
+    )
+
+
+@app.route("/api/upload/chunked/<upload_id>/finish", methods=["POST"])
+def finish_chunked_upload(upload_id: str):
+    """Finishes a resumable upload once all its chunks are put."""
+    engine = db_interface.get_engine(dir_tree_lib.DB_PATH)
+    result = dir_tree_lib.finish_chunked_upload(
+        engine, upload_id, data_file_dir=dir_tree_lib.DATA_FILE_DIR
+    )
+    return tree_response(engine, result)
+
+
+@app.route("/api/upload/chunked/<upload_id>", methods=["DELETE"])
+def cancel_chunked_upload(upload_id: str):
+    """Cancels a resumable upload."""
+    return jsonify(
+        dir_tree_lib.cancel_chunked_upload(upload_id, data_file_dir=dir_tree_lib.DATA_FILE_DIR)
+    )
 
 
 def parse_args(args: list[str]) -> argparse.Namespace:  # pragma: no cover
@@ -82,4 +187,7 @@ def parse_args(args: list[str]) -> argparse.Namespace:  # pragma: no cover
 
 if __name__ == "__main__":  # pragma: no cover
     cli_args = parse_args(sys.argv[1:])
+    # The debug reloader runs this twice, and only its child process serves requests.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or not cli_args.debug:
+        dir_tree_lib.resume_analysis(db_interface.get_engine(dir_tree_lib.DB_PATH))
     app.run(debug=cli_args.debug, port=cli_args.port, host=cli_args.host)
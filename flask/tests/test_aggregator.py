@@ -0,0 +1,250 @@
+"""Module test_aggregator contains tests for the aggregator module."""
+
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+from data import aggregator, sketches
+
+
+def _text(values: list[str], name: str | None = None) -> pd.Series:
+    """Make a column of cell text, as it is parsed from a csv file without its cache."""
+    return pd.Series(values, dtype=str, name=name)
+
+
+@pytest.mark.parametrize(
+    "column, bins, want",
+    [
+        (
+            _text(["1", "2", "", "x", "4"]),
+            3,
+            [
+                {
+                    "key": "1.0-2.0",
+                    "data": 1,
+                    "metadata": {"low": 1.0, "high": 2.0, "rowIndices": [0]},
+                },
+                {
+                    "key": "2.0-3.0",
+                    "data": 1,
+                    "metadata": {"low": 2.0, "high": 3.0, "rowIndices": [1]},
+                },
+                {
+                    "key": "3.0-4.0",
+                    "data": 1,
+                    "metadata": {"low": 3.0, "high": 4.0, "rowIndices": [4]},
+                },
+            ],
+        ),
+        (
+            pd.Series([0.0, 10.0, 4.0, 5.0, None]),
+            2,
+            [
+                {
+                    "key": "0.0-5.0",
+                    "data": 2,
+                    "metadata": {"low": 0.0, "high": 5.0, "rowIndices": [0, 2]},
+                },
+                {
+                    "key": "5.0-10.0",
+                    "data": 2,
+                    "metadata": {"low": 5.0, "high": 10.0, "rowIndices": [1, 3]},
+                },
+            ],
+        ),
+        (
+            pd.Series([5, 5, 5]),
+            10,
+            [
+                {
+                    "key": "5",
+                    "data": 3,
+                    "metadata": {"low": 5.0, "high": 5.0, "rowIndices": [0, 1, 2]},
+                }
+            ],
+        ),
+        (_text(["", "a"]), 10, []),
+        (
+            _text(["inf", "1", "-inf", "3"]),
+            2,
+            [
+                {
+                    "key": "1.0-2.0",
+                    "data": 1,
+                    "metadata": {"low": 1.0, "high": 2.0, "rowIndices": [1]},
+                },
+                {
+                    "key": "2.0-3.0",
+                    "data": 1,
+                    "metadata": {"low": 2.0, "high": 3.0, "rowIndices": [3]},
+                },
+            ],
+        ),
+        (_text(["inf", "-inf"]), 10, []),
+    ],
+    ids=[
+        "text-skips-non-numbers",
+        "max-in-last-bin",
+        "single-value",
+        "no-numbers",
+        "skips-infinities",
+        "only-infinities",
+    ],
+)
+def test_histogram(column: pd.Series, bins: int, want: list[dict[str, Any]]):
+    """Test binning the numbers of a column."""
+    assert aggregator.histogram(column, bins) == want
+
+
+def test_histogram_row_indices_capped(monkeypatch):
+    """Test that only the first row indices of a bin are kept, but all rows are counted."""
+    monkeypatch.setattr(aggregator, "MAX_BIN_ROW_INDICES", 2)
+    series = aggregator.histogram(pd.Series([1, 9, 2, 3, 8]), 2)
+    assert [point["data"] for point in series] == [3, 2]
+    assert [point["metadata"]["rowIndices"] for point in series] == [[0, 2], [1, 4]]
+
+
+def test_histogram_huge_range():
+    """Test binning values whose range overflows float64."""
+    series = aggregator.histogram(pd.Series([1e308, -1e308, 0.0]), 4)
+    assert [point["data"] for point in series] == [1, 0, 1, 1]
+    assert [point["metadata"]["rowIndices"] for point in series] == [[1], [], [2], [0]]
+    assert (series[0]["metadata"]["low"], series[-1]["metadata"]["high"]) == (-1e308, 1e308)
+    assert series[2]["metadata"]["low"] == 0.0
+
+
+def test_stored_histogram():
+    """Test that a stored histogram has the same bins as one of the values themselves."""
+    values = pd.Series([0.0, 10.0, 4.0, 5.0, 2.5])
+    histogram = sketches.Histogram.from_values(values.to_numpy(), num_bins=4)
+    want = aggregator.histogram(values, 4)
+    for point in want:
+        del point["metadata"]["rowIndices"]
+    assert aggregator.stored_histogram(histogram) == want
+
+    single = sketches.Histogram.from_values(np.array([5.0, 5.0]))
+    assert aggregator.stored_histogram(single) == [
+        {"key": "5", "data": 2, "metadata": {"low": 5.0, "high": 5.0}}
+    ]
+
+
+def test_stored_top_values():
+    """Test that stored top values are bars, most frequent first."""
+    top_values = sketches.TopValues()
+    top_values.merge_counts(pd.Series({"b": 1, "a": 3, "c": 1}))
+    assert aggregator.stored_top_values(top_values) == [
+        {"key": "a", "data": 3},
+        {"key": "b", "data": 1},
+        {"key": "c", "data": 1},
+    ]
+
+
+def test_bar():
+    """Test that bars sum each category in order of first appearance, skipping rows
+    without a category or a number."""
+    assert aggregator.bar(_text(["b", "a", "b", "", "c"]), _text(["1", "2", "3", "4", "x"])) == [
+        {"key": "b", "data": 4.0, "metadata": {"rowIndex": 0}},
+        {"key": "a", "data": 2.0, "metadata": {"rowIndex": 1}},
+    ]
+    assert aggregator.bar(pd.Series([0.5, None, 0.5]), pd.Series([1, 2, 3])) == [
+        {"key": "0.5", "data": 4.0, "metadata": {"rowIndex": 0}},
+    ]
+
+
+def test_heatmap():
+    """Test that heatmap cells are summed and nested by y value."""
+    assert aggregator.heatmap(
+        _text(["x1", "x2", "x1", "x1"]),
+        _text(["y1", "y1", "y2", "y1"]),
+        _text(["1", "2", "3", "4"]),
+    ) == [
+        {
+            "key": "y1",
+            "data": [
+                {"key": "x1", "data": 5.0, "metadata": {"rowIndex": 0}},
+                {"key": "x2", "data": 2.0, "metadata": {"rowIndex": 1}},
+            ],
+        },
+        {"key": "y2", "data": [{"key": "x1", "data": 3.0, "metadata": {"rowIndex": 2}}]},
+    ]
+
+
+@pytest.mark.parametrize(
+    "x, ys, x_type, want",
+    [
+        (
+            pd.Series([1.5, None, 2]),
+            [pd.Series([1, 2, 3], name="y")],
+            "numeric",
+            [
+                {"key": 1.5, "data": 1.0, "metadata": {"rowIndex": 0}},
+                {"key": 2.0, "data": 3.0, "metadata": {"rowIndex": 2}},
+            ],
+        ),
+        (
+            _text(["b", "a", ""]),
+            [_text(["1", "", "3"], "y")],
+            "string",
+            [{"key": "b", "data": 1.0, "metadata": {"rowIndex": 0}}],
+        ),
+        (
+            _text(["2024-01-01", "", "2024-01-03"]),
+            [_text(["1", "2", "3"], "a"), _text(["4", "", "6"], "b")],
+            "date",
+            [
+                {
+                    "key": "a",
+                    "data": [
+                        {"key": "2024-01-01T00:00:00", "data": 1.0, "metadata": {"rowIndex": 0}},
+                        {"key": "2024-01-03T00:00:00", "data": 3.0, "metadata": {"rowIndex": 2}},
+                    ],
+                },
+                {
+                    "key": "b",
+                    "data": [
+                        {"key": "2024-01-01T00:00:00", "data": 4.0, "metadata": {"rowIndex": 0}},
+                        {"key": "2024-01-03T00:00:00", "data": 6.0, "metadata": {"rowIndex": 2}},
+                    ],
+                },
+            ],
+        ),
+    ],
+    ids=["numeric-x", "string-x", "date-x-multiple-series"],
+)
+def test_line(x: pd.Series, ys: list[pd.Series], x_type: str, want: list[dict[str, Any]]):
+    """Test the points of line charts, which skip rows without an x or y value."""
+    assert aggregator.line(x, ys, x_type) == want
+
+
+@pytest.mark.parametrize("x_type", ["numeric", "date", "string"])
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_line_downsampled(x_type: str, method: str):
+    """Test that downsampled series keep the first and last points and the row index of
+    every kept point."""
+    steps = range(0, 2000, 2)
+    x = {
+        "numeric": _text([str(step) for step in steps]),
+        "date": _text([f"2024-01-01T00:{step // 60 % 60:02}:{step % 60:02}" for step in steps]),
+        "string": _text([f"step-{step}" for step in steps]),
+    }[x_type]
+    ys = [pd.Series([float(step % 37) for step in steps], name="loss")]
+    full = aggregator.line(x, ys, x_type)
+
+    points = aggregator.line(x, ys, x_type, max_points=50, method=method)
+    assert len(points) <= 50
+    assert points[0] == full[0]
+    assert points[-1] == full[-1]
+    for point in points:
+        assert point == full[point["metadata"]["rowIndex"]]
+    assert aggregator.line(x, ys, x_type, max_points=len(full)) == full
+
+
+@pytest.mark.parametrize("chart_type", aggregator.CHART_TYPES)
+def test_aggregate(chart_type: str):
+    """Test that every chart type can be aggregated from as many columns as it takes."""
+    fewest, _ = aggregator.COLUMN_COUNTS[chart_type]
+    columns = [_text(["1", "2", "3"], f"column-{i}") for i in range(fewest)]
+    series = aggregator.aggregate(chart_type, columns, bins=2)
+    assert series
+    assert all({"key", "data"} <= point.keys() for point in series)
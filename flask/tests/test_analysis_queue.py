@@ -0,0 +1,57 @@
+"""Module test_analysis_queue contains tests for the analysis_queue module."""
+
+import threading
+
+import analysis_queue
+import pytest
+from sqlalchemy import create_engine
+
+
+def test_analysis_queue_inline():
+    """Test that with no workers, jobs run as they are submitted."""
+    queue = analysis_queue.AnalysisQueue(0, 1)
+    ran = []
+    assert queue.reserve()
+    assert not queue.reserve()
+    queue.submit(lambda: ran.append("job"))
+    assert ran == ["job"]
+    assert queue.pending == 0
+
+
+def test_analysis_queue_backpressure():
+    """Test that slots stay taken until their jobs finish or are cancelled."""
+    queue = analysis_queue.AnalysisQueue(2, 2)
+    release = threading.Event()
+    ran = []
+
+    assert queue.reserve()
+    queue.submit(lambda: ran.append(release.wait(timeout=30)))
+    assert queue.reserve()
+    assert not queue.reserve()
+    queue.cancel()
+    assert not queue.join(timeout=0.01)
+    assert queue.pending == 1
+
+    release.set()
+    assert queue.join(timeout=30)
+    assert queue.pending == 0
+    assert ran == [True]
+
+
+def test_analysis_queue_job_error():
+    """Test that a job's slot is given back even when the job fails."""
+    queue = analysis_queue.AnalysisQueue(0, 1)
+    assert queue.reserve()
+    with pytest.raises(ValueError):
+        queue.submit(lambda: (_ for _ in ()).throw(ValueError("bad job")))
+    assert queue.pending == 0
+    assert queue.join(timeout=0)
+
+
+def test_get_analysis_queue():
+    """Test that each engine gets one queue."""
+    engine = create_engine("sqlite://")
+    queue = analysis_queue.get_analysis_queue(engine, 1, 4)
+    assert analysis_queue.get_analysis_queue(engine, 2, 8) is queue
+    assert (queue.workers, queue.max_pending) == (1, 4)
+    assert analysis_queue.get_analysis_queue(create_engine("sqlite://"), 1, 4) is not queue
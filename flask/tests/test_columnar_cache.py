@@ -0,0 +1,135 @@
+"""Module test_columnar_cache contains tests for the columnar_cache module."""
+
+import csv
+import os
+
+import pyarrow as pa
+import pytest
+from data import columnar_cache
+from db import data_interface
+
+_CONTENT = (
+    "int,float,int-like-float,padded,mixed,text,empty\n"
+    "1,0.5,3.0,007,1,plain,\n"
+    '-2,1e-05,1.5,1,two,"quoted, with comma",\n'
+    ',,,,,"quoted\nnewline",\n'
+    '30,-0.0,1e+16,2,3.5,"escaped ""quotes""",\n'
+    "0,123456789.25,nan,3,,,\n"
+    "42,inf,2.0,4,1.50,last,\n"
+)
+
+
+def _write(tmp_path, content: str = _CONTENT) -> str:
+    """Write a csv data file and get its path."""
+    data_file = str(tmp_path / "0.csv")
+    with open(data_file, "w", encoding="utf-8", newline="") as f:
+        f.write(content)
+    return data_file
+
+
+def _read_csv(data_file: str) -> list[list[str]]:
+    """Read a csv file with the csv module."""
+    with open(data_file, encoding="utf-8", newline="") as f:
+        return list(csv.reader(f))
+
+
+@pytest.mark.parametrize("block_size", [64, 1024 * 1024], ids=["small-blocks", "one-block"])
+def test_build_columnar_cache(tmp_path, monkeypatch, block_size: int):
+    """Test that columns are typed only when their text can be read back exactly."""
+    monkeypatch.setattr(columnar_cache, "READ_BLOCK_SIZE", block_size)
+    data_file = _write(tmp_path)
+    assert columnar_cache.build_columnar_cache(data_file, num_rows=6)
+
+    with columnar_cache.open_columnar_cache(data_file) as cache:
+        assert dict(zip(cache.schema_arrow.names, cache.schema_arrow.types, strict=True)) == {
+            "int": pa.int64(),
+            "float": pa.float64(),
+            "int-like-float": pa.float64(),
+            "padded": pa.string(),
+            "mixed": pa.string(),
+            "text": pa.string(),
+            "empty": pa.string(),
+        }
+        assert list(columnar_cache.iter_text_rows(cache)) == _read_csv(data_file)
+
+
+@pytest.mark.parametrize(
+    "offset, limit, columns",
+    [
+        (0, None, None),
+        (1, 2, ["float"]),
+        (2, 3, ["text", "int"]),
+        (5, 10, ["padded"]),
+        (6, None, ["mixed"]),
+        (0, 0, ["int"]),
+    ],
+)
+def test_iter_text_rows_window(
+    tmp_path, monkeypatch, offset: int, limit: int | None, columns: list[str] | None
+):
+    """Test that windows across row groups read the same rows as the csv module."""
+    monkeypatch.setattr(columnar_cache, "READ_BLOCK_SIZE", 64)
+    data_file = _write(tmp_path)
+    want = list(data_interface.iter_csv_rows(data_file, offset, limit, columns))
+
+    assert columnar_cache.build_columnar_cache(data_file)
+    with columnar_cache.open_columnar_cache(data_file) as cache:
+        assert cache.num_row_groups > 1
+        assert list(columnar_cache.iter_text_rows(cache, offset, limit, columns)) == want
+    if columns is not None:
+        assert list(data_interface.iter_csv_rows(data_file, offset, limit, columns)) == want
+    with pytest.raises(KeyError):
+        list(data_interface.iter_csv_rows(data_file, offset, limit, ["missing"]))
+
+
+@pytest.mark.parametrize(
+    "content, num_rows",
+    [
+        ("a,b\n1,2\n3\n", None),
+        ("a,a\n1,2\n", None),
+        ("a,b\n1,2\n", 2),
+        ("", None),
+    ],
+    ids=["ragged-row", "duplicate-columns", "row-count-mismatch", "empty"],
+)
+def test_build_columnar_cache_rejected(tmp_path, content: str, num_rows: int | None):
+    """Test that no cache is written for files it could not read back exactly."""
+    data_file = _write(tmp_path, content)
+    assert not columnar_cache.build_columnar_cache(data_file, num_rows)
+    assert sorted(os.listdir(tmp_path)) == ["0.csv"]
+
+
+def test_open_columnar_cache_invalidated(tmp_path):
+    """Test that a cache is not used once its data file changes."""
+    data_file = _write(tmp_path)
+    assert columnar_cache.open_columnar_cache(data_file) is None
+    assert columnar_cache.build_columnar_cache(data_file)
+    with columnar_cache.open_columnar_cache(data_file) as cache:
+        assert cache.metadata.num_rows == 6
+
+    with open(data_file, "a", encoding="utf-8") as f:
+        f.write("7,7.5,7.0,7,7,seven,\n")
+    assert columnar_cache.open_columnar_cache(data_file) is None
+    assert columnar_cache.read_columns(data_file) is None
+
+    with open(columnar_cache.columnar_cache_path(data_file), "wb") as f:
+        f.write(b"not a parquet file")
+    assert columnar_cache.open_columnar_cache(data_file) is None
+
+
+def test_read_columns(tmp_path):
+    """Test reading typed columns from the cache."""
+    data_file = _write(tmp_path)
+    data_interface.index_data_file("csv", data_file)
+    data_interface.cache_data_file("csv", data_file)
+
+    df = columnar_cache.read_columns(data_file, ["int", "float"])
+    assert list(df.columns) == ["int", "float"]
+    assert df["int"].tolist()[:2] == [1, -2]
+    assert df["float"].tolist()[:2] == [0.5, 1e-05]
+    assert df["int"].isna().tolist() == [False, False, True, False, False, False]
+    with pytest.raises(KeyError, match="Column missing not found."):
+        columnar_cache.read_columns(data_file, ["missing"])
+
+    data_interface.delete_data_file("0.csv", str(tmp_path))
+    assert os.listdir(tmp_path) == []
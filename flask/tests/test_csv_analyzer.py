@@ -1,19 +1,52 @@
 """Module test_csv_analyzer tests the csv_analyzer module."""
 
+import math
 import os
+from typing import Any
 
-from data import csv_analyzer
+import numpy as np
+import pandas as pd
+import pytest
+from data import csv_analyzer, sketches
+from db import data_interface
 
 from tests.test_lib import dict_compare
 
 TESTDATA_DIR = os.environ.get("TESTDATA_DIR", os.path.join("flask", "tests", "testdata"))
 
 
+def pop_sketches(stats: dict[str, Any]) -> list[dict[str, Any]]:
+    """Remove the serialized sketches from the stats of each column, decoding the histogram
+    into its range and counts and the top values into their counts."""
+    decoded = []
+    for col_stats in stats["column_stats"]:
+        col_sketches = {}
+        if "histogram" in col_stats:
+            histogram = sketches.Histogram.from_bytes(col_stats.pop("histogram"))
+            col_sketches["histogram"] = (histogram.low, histogram.high, histogram.counts.tolist())
+            digest = sketches.TDigest.from_bytes(col_stats.pop("quantile_sketch"))
+            col_sketches["quantile_range"] = (digest.min_value, digest.max_value)
+        if "top_values" in col_stats:
+            top_values = sketches.TopValues.from_bytes(col_stats.pop("top_values"))
+            col_sketches["top_values"] = top_values.counts.to_dict()
+        decoded.append(col_sketches)
+    return decoded
+
+
 def test_analyze_csv_stats():
     """Test the analyze_csv_stats function."""
     file_path = os.path.join(TESTDATA_DIR, "test-csv.csv")
     stats = csv_analyzer.analyze_csv_stats(file_path)
 
+    assert pop_sketches(stats) == [
+        {
+            "histogram": (0.0, 4.0, [1] + [0] * 4 + [1] + [0] * 4 + [1] + [0] * 8 + [1]),
+            "quantile_range": (0.0, 4.0),
+        },
+        {"top_values": {"hello": 1, "universe": 1, "world": 1}},
+        {"histogram": (3.0, 4.0, [2] + [0] * 18 + [1]), "quantile_range": (3.0, 4.0)},
+    ]
+
     want_stats = {
         "num_columns": 3,
         "num_rows": 4,
@@ -55,3 +88,401 @@ def test_analyze_csv_stats():
         ],
     }
     dict_compare(stats, want_stats)
+
+
+def test_analyze_dataframe_edge_cases():
+    """Test analyze_dataframe on columns with no values, one value, bools and large ints."""
+    df = pd.DataFrame(
+        {
+            "empty": [np.nan, np.nan, np.nan],
+            "one": [np.nan, 2.5, np.nan],
+            "bool": [True, False, True],
+            "nullable": pd.array([1, None, 1], dtype="Int64"),
+            "big": [2**60, 2**60 + 1, 0],
+            "string": ["x", "", None],
+        }
+    )
+    stats = csv_analyzer.analyze_dataframe(df)
+
+    assert pop_sketches(stats) == [
+        {},
+        {"histogram": (2.5, 2.5, [1]), "quantile_range": (2.5, 2.5)},
+        {"histogram": (0.0, 1.0, [1] + [0] * 18 + [2]), "quantile_range": (0.0, 1.0)},
+        {"histogram": (1.0, 1.0, [2]), "quantile_range": (1.0, 1.0)},
+        {"histogram": (0.0, 2.0**60, [1] + [0] * 18 + [2]), "quantile_range": (0.0, 2.0**60)},
+        {"top_values": {"": 1, "x": 1}},
+    ]
+    assert math.isnan(stats["column_stats"][1].pop("std_dev"))
+    want_stats = {
+        "num_columns": 6,
+        "num_rows": 3,
+        "column_stats": [
+            {
+                "column_name": "empty",
+                "data_type": "numeric",
+                "num_rows": 3,
+                "num_unique_values": 0,
+                "num_null_values": 3,
+            },
+            {
+                "column_name": "one",
+                "data_type": "numeric",
+                "num_rows": 3,
+                "num_unique_values": 1,
+                "num_null_values": 2,
+                "num_zeros_values": 0,
+                "mean": 2.5,
+                "median": 2.5,
+                "min_value": 2.5,
+                "max_value": 2.5,
+            },
+            {
+                "column_name": "bool",
+                "data_type": "numeric",
+                "num_rows": 3,
+                "num_unique_values": 2,
+                "num_null_values": 0,
+                "num_zeros_values": 1,
+                "std_dev": 0.5773502691896258,
+                "mean": 0.6666666666666666,
+                "median": 1.0,
+                "min_value": 0.0,
+                "max_value": 1.0,
+            },
+            {
+                "column_name": "nullable",
+                "data_type": "numeric",
+                "num_rows": 3,
+                "num_unique_values": 1,
+                "num_null_values": 1,
+                "num_zeros_values": 0,
+                "std_dev": 0.0,
+                "mean": 1.0,
+                "median": 1.0,
+                "min_value": 1.0,
+                "max_value": 1.0,
+            },
+            {
+                "column_name": "big",
+                "data_type": "numeric",
+                "num_rows": 3,
+                "num_unique_values": 3,
+                "num_null_values": 0,
+                "num_zeros_values": 1,
+                "std_dev": 6.656395410392716e17,
+                "mean": 7.686143364045646e17,
+                "median": 1.152921504606847e18,
+                "min_value": 0.0,
+                "max_value": 1.152921504606847e18,
+            },
+            {
+                "column_name": "string",
+                "data_type": "string",
+                "num_rows": 3,
+                "num_unique_values": 2,
+                "num_null_values": 1,
+                "num_empty_values": 1,
+            },
+        ],
+    }
+    dict_compare(stats, want_stats)
+
+
+def test_analyze_dataframe_mixed_types():
+    """Test analyze_dataframe on an object column mixing numbers and text, as pandas reads
+    a csv column whose chunks infer different types."""
+    stats = csv_analyzer.analyze_dataframe(pd.DataFrame({"mixed": [1, "a", 2.5, "a"]}))
+    assert pop_sketches(stats) == [{"top_values": {"a": 2, "1": 1, "2.5": 1}}]
+    assert stats["column_stats"] == [
+        {
+            "column_name": "mixed",
+            "data_type": "string",
+            "num_rows": 4,
+            "num_unique_values": 3,
+            "num_null_values": 0,
+            "num_empty_values": 0,
+        }
+    ]
+
+
+def test_analyze_dataframe_no_rows():
+    """Test analyze_dataframe on a frame with columns but no rows."""
+    df = pd.DataFrame({"number": pd.Series([], dtype=float), "string": pd.Series([], dtype=str)})
+    stats = csv_analyzer.analyze_dataframe(df)
+    assert pop_sketches(stats) == [{}, {"top_values": {}}]
+    assert stats == {
+        "num_columns": 2,
+        "num_rows": 0,
+        "column_stats": [
+            {
+                "column_name": "number",
+                "data_type": "numeric",
+                "num_rows": 0,
+                "num_unique_values": 0,
+                "num_null_values": 0,
+            },
+            {
+                "column_name": "string",
+                "data_type": "string",
+                "num_rows": 0,
+                "num_unique_values": 0,
+                "num_null_values": 0,
+                "num_empty_values": 0,
+            },
+        ],
+    }
+
+
+def _write_csv(tmp_path, df: pd.DataFrame) -> str:
+    """Write a dataframe to a csv file and return its path."""
+    file_path = str(tmp_path / "data.csv")
+    df.to_csv(file_path, index=False)
+    return file_path
+
+
+def test_analyze_csv_stats_chunked(tmp_path):
+    """Test that chunked analysis gives the same stats as analyzing the whole file."""
+    rng = np.random.default_rng(0)
+    num_rows = 5500
+    df = pd.DataFrame(
+        {
+            "float": rng.normal(size=num_rows).round(2),
+            "int": rng.integers(-3, 3, num_rows),
+            "sparse": [i if i % 700 == 0 else None for i in range(num_rows)],
+            "empty": [None] * num_rows,
+            "bool": rng.integers(0, 2, num_rows).astype(bool),
+            "string": rng.choice(["a", "b", ""], num_rows),
+            "late-string": [str(i % 50) if i < 4000 else "text" for i in range(num_rows)],
+        }
+    )
+    file_path = _write_csv(tmp_path, df)
+
+    want = csv_analyzer.analyze_csv_stats(file_path, chunked=False)
+    got = csv_analyzer.analyze_csv_stats_chunked(file_path, memory_limit=1_000_000)
+    assert got["column_stats"][6]["data_type"] == "string"
+    for got_col, want_col in zip(got["column_stats"], want["column_stats"], strict=True):
+        assert got_col.keys() == want_col.keys()
+        for key, want_value in want_col.items():
+            if isinstance(want_value, float):
+                assert got_col[key] == pytest.approx(want_value, rel=1e-12), key
+            else:
+                assert got_col[key] == want_value, key
+    assert {key: got[key] for key in ["num_columns", "num_rows"]} == {
+        "num_columns": 7,
+        "num_rows": num_rows,
+    }
+
+
+@pytest.mark.parametrize("mode", ["whole", "chunked", "chunked-overflowed", "approximate"])
+def test_analyze_csv_stats_infinities(tmp_path, mode: str):
+    """Test that infinities are kept in the stats but left out of the histogram and quantile
+    sketch, which only describe the finite values."""
+    file_path = tmp_path / "infinities.csv"
+    file_path.write_text("value,only-inf\n1,inf\ninf,-inf\n3,inf\n-inf,\n2,inf\n")
+    stats = {
+        "whole": lambda: csv_analyzer.analyze_csv_stats(str(file_path), chunked=False),
+        "chunked": lambda: csv_analyzer.analyze_csv_stats_chunked(str(file_path)),
+        "chunked-overflowed": lambda: csv_analyzer.analyze_csv_stats_chunked(
+            str(file_path), memory_limit=1
+        ),
+        "approximate": lambda: csv_analyzer.analyze_csv_stats(str(file_path), approximate=True),
+    }[mode]()
+    value_stats, only_inf_stats = stats["column_stats"]
+    assert (value_stats["min_value"], value_stats["max_value"]) == (-math.inf, math.inf)
+    assert (only_inf_stats["min_value"], only_inf_stats["max_value"]) == (-math.inf, math.inf)
+    assert math.isnan(value_stats["mean"])
+    value_sketches, only_inf_sketches = pop_sketches(stats)
+    low, high, counts = value_sketches["histogram"]
+    assert (low, high, sum(counts)) == (1.0, 3.0, 3)
+    assert value_sketches["quantile_range"] == (1.0, 3.0)
+    assert "histogram" not in only_inf_sketches
+
+
+@pytest.mark.parametrize("mode", ["whole", "chunked", "chunked-overflowed", "approximate"])
+def test_analyze_csv_stats_huge_range(tmp_path, mode: str):
+    """Test that a column whose range overflows float64 is still binned into a histogram."""
+    file_path = tmp_path / "huge-range.csv"
+    file_path.write_text("value\n1e308\n-1e308\n0\n")
+    stats = {
+        "whole": lambda: csv_analyzer.analyze_csv_stats(str(file_path), chunked=False),
+        "chunked": lambda: csv_analyzer.analyze_csv_stats_chunked(str(file_path)),
+        "chunked-overflowed": lambda: csv_analyzer.analyze_csv_stats_chunked(
+            str(file_path), memory_limit=1
+        ),
+        "approximate": lambda: csv_analyzer.analyze_csv_stats(str(file_path), approximate=True),
+    }[mode]()
+    (value_sketches,) = pop_sketches(stats)
+    low, high, counts = value_sketches["histogram"]
+    assert (low, high, sum(counts)) == (-1e308, 1e308, 3)
+    assert (counts[0], counts[-1]) == (1, 1)
+
+
+@pytest.mark.parametrize("mode", ["whole", "chunked", "approximate"])
+def test_analyze_csv_stats_num_rows(tmp_path, mode: str):
+    """Test that blank lines count as rows and quoted newlines do not, as when the file is
+    paged, whichever way it is analyzed."""
+    file_path = tmp_path / "blank-lines.csv"
+    file_path.write_text('step,note\n1,a\n\n2,"two\nlines"\n3,c\n\n')
+    stats = {
+        "whole": lambda: csv_analyzer.analyze_csv_stats(str(file_path), chunked=False),
+        "chunked": lambda: csv_analyzer.analyze_csv_stats(str(file_path), chunked=True),
+        "approximate": lambda: csv_analyzer.analyze_csv_stats(str(file_path), approximate=True),
+    }[mode]()
+    assert stats["num_rows"] == data_interface.count_csv_rows(str(file_path)) == 5
+    assert [col["num_null_values"] for col in stats["column_stats"]] == [2, 2]
+
+
+def test_analyze_csv_stats_chunked_high_cardinality(tmp_path):
+    """Test that columns with too many distinct values for the memory limit are estimated."""
+    num_rows = 20000
+    df = pd.DataFrame({"id": np.arange(num_rows, dtype=np.float64), "name": np.arange(num_rows)})
+    df["name"] = "name-" + df["name"].astype(str)
+    file_path = _write_csv(tmp_path, df)
+
+    stats = csv_analyzer.analyze_csv_stats_chunked(file_path, memory_limit=100_000)
+    id_stats, name_stats = stats["column_stats"]
+    assert id_stats["num_unique_values"] == pytest.approx(num_rows, rel=0.1)
+    assert id_stats["median"] == pytest.approx((num_rows - 1) / 2, rel=0.1)
+    assert id_stats["mean"] == (num_rows - 1) / 2
+    assert id_stats["min_value"] == 0.0
+    assert id_stats["max_value"] == num_rows - 1
+    assert name_stats["num_unique_values"] == pytest.approx(num_rows, rel=0.1)
+    id_sketches, name_sketches = pop_sketches(stats)
+    low, high, counts = id_sketches["histogram"]
+    assert (low, high, sum(counts)) == (0.0, num_rows - 1, num_rows)
+    assert counts == pytest.approx([num_rows / len(counts)] * len(counts), rel=0.05)
+    assert len(name_sketches["top_values"]) <= sketches.TOP_VALUES
+
+
+@pytest.mark.parametrize("threshold, want_chunked", [(0, True), (10**12, False)])
+def test_analyze_csv_stats_threshold(monkeypatch, threshold: int, want_chunked: bool):
+    """Test that large files fall back to chunked analysis."""
+    monkeypatch.setattr(csv_analyzer, "CHUNKED_ANALYSIS_THRESHOLD", threshold)
+    calls = []
+    monkeypatch.setattr(
+        csv_analyzer, "analyze_csv_stats_chunked", lambda file_path, **_: calls.append(file_path)
+    )
+    file_path = os.path.join(TESTDATA_DIR, "test-csv.csv")
+    csv_analyzer.analyze_csv_stats(file_path)
+    assert calls == ([file_path] if want_chunked else [])
+
+
+def test_analyze_csv_stats_approximate(tmp_path):
+    """Test approximate analysis and combining its stats across files."""
+    rng = np.random.default_rng(0)
+    frames = [
+        pd.DataFrame(
+            {
+                "value": rng.normal(loc=i, size=3000),
+                "name": [f"name-{j}" for j in rng.integers(0, 2000, 3000)],
+            }
+        )
+        for i in range(2)
+    ]
+    stats = []
+    for i, df in enumerate(frames):
+        file_path = str(tmp_path / f"{i}.csv")
+        df.to_csv(file_path, index=False)
+        stats.append(csv_analyzer.analyze_csv_stats(file_path, approximate=True))
+
+    value_stats, name_stats = stats[0]["column_stats"]
+    assert value_stats["num_unique_values"] == pytest.approx(3000, rel=0.05)
+    assert value_stats["median"] == pytest.approx(frames[0]["value"].median(), abs=0.05)
+    assert value_stats["mean"] == pytest.approx(frames[0]["value"].mean(), rel=1e-12)
+    assert "quantile_sketch" not in name_stats
+    assert name_stats["num_unique_values"] == pytest.approx(frames[0]["name"].nunique(), rel=0.05)
+
+    both = pd.concat(frames)
+    combined = csv_analyzer.combine_column_stats(
+        [file_stats["column_stats"][0] for file_stats in stats]
+    )
+    assert combined["num_rows"] == 6000
+    assert combined["mean"] == pytest.approx(both["value"].mean(), rel=1e-9)
+    assert combined["std_dev"] == pytest.approx(both["value"].std(), rel=1e-9)
+    assert combined["min_value"] == both["value"].min()
+    assert combined["max_value"] == both["value"].max()
+    assert combined["median"] == pytest.approx(both["value"].median(), abs=0.05)
+    quartiles = csv_analyzer.column_quantiles(combined, [0.25, 0.75])
+    assert quartiles == pytest.approx(both["value"].quantile([0.25, 0.75]).tolist(), abs=0.05)
+
+    histogram = sketches.Histogram.from_bytes(combined["histogram"])
+    assert histogram.counts.sum() == 6000
+    want_counts, _ = np.histogram(both["value"], bins=histogram.edges)
+    assert np.abs(histogram.counts - want_counts).max() < 0.01 * 6000
+
+    combined = csv_analyzer.combine_column_stats(
+        [file_stats["column_stats"][1] for file_stats in stats]
+    )
+    assert combined["num_unique_values"] == pytest.approx(both["name"].nunique(), rel=0.05)
+    top_values = sketches.TopValues.from_bytes(combined["top_values"])
+    want_top = both["name"].value_counts()
+    assert want_top.index[0] in top_values.counts.index
+    for value, count in top_values.counts.items():
+        assert want_top[value] - top_values.error <= count <= want_top[value]
+
+
+@pytest.mark.parametrize(
+    "column_stats, want_error",
+    [
+        ([], "No column stats to combine."),
+        (
+            [{"data_type": "numeric"}, {"data_type": "string"}],
+            "Cannot combine the stats of columns with different data types.",
+        ),
+        ([{"data_type": "numeric"}], "Only stats from approximate analysis can be combined."),
+    ],
+    ids=["no-stats", "different-types", "no-sketches"],
+)
+def test_combine_column_stats_errors(column_stats: list[dict[str, Any]], want_error: str):
+    """Test combine_column_stats errors."""
+    with pytest.raises(ValueError, match=want_error):
+        csv_analyzer.combine_column_stats(column_stats)
+
+
+def _mixed_frame(num_rows: int, num_columns: int) -> pd.DataFrame:
+    """Make a frame with float, integer, sparse and string columns."""
+    rng = np.random.default_rng(0)
+    columns = {}
+    for i in range(num_columns):
+        match i % 4:
+            case 0:
+                columns[f"column-{i}"] = rng.normal(size=num_rows)
+            case 1:
+                columns[f"column-{i}"] = rng.integers(-10, 10, num_rows)
+            case 2:
+                columns[f"column-{i}"] = np.where(rng.random(num_rows) < 0.3, np.nan, i)
+            case _:
+                columns[f"column-{i}"] = rng.choice(["a", "b", ""], num_rows)
+    return pd.DataFrame(columns)
+
+
+def test_analyze_dataframe_sums_in_row_order():
+    """Test that means and standard deviations match pandas exactly, as both sum the values
+    in row order with nulls left out."""
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=5000) * 1e6
+    values[rng.random(5000) < 0.2] = np.nan
+    df = pd.DataFrame({"values": values})
+    (stats,) = csv_analyzer.analyze_dataframe(df)["column_stats"]
+    with pd.option_context("compute.use_bottleneck", False):
+        assert (stats["mean"], stats["std_dev"]) == (df["values"].mean(), df["values"].std())
+
+
+@pytest.mark.parametrize("workers", [2, 3, 16])
+def test_analyze_dataframe_workers(workers: int):
+    """Test that analyzing column groups in parallel matches the serial result exactly."""
+    df = _mixed_frame(2000, 22)
+    assert csv_analyzer.analyze_dataframe(df, workers=workers) == csv_analyzer.analyze_dataframe(df)
+
+
+@pytest.mark.parametrize("approximate", [False, True])
+def test_analyze_csv_stats_chunked_workers(tmp_path, approximate: bool):
+    """Test that chunked analysis in parallel matches the serial result exactly."""
+    file_path = _write_csv(tmp_path, _mixed_frame(3500, 9))
+    want = csv_analyzer.analyze_csv_stats_chunked(
+        file_path, memory_limit=1_000_000, approximate=approximate
+    )
+    got = csv_analyzer.analyze_csv_stats_chunked(
+        file_path, memory_limit=1_000_000, approximate=approximate, workers=4
+    )
+    assert got == want
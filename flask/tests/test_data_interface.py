@@ -1,10 +1,17 @@
 """Module test_data_interface contains tests for the data_interface module."""
 
+import hashlib
+import io
+import json
 import os
 import shutil
+import stat
+import tarfile
+import zipfile
 from typing import Any
 
 import pytest
+from data import csv_analyzer, row_index
 from db import data_interface
 
 TESTDATA_DIR = os.environ.get("TESTDATA_DIR", os.path.join("flask", "tests", "testdata"))
@@ -64,14 +71,311 @@ def test_load_data_file(path: str, data_file_type: str, want_data: Any, want_err
 
 
 @pytest.mark.parametrize(
-    "data_file_type, want",
-    [("csv", "1.csv"), ("json", "4.json")],
-    ids=["new-csv-filename", "new-json-filename"],
+    "path, data_file_type, window, want_page, want_error",
+    [
+        (
+            "test-file-1.csv",
+            "csv",
+            {"offset": 1},
+            {"data": [["column-1", "column-2"], ["value-3", "value-4"]], "total_rows": 2},
+            "",
+        ),
+        (
+            "test-file-1.csv",
+            "csv",
+            {"offset": 0, "limit": 1, "columns": ["column-2"]},
+            {"data": [["column-2"], ["value-2"]], "total_rows": 2},
+            "",
+        ),
+        (
+            "test-file-1.csv",
+            "csv",
+            {"offset": 5, "limit": 10, "num_rows": 2},
+            {"data": [["column-1", "column-2"]], "total_rows": 2},
+            "",
+        ),
+        ("test-file-1.csv", "csv", {"columns": ["column-9"]}, None, "Column column-9 not found."),
+        (
+            "data-folder-1/test-file-2.json",
+            "json",
+            {"offset": 0, "limit": 1},
+            None,
+            "Only json result files can be paged.",
+        ),
+        (
+            "data-folder-1/test-file-2.json",
+            "json",
+            {"columns": ["column-1"]},
+            None,
+            "Columns can only be selected from csv data files.",
+        ),
+        ("fake-path", "csv", {}, None, "Data file not found for path fake-path."),
+        (
+            "test-file-1.csv",
+            "fake-data-type",
+            {},
+            None,
+            "Unsupported data file type: fake-data-type.",
+        ),
+    ],
+    ids=[
+        "csv-offset",
+        "csv-limit-and-columns",
+        "csv-offset-past-end",
+        "csv-bad-column",
+        "json-not-result-file",
+        "json-columns",
+        "fake-path",
+        "fake-data-type",
+    ],
+)
+def test_load_data_page(
+    path: str,
+    data_file_type: str,
+    window: dict[str, Any],
+    want_page: dict[str, Any] | None,
+    want_error: str,
+):
+    """Test the load_data_page function."""
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    page, error = data_interface.load_data_page(path, data_file_type, TEST_DATA_FILE_DIR, **window)
+    assert page == want_page
+    assert error == want_error
+
+
+def test_load_data_page_json_results():
+    """Test that load_data_page pages through the results of a json result file."""
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    results = {"type": "result", "data": [{"metadata": {"run": i}} for i in range(5)]}
+    with open(os.path.join(TEST_DATA_FILE_DIR, "results.json"), "w", encoding="utf-8") as f:
+        json.dump(results, f)
+
+    page, error = data_interface.load_data_page(
+        "results.json", "json", TEST_DATA_FILE_DIR, offset=3, limit=1
+    )
+    assert error == ""
+    assert page == {"data": {"type": "result", "data": [{"metadata": {"run": 3}}]}, "total_rows": 5}
+
+
+@pytest.mark.parametrize(
+    "path, data_file_type, options, want_body, want_error",
+    [
+        (
+            "test-file-1.csv",
+            "csv",
+            {},
+            '["column-1", "column-2"]\n["value-1", "value-2"]\n["value-3", "value-4"]\n',
+            "",
+        ),
+        (
+            "test-file-1.csv",
+            "csv",
+            {"stream_format": "json", "offset": 1, "columns": ["column-2"]},
+            '[["column-2"],["value-4"]]',
+            "",
+        ),
+        (
+            "data-folder-1/test-file-2.json",
+            "json",
+            {"stream_format": "json"},
+            '{\n  "column-1": "value-1"\n}\n',
+            "",
+        ),
+        ("test-file-1.csv", "csv", {"columns": ["column-3"]}, None, "Column column-3 not found."),
+        (
+            "test-file-1.csv",
+            "csv",
+            {"stream_format": "xml"},
+            None,
+            "Unsupported stream format: xml.",
+        ),
+        (
+            "data-folder-1/test-file-2.json",
+            "json",
+            {},
+            '{\n  "column-1": "value-1"\n}\n',
+            "",
+        ),
+        (
+            "data-folder-1/test-file-2.json",
+            "json",
+            {"stream_format": "ndjson"},
+            None,
+            "Json data files can only be streamed as json.",
+        ),
+        (
+            "data-folder-1/test-file-2.json",
+            "json",
+            {"stream_format": "json", "limit": 1},
+            None,
+            "Only csv data files can be streamed in windows.",
+        ),
+        ("fake-path", "csv", {}, None, "Data file not found for path fake-path."),
+        (
+            "test-file-1.csv",
+            "fake-data-type",
+            {},
+            None,
+            "Unsupported data file type: fake-data-type.",
+        ),
+    ],
+    ids=[
+        "csv-ndjson",
+        "csv-json-window",
+        "json",
+        "csv-bad-column",
+        "bad-format",
+        "json-default-format",
+        "json-ndjson",
+        "json-window",
+        "fake-path",
+        "fake-data-type",
+    ],
 )
-def test_new_data_file_path(data_file_type: str, want: str):
-    """Test new_data_file_path function."""
+def test_stream_data_file(
+    path: str,
+    data_file_type: str,
+    options: dict[str, Any],
+    want_body: str | None,
+    want_error: str,
+):
+    """Test the stream_data_file function."""
     create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
-    assert data_interface.new_data_file_path(data_file_type, TEST_DATA_FILE_DIR) == want
+    chunks, error = data_interface.stream_data_file(
+        path, data_file_type, TEST_DATA_FILE_DIR, **options
+    )
+    assert error == want_error
+    if want_body is None:
+        assert chunks is None
+    else:
+        body = "".join(c.decode("utf-8") if isinstance(c, bytes) else c for c in chunks)
+        assert body == want_body
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["csv", "columnar-cache"])
+def test_load_data_columns_blank_lines(tmp_path, cached: bool):
+    """Test that blank lines load as rows of empty cells, the rows that paging and the
+    stored stats count, whether or not the columns come from the columnar cache."""
+    full_path = str(tmp_path / "0.csv")
+    with open(full_path, "w", encoding="utf-8") as f:
+        f.write('step,note\n1,a\n\n2,"two\nlines"\n3,c\n\n')
+    if cached:
+        data_interface.index_data_file("csv", full_path)
+        data_interface.cache_data_file("csv", full_path)
+    columns, error = data_interface.load_data_columns("0.csv", "csv", str(tmp_path), ["note"])
+    assert error == ""
+    assert columns[0].tolist() == ["a", "", "two\nlines", "c", ""]
+    assert len(columns[0]) == data_interface.count_csv_rows(full_path)
+    assert len(columns[0]) == csv_analyzer.analyze_csv_stats(full_path)["num_rows"]
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["csv", "columnar-cache"])
+def test_load_data_columns(tmp_path, cached: bool):
+    """Test loading whole columns, typed when read from the columnar cache."""
+    with open(tmp_path / "0.csv", "w", encoding="utf-8") as f:
+        f.write("id,name,score\n1,a,0.5\n2,,\n3,c,1.5\n")
+    if cached:
+        data_interface.index_data_file("csv", str(tmp_path / "0.csv"))
+        data_interface.cache_data_file("csv", str(tmp_path / "0.csv"))
+
+    columns, error = data_interface.load_data_columns(
+        "0.csv", "csv", str(tmp_path), ["score", "name", "score"]
+    )
+    assert error == ""
+    assert [column.name for column in columns] == ["score", "name", "score"]
+    assert columns[1].tolist() == ["a", "", "c"]
+    if cached:
+        assert columns[0].tolist()[::2] == [0.5, 1.5]
+        assert columns[0].isna().tolist() == [False, True, False]
+    else:
+        assert columns[0].tolist() == ["0.5", "", "1.5"]
+
+    assert data_interface.load_data_columns("0.csv", "csv", str(tmp_path), ["missing"]) == (
+        None,
+        "Column missing not found.",
+    )
+    assert data_interface.load_data_columns("0.csv", "json", str(tmp_path), ["id"]) == (
+        None,
+        "Only csv data files have columns.",
+    )
+
+
+@pytest.mark.parametrize("stream_format", ["ndjson", "json"])
+def test_stream_data_file_batches(tmp_path, monkeypatch, stream_format: str):
+    """Test that rows streamed over several batches form one valid document."""
+    monkeypatch.setattr(data_interface, "STREAM_BATCH_ROWS", 3)
+    rows = [["id", "value"]] + [[str(i), f"value-{i}"] for i in range(10)]
+    with open(tmp_path / "0.csv", "w", encoding="utf-8") as f:
+        f.write("\n".join(",".join(row) for row in rows))
+
+    chunks, error = data_interface.stream_data_file(
+        "0.csv", "csv", str(tmp_path), stream_format=stream_format
+    )
+    assert error == ""
+    chunks = list(chunks)
+    body = "".join(chunks)
+    if stream_format == "ndjson":
+        assert len(chunks) == 4
+        assert [json.loads(line) for line in body.splitlines()] == rows
+    else:
+        assert len(chunks) == 6
+        assert json.loads(body) == rows
+
+
+def test_save_data_file():
+    """Test that data files are named by the hash of their content and stored only once,
+    with their row index, and that their columnar cache is built later."""
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    with open(os.path.join(TESTDATA_DIR, "test-csv.csv"), "rb") as f:
+        content = f.read()
+    want = f"{hashlib.sha256(content).hexdigest()}.csv"
+
+    tmp_path, path = data_interface.save_data_file(io.BytesIO(content), "csv", TEST_DATA_FILE_DIR)
+    assert path == want
+    assert data_interface.store_data_file(tmp_path, path, TEST_DATA_FILE_DIR)
+    assert not os.path.exists(tmp_path)
+    full_path = os.path.join(TEST_DATA_FILE_DIR, path)
+    with open(full_path, "rb") as f:
+        assert f.read() == content
+    index_path, cache_path = data_interface.data_file_sidecar_paths(full_path)
+    assert os.path.exists(index_path)
+    assert not os.path.exists(cache_path)
+    data_interface.cache_data_file("csv", full_path)
+    assert os.path.exists(cache_path)
+
+    tmp_path, path = data_interface.save_data_file(io.BytesIO(content), "csv", TEST_DATA_FILE_DIR)
+    assert path == want
+    assert not data_interface.store_data_file(tmp_path, path, TEST_DATA_FILE_DIR)
+    assert not [name for name in os.listdir(TEST_DATA_FILE_DIR) if ".tmp" in name]
+
+
+def test_save_data_file_row_index():
+    """Test that the row index built while saving matches one built from the stored file."""
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    content = b'step,note\n1,"a\nb"\n2,c\n3,d'
+    tmp_path, path = data_interface.save_data_file(io.BytesIO(content), "csv", TEST_DATA_FILE_DIR)
+    assert data_interface.store_data_file(tmp_path, path, TEST_DATA_FILE_DIR)
+    index_path = row_index.row_index_path(os.path.join(TEST_DATA_FILE_DIR, path))
+    with open(index_path, "rb") as f:
+        saved = f.read()
+    row_index.build_row_index(os.path.join(TEST_DATA_FILE_DIR, path))
+    with open(index_path, "rb") as f:
+        assert f.read() == saved
+    with row_index.RowIndex(index_path) as index:
+        assert index.num_rows == 3
+
+
+def test_save_data_file_too_large():
+    """Test that files larger than the size limit are turned away without being kept."""
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    before = sorted(os.listdir(TEST_DATA_FILE_DIR))
+    with pytest.raises(ValueError, match="upload limit of 10 bytes"):
+        data_interface.save_data_file(io.BytesIO(b"a,b\n" * 3), "csv", TEST_DATA_FILE_DIR, 10)
+    assert sorted(os.listdir(TEST_DATA_FILE_DIR)) == before
+    tmp_path, _ = data_interface.save_data_file(
+        io.BytesIO(b"a,b\n" * 3), "csv", TEST_DATA_FILE_DIR, 12
+    )
+    assert os.path.getsize(tmp_path) == 12
 
 
 @pytest.mark.parametrize(
@@ -126,7 +430,7 @@ def test_new_data_file_path(data_file_type: str, want: str):
             "json",
             os.path.join(TESTDATA_DIR, "baseline", "3.json"),
             None,
-            NotImplementedError,
+            ValueError,
         ),
         (
             "xml",
@@ -135,7 +439,7 @@ def test_new_data_file_path(data_file_type: str, want: str):
             KeyError,
         ),
     ],
-    ids=["test-csv", "test-json-failure", "test-unknown-type-failure"],
+    ids=["test-csv", "test-json-not-result-file-failure", "test-unknown-type-failure"],
 )
 def test_analyze_data_file(
     data_file_type: str,
@@ -148,4 +452,92 @@ def test_analyze_data_file(
         with pytest.raises(expected_exception):
             data_interface.analyze_data_file(data_file_type, path)
     else:
-        assert data_interface.analyze_data_file(data_file_type, path) == want
+        got = data_interface.analyze_data_file(data_file_type, path)
+        # The serialized sketches are tested with the csv analyzer.
+        for col_stats in got["column_stats"]:
+            for key in ["histogram", "quantile_sketch", "top_values"]:
+                col_stats.pop(key, None)
+        assert got == want
+
+
+@pytest.mark.parametrize(
+    "filename, want",
+    [
+        ("sweep.zip", "zip"),
+        ("sweep.TAR", "tar"),
+        ("sweep.tar.gz", "tar"),
+        ("sweep.tgz", "tar"),
+        ("sweep.gz", None),
+        ("sweep.csv", None),
+    ],
+)
+def test_archive_type(filename: str, want: str | None):
+    """Test telling archives apart by their names."""
+    assert data_interface.archive_type(filename) == want
+
+
+@pytest.mark.parametrize(
+    "name, want",
+    [
+        ("run-1.csv", "run-1.csv"),
+        ("./sweep//run-1.csv", "sweep/run-1.csv"),
+        ("sweep\\run-1.csv", "sweep/run-1.csv"),
+        ("/etc/passwd", None),
+        ("sweep/../../run-1.csv", None),
+        ("..", None),
+        ("C:/run-1.csv", None),
+        ("./", None),
+    ],
+    ids=["plain", "dots", "backslashes", "absolute", "parent", "only-parent", "drive", "empty"],
+)
+def test_archive_entry_path(name: str, want: str | None):
+    """Test that entries are kept inside the folder an archive is expanded into."""
+    assert data_interface.archive_entry_path(name) == want
+
+
+def _zip_archive() -> io.BytesIO:
+    """Make a zip archive with a folder, a file and a link."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as f:
+        f.writestr("sweep/", b"")
+        f.writestr("sweep/run-1.csv", b"a\n1\n")
+        link = zipfile.ZipInfo("sweep/link.csv")
+        link.external_attr = (stat.S_IFLNK | 0o777) << 16
+        f.writestr(link, b"run-1.csv")
+    archive.seek(0)
+    return archive
+
+
+def _tar_archive() -> io.BytesIO:
+    """Make a gzipped tar archive with a folder, a file and a link."""
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as f:
+        folder = tarfile.TarInfo("sweep")
+        folder.type = tarfile.DIRTYPE
+        f.addfile(folder)
+        member = tarfile.TarInfo("sweep/run-1.csv")
+        member.size = 4
+        f.addfile(member, io.BytesIO(b"a\n1\n"))
+        link = tarfile.TarInfo("sweep/link.csv")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "run-1.csv"
+        f.addfile(link)
+    archive.seek(0)
+    return archive
+
+
+@pytest.mark.parametrize("kind, make_archive", [("zip", _zip_archive), ("tar", _tar_archive)])
+def test_iter_archive_entries(kind: str, make_archive):
+    """Test that folders are skipped and links have no content."""
+    entries = [
+        (name, None if entry is None else entry.read())
+        for name, entry in data_interface.iter_archive_entries(make_archive(), kind)
+    ]
+    assert entries == [("sweep/run-1.csv", b"a\n1\n"), ("sweep/link.csv", None)]
+
+
+@pytest.mark.parametrize("kind", ["zip", "tar"])
+def test_iter_archive_entries_not_archive(kind: str):
+    """Test that files that are not archives are turned away."""
+    with pytest.raises(ValueError, match=f"not a valid {kind} archive"):
+        list(data_interface.iter_archive_entries(io.BytesIO(b"a,b\n1,2\n"), kind))
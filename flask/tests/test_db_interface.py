@@ -7,6 +7,7 @@ from typing import Any
 
 import pytest
 from db import db_interface
+from db.models import ColumnStats
 from sqlalchemy import Engine
 from sqlalchemy.orm import Session
 
@@ -40,6 +41,143 @@ def make_test_db(empty: bool = False) -> Engine:
     return engine
 
 
+def test_get_engine_reuses_engine(tmp_path):
+    """Tests that get_engine returns one engine per database until it is disposed."""
+    db_path = str(tmp_path / "metadata.sqlite")
+    try:
+        engine = db_interface.get_engine(db_path)
+        assert db_interface.get_engine(db_path) is engine
+        assert db_interface.get_object_counts(engine)["file_metadata"] == 0
+
+        db_interface.dispose_engine(db_path)
+        new_engine = db_interface.get_engine(db_path)
+        assert new_engine is not engine
+        assert db_interface.get_object_counts(new_engine)["file_metadata"] == 0
+    finally:
+        db_interface.dispose_engine(db_path)
+
+
+@pytest.mark.parametrize(
+    "profile, want_pragmas",
+    [
+        (
+            "wal",
+            {
+                "journal_mode": "wal",
+                "synchronous": 1,
+                "cache_size": -64000,
+                "mmap_size": 268435456,
+                "busy_timeout": 5000,
+                "temp_store": 2,
+            },
+        ),
+        (
+            "durable",
+            {
+                "journal_mode": "wal",
+                "synchronous": 2,
+                "cache_size": -16000,
+                "mmap_size": 0,
+                "busy_timeout": 10000,
+                "temp_store": 0,
+            },
+        ),
+        ("none", {"journal_mode": "delete", "synchronous": 2}),
+    ],
+    ids=["wal", "durable", "none"],
+)
+def test_make_engine_sqlite_profile(tmp_path, profile: str, want_pragmas: dict[str, Any]):
+    """Tests that the connection profile's PRAGMAs are applied to new connections."""
+    engine = db_interface.make_engine(str(tmp_path / "metadata.sqlite"), profile)
+    with engine.connect() as connection:
+        for name, want in want_pragmas.items():
+            assert connection.exec_driver_sql(f"PRAGMA {name}").scalar() == want, name
+    engine.dispose()
+
+
+def test_make_engine_unknown_sqlite_profile():
+    """Tests that an unknown connection profile is rejected."""
+    with pytest.raises(ValueError):
+        db_interface.make_engine(":memory:", "fake-profile")
+
+
+def test_wal_profile_reads_during_write(tmp_path):
+    """Tests that readers are not blocked by an open write transaction with WAL."""
+    engine = db_interface.make_engine(str(tmp_path / "metadata.sqlite"), "wal")
+    with Session(engine) as session:
+        db_interface.mass_add_objects(session, copy.deepcopy(TEST_DB_DATA))
+
+    with engine.connect() as writer:
+        writer.exec_driver_sql("BEGIN EXCLUSIVE")
+        writer.exec_driver_sql("DELETE FROM file_tags")
+        assert db_interface.get_object_counts(engine)["file_tags"] == 3
+        writer.exec_driver_sql("COMMIT")
+    assert db_interface.get_object_counts(engine)["file_tags"] == 0
+    engine.dispose()
+
+
+def test_migrate_schema(tmp_path):
+    """Tests that migrate_schema adds missing indexes and columns to an existing database."""
+    engine = db_interface.make_engine(str(tmp_path / "metadata.sqlite"), "none")
+    with Session(engine) as session:
+        db_interface.mass_add_objects(session, copy.deepcopy(TEST_DB_DATA))
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_file_metadata_path")
+        connection.exec_driver_sql("DROP INDEX ix_tag_name")
+        connection.exec_driver_sql("ALTER TABLE column_stats DROP COLUMN num_empty_values")
+        connection.exec_driver_sql("ALTER TABLE column_stats DROP COLUMN distinct_sketch")
+
+    assert db_interface.migrate_schema(engine) == [
+        "Created index ix_file_metadata_path.",
+        "Created index ix_tag_name.",
+        "Added column column_stats.num_empty_values.",
+        "Added column column_stats.distinct_sketch.",
+    ]
+    assert db_interface.migrate_schema(engine) == []
+
+    with engine.connect() as connection:
+        plan = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM file_metadata WHERE path = 'test-file-2'"
+        ).all()
+    assert "ix_file_metadata_path" in plan[0][-1]
+    assert db_interface.get_all_of_model(engine, "column_stats")[0]["num_empty_values"] == 0
+    engine.dispose()
+
+
+def test_column_stats_sketches():
+    """Tests that column sketches are stored but left out of column stats dicts."""
+    engine = make_test_db()
+    with Session(engine) as session:
+        db_interface.create_or_get_object(
+            session,
+            "file_stats",
+            {
+                "path": "sketched",
+                "num_columns": 1,
+                "num_rows": 1,
+                "column_stats": [
+                    {
+                        "column_name": "sketched-column",
+                        "data_type": "numeric",
+                        "num_rows": 1,
+                        "num_unique_values": 1,
+                        "num_null_values": 0,
+                        "distinct_sketch": b"distinct",
+                        "quantile_sketch": b"quantile",
+                    }
+                ],
+            },
+        )
+        session.commit()
+
+    with Session(engine) as session:
+        column_stats = session.query(ColumnStats).filter_by(column_name="sketched-column").one()
+        assert column_stats.distinct_sketch == b"distinct"
+        assert column_stats.quantile_sketch == b"quantile"
+        assert "distinct_sketch" not in column_stats.to_dict()
+        assert "quantile_sketch" not in column_stats.to_dict()
+
+
 @pytest.mark.parametrize(
     "model_name, want",
     [
@@ -420,6 +558,7 @@ def test_mass_add_objects():
         "file_tags": 0,
         "file_stats": 0,
         "column_stats": 0,
+        "tree_change": 0,
     }
 
     with open(TEST_DB_JSON_PATH, encoding="utf-8") as file:
@@ -435,6 +574,7 @@ def test_mass_add_objects():
         "file_tags": 3,
         "file_stats": 2,
         "column_stats": 4,
+        "tree_change": 0,
     }
 
 
@@ -447,6 +587,7 @@ def test_get_object_counts():
         "file_tags": 3,
         "file_stats": 2,
         "column_stats": 4,
+        "tree_change": 0,
     }
 
 
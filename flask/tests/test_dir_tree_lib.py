@@ -1,17 +1,24 @@
 """Module test_dir_tree_lib contains tests for the dir_tree_lib module."""
 
 import copy
+import hashlib
+import io
 import json
 import os
 import shutil
+import tarfile
+import zipfile
 from typing import Any
 
 import dir_tree_lib
 import pytest
+import tree_cache
+import upload_staging
 from db import db_interface
-from sqlalchemy import Engine
+from sqlalchemy import Engine, event
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from werkzeug.datastructures import FileStorage
+from werkzeug.datastructures import FileStorage, MultiDict
 
 from tests.test_lib import dict_compare
 
@@ -114,6 +121,12 @@ def get_all_files(base_dir: str) -> list[str]:
     return all_files
 
 
+def _content_hash(path: str) -> str:
+    """Get the hash of the content of a file, which names its data file once uploaded."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
 def test_get_all_tags():
     """Test the get_all_tags function."""
     engine = make_test_db()
@@ -126,6 +139,163 @@ def test_list_tree():
     assert dir_tree_lib.list_tree(engine) == _BASE_STRUCTURE
 
 
+def test_list_tree_query_count():
+    """Test that list_tree issues a fixed number of queries regardless of catalog size."""
+    engine = make_test_db()
+    with Session(engine) as session:
+        for i in range(50):
+            db_interface.create_or_get_object(
+                session,
+                "file_metadata",
+                {
+                    "name": f"file-{i}",
+                    "path": f"bulk-folder/file-{i}",
+                    "data_file_type": "csv",
+                    "data_file_path": f"{i}.csv",
+                    "tags": ["tag-1"],
+                    "file_stats": {
+                        "path": f"bulk-folder/file-{i}",
+                        "num_columns": 10,
+                        "num_rows": 1,
+                        "column_stats": [
+                            {
+                                "column_name": f"column-{j}",
+                                "data_type": "string",
+                                "num_rows": 1,
+                                "num_unique_values": 1,
+                                "num_null_values": 0,
+                            }
+                            for j in range(10)
+                        ],
+                    },
+                },
+            )
+        session.commit()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    structure = dir_tree_lib.list_tree(engine)
+    assert len(structure["tree"]["bulk-folder"]["children"]) == 50
+    assert len(statements) == 4
+    assert not [statement for statement in statements if "stats" in statement]
+
+
+_ROOT_CHILDREN = [
+    {"type": "file", "name": "test-file-2", "full-path": "test-file-2", "tags": ["tag-1"]},
+    {"type": "folder", "name": "test-folder-1", "full-path": "test-folder-1", "file_count": 2},
+    {"type": "folder", "name": "test-folder-2", "full-path": "test-folder-2", "file_count": 1},
+    {"type": "folder", "name": "test-folder-3", "full-path": "test-folder-3", "file_count": 1},
+]
+
+
+@pytest.mark.parametrize(
+    "request_json, want_response",
+    [
+        ({}, {"folder": "", "children": _ROOT_CHILDREN, "cursor": None}),
+        (
+            {"limit": 2},
+            {"folder": "", "children": _ROOT_CHILDREN[:2], "cursor": "test-folder-10"},
+        ),
+        (
+            {"limit": 2, "cursor": "test-folder-10"},
+            {"folder": "", "children": _ROOT_CHILDREN[2:], "cursor": None},
+        ),
+        (
+            {"folder": "test-folder-1/"},
+            {
+                "folder": "test-folder-1",
+                "children": [
+                    {
+                        "type": "file",
+                        "name": "test-file-1",
+                        "full-path": "test-folder-1/test-file-1",
+                        "tags": ["tag-1", "tag-2"],
+                    },
+                    {
+                        "type": "file",
+                        "name": "test-file-3",
+                        "full-path": "test-folder-1/test-file-3",
+                        "tags": [],
+                    },
+                ],
+                "cursor": None,
+            },
+        ),
+        (
+            {"folder": "test-folder-3"},
+            {
+                "folder": "test-folder-3",
+                "children": [
+                    {
+                        "type": "folder",
+                        "name": "test-sub-folder-1",
+                        "full-path": "test-folder-3/test-sub-folder-1",
+                        "file_count": 1,
+                    },
+                ],
+                "cursor": None,
+            },
+        ),
+        ({"folder": "fake-folder"}, {"folder": "fake-folder", "children": [], "cursor": None}),
+        ({"folder": 1}, {"error": "Folder must be a string."}),
+        (
+            {"folder": "test-folder-1", "cursor": "test-folder-2/test-file-4"},
+            {"error": "Invalid cursor for folder test-folder-1."},
+        ),
+        ({"limit": 0}, {"error": "Limit must be a positive integer."}),
+        ({"limit": True}, {"error": "Limit must be a positive integer."}),
+    ],
+    ids=[
+        "root",
+        "root-first-page",
+        "root-second-page",
+        "folder-with-files",
+        "folder-with-sub-folder",
+        "missing-folder",
+        "bad-folder-gives-error",
+        "bad-cursor-gives-error",
+        "bad-limit-gives-error",
+        "bool-limit-gives-error",
+    ],
+)
+def test_list_folder(request_json: dict[str, Any], want_response: dict[str, Any]):
+    """Test the list_folder function."""
+    engine = make_test_db()
+    assert dir_tree_lib.list_folder(engine, request_json) == want_response
+
+
+def test_list_folder_skips_sub_folders():
+    """Test that listing a folder does not read the files nested in its subfolders."""
+    engine = make_test_db()
+    with Session(engine) as session:
+        for i in range(200):
+            db_interface.create_or_get_object(
+                session,
+                "file_metadata",
+                {
+                    "name": f"file-{i}",
+                    "path": f"bulk-folder/sub-folder-{i % 4}/file-{i}",
+                    "data_file_type": "csv",
+                    "data_file_path": f"{i}.csv",
+                },
+            )
+        session.commit()
+
+    statements = []
+    event.listen(
+        engine, "before_cursor_execute", lambda *args: statements.append((args[2], args[3]))
+    )
+    response = dir_tree_lib.list_folder(engine, {"folder": "bulk-folder"})
+    assert [child["file_count"] for child in response["children"]] == [50, 50, 50, 50]
+    # One seek and one count per subfolder, plus the final empty seek.
+    assert len(statements) == 9
+    with engine.connect() as connection:
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statements[0][0]}", statements[0][1]
+        )
+        assert "ix_file_metadata_path" in plan.all()[0][-1]
+
+
 @pytest.mark.parametrize(
     "request_json, want_response, want_structure, want_data_files",
     [
@@ -226,7 +396,16 @@ def test_list_tree():
                 },
                 "tags": ["tag-1", "tag-2"],
             },
-            sorted(["0.csv", "test-file-5.csv", "3.json", "data-folder-1/test-file-2.json"]),
+            # test-folder-2/test-file-4 still uses test-file-1.csv.
+            sorted(
+                [
+                    "0.csv",
+                    "test-file-1.csv",
+                    "test-file-5.csv",
+                    "3.json",
+                    "data-folder-1/test-file-2.json",
+                ]
+            ),
         ),
         (
             {"path": "test-folder-1/test-file-3", "force": True},
@@ -295,7 +474,7 @@ def test_list_tree():
         "empty-path-gives-error",
         "bad-path-gives-error",
         "bad-data-file-path-gives-error",
-        "delete-file-removes-file-and-metadata",
+        "delete-file-keeps-shared-data-file",
         "force-delete-removes-metadata-without-data-file",
     ],
 )
@@ -616,6 +795,264 @@ def test_load(request_json: dict[str, Any], want_response: dict[str, Any]):
     assert dict_compare(response, want_response)
 
 
+@pytest.mark.parametrize(
+    "request_json, want_response",
+    [
+        (
+            {"path": "test-folder-1/test-file-1", "offset": -1},
+            {"error": "Offset must be a non-negative integer."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "offset": True},
+            {"error": "Offset must be a non-negative integer."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "limit": 0},
+            {"error": "Limit must be a positive integer."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "limit": True},
+            {"error": "Limit must be a positive integer."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "columns": "column-1"},
+            {"error": "Columns must be a list of column names."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "columns": ["column-9"]},
+            {"error": "Column column-9 not found."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "offset": 1, "limit": 5, "columns": ["column-2"]},
+            {
+                "data": [["column-2"], ["value-4"]],
+                "offset": 1,
+                "limit": 5,
+                "total_rows": 2,
+            },
+        ),
+    ],
+    ids=[
+        "bad-offset-gives-error",
+        "bool-offset-gives-error",
+        "bad-limit-gives-error",
+        "bool-limit-gives-error",
+        "bad-columns-gives-error",
+        "unknown-column-gives-error",
+        "load-window",
+    ],
+)
+def test_load_window(request_json: dict[str, Any], want_response: dict[str, Any]):
+    """Test loading a window of a data file."""
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    response = dir_tree_lib.load(engine, request_json, data_file_dir=TEST_DATA_FILE_DIR)
+    response.pop("file_stats", None)
+    for key in ["name", "path", "data_file_type", "data_file_path", "tags"]:
+        response.pop(key, None)
+    assert response == want_response
+
+
+@pytest.mark.parametrize(
+    "request_json, want_response",
+    [
+        ({"chart_type": "bar"}, {"error": "Path cannot be empty."}),
+        (
+            {"path": "test-folder-1/test-file-1", "chart_type": "pie", "columns": []},
+            {"error": "Unsupported chart type: pie."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "chart_type": "bar", "columns": "column-1"},
+            {"error": "Columns must be a list of column names."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "chart_type": "bar", "columns": ["column-1"]},
+            {"error": "A bar chart takes 2 columns."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "chart_type": "line", "columns": ["column-1"]},
+            {"error": "A line chart takes at least 2 columns."},
+        ),
+        (
+            {
+                "path": "test-folder-1/test-file-1",
+                "chart_type": "histogram",
+                "columns": ["column-1"],
+                "bins": 0,
+            },
+            {"error": "Bins must be an integer from 1 to 1000."},
+        ),
+        (
+            {
+                "path": "test-folder-1/test-file-1",
+                "chart_type": "histogram",
+                "columns": ["column-1"],
+                "bins": True,
+            },
+            {"error": "Bins must be an integer from 1 to 1000."},
+        ),
+        (
+            {
+                "path": "test-folder-1/test-file-1",
+                "chart_type": "line",
+                "columns": ["column-1", "column-2"],
+                "x_type": "time",
+            },
+            {"error": "Unsupported x type: time."},
+        ),
+        (
+            {
+                "path": "test-folder-1/test-file-1",
+                "chart_type": "line",
+                "columns": ["column-1", "column-2"],
+                "max_points": 2,
+            },
+            {"error": "Max points must be an integer of at least 3."},
+        ),
+        (
+            {
+                "path": "test-folder-1/test-file-1",
+                "chart_type": "line",
+                "columns": ["column-1", "column-2"],
+                "max_points": True,
+            },
+            {"error": "Max points must be an integer of at least 3."},
+        ),
+        (
+            {
+                "path": "test-folder-1/test-file-1",
+                "chart_type": "line",
+                "columns": ["column-1", "column-2"],
+                "max_points": 100,
+                "downsample": "average",
+            },
+            {"error": "Unsupported downsampling method: average."},
+        ),
+        (
+            {"path": "fake-path", "chart_type": "histogram", "columns": ["column-1"]},
+            {"error": "File metadata not found for path fake-path."},
+        ),
+        (
+            {"path": "test-file-2", "chart_type": "histogram", "columns": ["column-1"]},
+            {"error": "Only csv data files have columns."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "chart_type": "histogram", "columns": ["x"]},
+            {"error": "Column x not found."},
+        ),
+        (
+            {
+                "path": "test-folder-1/test-file-1",
+                "chart_type": "bar",
+                "columns": ["column-2", "column-1"],
+            },
+            {
+                "path": "test-folder-1/test-file-1",
+                "chart_type": "bar",
+                "num_rows": 2,
+                "data": [],
+            },
+        ),
+    ],
+    ids=[
+        "empty-path-gives-error",
+        "bad-chart-type-gives-error",
+        "bad-columns-gives-error",
+        "too-few-columns-gives-error",
+        "too-few-line-columns-gives-error",
+        "bad-bins-gives-error",
+        "bool-bins-gives-error",
+        "bad-x-type-gives-error",
+        "bad-max-points-gives-error",
+        "bool-max-points-gives-error",
+        "bad-downsample-gives-error",
+        "missing-file-gives-error",
+        "json-gives-error",
+        "unknown-column-gives-error",
+        "aggregate",
+    ],
+)
+def test_aggregate(request_json: dict[str, Any], want_response: dict[str, Any]):
+    """Test aggregating the columns of a data file into chart series."""
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    response = dir_tree_lib.aggregate(engine, request_json, data_file_dir=TEST_DATA_FILE_DIR)
+    assert response == want_response
+
+
+@pytest.mark.parametrize(
+    "path, request_args, want_result, want_body",
+    [
+        ("", {}, {"error": "Path cannot be empty."}, None),
+        (
+            "test-folder-1/test-file-1",
+            {"offset": "-1"},
+            {"error": "Offset must be a non-negative integer."},
+            None,
+        ),
+        (
+            "fake-path",
+            {},
+            {"error": "File metadata not found for path fake-path."},
+            None,
+        ),
+        (
+            "test-file-2",
+            {"format": "ndjson"},
+            {"error": "Json data files can only be streamed as json."},
+            None,
+        ),
+        (
+            "test-file-2",
+            {},
+            {"format": "json", "total_rows": None},
+            '{\n  "column-1": "value-1"\n}\n',
+        ),
+        (
+            "test-folder-1/test-file-1",
+            {},
+            {"format": "ndjson", "total_rows": 2},
+            '["column-1", "column-2"]\n["value-1", "value-2"]\n["value-3", "value-4"]\n',
+        ),
+        (
+            "test-folder-1/test-file-1",
+            [("format", "json"), ("limit", "1"), ("columns", "column-2"), ("columns", "column-1")],
+            {"format": "json", "total_rows": 2},
+            '[["column-2", "column-1"],["value-2", "value-1"]]',
+        ),
+    ],
+    ids=[
+        "empty-path-gives-error",
+        "bad-offset-gives-error",
+        "missing-file-gives-error",
+        "json-ndjson-gives-error",
+        "stream-json-file",
+        "stream-ndjson",
+        "stream-json-window",
+    ],
+)
+def test_stream_data(
+    path: str,
+    request_args: Any,
+    want_result: dict[str, Any],
+    want_body: str | None,
+):
+    """Test streaming a data file."""
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    result, chunks = dir_tree_lib.stream_data(
+        engine, path, MultiDict(request_args), data_file_dir=TEST_DATA_FILE_DIR
+    )
+    assert result == want_result
+    if want_body is None:
+        assert chunks is None
+    else:
+        assert (
+            "".join(chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in chunks)
+            == want_body
+        )
+
+
 @pytest.mark.parametrize(
     "request_files, request_form, want",
     [
@@ -657,8 +1094,10 @@ def test_upload_errors(
     assert response == want
 
 
-def test_upload_success():
+def test_upload_success(monkeypatch):
     """Tests upload success."""
+    # In-memory test databases are per thread, so analysis runs inline.
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
     engine = make_test_db()
     create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
 
@@ -680,6 +1119,16 @@ def test_upload_success():
             {"path": "test-folder-1/test-6"},
             data_file_dir=TEST_DATA_FILE_DIR,
         )
+    assert dir_tree_lib.get_analysis_queue(engine).join(timeout=30)
+    assert dir_tree_lib.status(engine, {"path": "test-folder-1/test-6"}) == {
+        "path": "test-folder-1/test-6",
+        "status": "ready",
+    }
+    with Session(engine) as session:
+        file_metadata = db_interface.get_db_object_by_key(
+            session, "file_metadata", "path", "test-folder-1/test-6"
+        )
+        assert file_metadata.file_stats.num_rows == 4
 
     new_structure = copy.deepcopy(_BASE_STRUCTURE)
     new_structure["tree"]["test-folder-1"]["children"]["test-6"] = {
@@ -688,10 +1137,191 @@ def test_upload_success():
         "tags": [],
     }
     assert dir_tree_lib.list_tree(engine) == new_structure
+    data_filename = _content_hash(os.path.join(TESTDATA_DIR, "test-csv.csv")) + ".csv"
+    assert sorted(get_all_files(TEST_DATA_FILE_DIR)) == sorted(
+        [
+            "0.csv",
+            data_filename,
+            f"{data_filename}.rowidx",
+            f"{data_filename}.parquet",
+            "test-file-1.csv",
+            "test-file-5.csv",
+            "3.json",
+            "data-folder-1/test-file-2.json",
+        ]
+    )
+
+
+def test_upload_duplicate(monkeypatch):
+    """Test that identical uploads share their data file and stats, and that the data file
+    is only deleted with the last file using it."""
+    # In-memory test databases are per thread, so analysis runs inline.
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    queue = dir_tree_lib.get_analysis_queue(engine)
+
+    for path in ["test-folder-1/test-6", "test-folder-2/test-6"]:
+        with open(os.path.join(TESTDATA_DIR, "test-csv.csv"), "rb") as f:
+            assert not dir_tree_lib.upload(
+                engine,
+                {"file": FileStorage(filename="test.csv", stream=f)},
+                {"path": path},
+                data_file_dir=TEST_DATA_FILE_DIR,
+            )
+    assert queue.join(timeout=30)
+    assert dir_tree_lib.status(engine, {}) == {"pending": 0, "capacity": queue.max_pending}
+
+    data_filename = _content_hash(os.path.join(TESTDATA_DIR, "test-csv.csv")) + ".csv"
+    with Session(engine) as session:
+        first, second = (
+            db_interface.get_db_object_by_key(session, "file_metadata", "path", path)
+            for path in ["test-folder-1/test-6", "test-folder-2/test-6"]
+        )
+        assert first.data_file_path == second.data_file_path == data_filename
+        assert second.status == "ready"
+        assert second.file_stats.path == "test-folder-2/test-6"
+        assert {**second.file_stats.to_dict(True), "path": first.file_stats.path} == (
+            first.file_stats.to_dict(True)
+        )
+
+    full_path = os.path.join(TEST_DATA_FILE_DIR, data_filename)
+    assert not dir_tree_lib.tree_delete(
+        engine, {"path": "test-folder-1/test-6"}, data_file_dir=TEST_DATA_FILE_DIR
+    )
+    assert os.path.exists(full_path)
+    assert not dir_tree_lib.tree_delete(
+        engine, {"path": "test-folder-2/test-6"}, data_file_dir=TEST_DATA_FILE_DIR
+    )
+    assert not os.path.exists(full_path)
+
+
+def test_delete_copied_file():
+    """Test that deleting a copy keeps the data file its source still uses."""
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    assert not dir_tree_lib.copy(
+        engine, {"source": "test-folder-1/test-file-1", "dest": "test-folder-2/test-file-1"}
+    )
+    assert not dir_tree_lib.tree_delete(
+        engine, {"path": "test-folder-2/test-file-1"}, data_file_dir=TEST_DATA_FILE_DIR
+    )
+    assert os.path.exists(os.path.join(TEST_DATA_FILE_DIR, "test-file-1.csv"))
+
+
+def test_delete_data_file_before_commit(monkeypatch):
+    """Test that the data file of the last file using it is deleted before the removal is
+    committed, while the database write lock keeps other processes from using it."""
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    data_file_exists_at_commit = []
+    commit = Session.commit
+
+    def check_commit(session: Session):
+        data_file_exists_at_commit.append(
+            os.path.exists(os.path.join(TEST_DATA_FILE_DIR, "test-file-5.csv"))
+        )
+        commit(session)
+
+    monkeypatch.setattr(Session, "commit", check_commit)
+    assert (
+        dir_tree_lib.tree_delete(
+            engine,
+            {"path": "test-folder-3/test-sub-folder-1/test-file-5"},
+            data_file_dir=TEST_DATA_FILE_DIR,
+        )
+        == {}
+    )
+    assert data_file_exists_at_commit == [False]
+
+
+def _archive(kind: str, entries: dict[str, bytes]) -> io.BytesIO:
+    """Make a zip or gzipped tar archive of entries."""
+    archive = io.BytesIO()
+    if kind == "zip":
+        with zipfile.ZipFile(archive, "w") as f:
+            for name, content in entries.items():
+                f.writestr(name, content)
+    else:
+        with tarfile.open(fileobj=archive, mode="w:gz") as f:
+            for name, content in entries.items():
+                member = tarfile.TarInfo(name)
+                member.size = len(content)
+                f.addfile(member, io.BytesIO(content))
+    archive.seek(0)
+    return archive
+
+
+@pytest.mark.parametrize("filename", ["sweep.zip", "sweep.tar.gz"])
+def test_upload_archive(monkeypatch, filename: str):
+    """Test that the files of an archive are added under a folder in one go, with a report
+    of each entry, and their analysis is queued."""
+    # In-memory test databases are per thread, so analysis runs inline.
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    with open(os.path.join(TESTDATA_DIR, "test-csv.csv"), "rb") as f:
+        content = f.read()
+    with open(os.path.join(TESTDATA_DIR, "baseline", "3.json"), "rb") as f:
+        not_result = f.read()
+    archive = _archive(
+        "zip" if filename.endswith(".zip") else "tar",
+        {
+            "run-1.csv": content,
+            "runs/run-2.csv": content,
+            "runs/notes.json": not_result,
+            "test-file-1.csv": content,
+            "notes.txt": b"notes",
+            "../run-3.csv": content,
+        },
+    )
+    response = dir_tree_lib.upload(
+        engine,
+        {"file": FileStorage(filename=filename, stream=archive)},
+        {"path": "test-folder-1/"},
+        data_file_dir=TEST_DATA_FILE_DIR,
+    )
+    assert response == {
+        "entries": [
+            {"entry": "run-1.csv", "path": "test-folder-1/run-1", "status": "pending"},
+            {"entry": "runs/run-2.csv", "path": "test-folder-1/runs/run-2", "status": "pending"},
+            {"entry": "runs/notes.json", "path": "test-folder-1/runs/notes", "status": "pending"},
+            {
+                "entry": "test-file-1.csv",
+                "path": "test-folder-1/test-file-1",
+                "error": "Path test-folder-1/test-file-1 already exists.",
+            },
+            {"entry": "notes.txt", "error": "File type txt is not supported."},
+            {"entry": "../run-3.csv", "error": "Entry ../run-3.csv is outside of the archive."},
+        ]
+    }
+
+    children = dir_tree_lib.list_tree(engine)["tree"]["test-folder-1"]["children"]
+    assert {"run-1", "runs"} <= children.keys()
+    assert set(children["runs"]["children"]) == {"run-2", "notes"}
+    data_filename = _content_hash(os.path.join(TESTDATA_DIR, "test-csv.csv")) + ".csv"
+    with Session(engine) as session:
+        first, second, notes = (
+            db_interface.get_db_object_by_key(session, "file_metadata", "path", path)
+            for path in [
+                "test-folder-1/run-1",
+                "test-folder-1/runs/run-2",
+                "test-folder-1/runs/notes",
+            ]
+        )
+        assert first.data_file_path == second.data_file_path == data_filename
+        assert first.status == second.status == "ready"
+        assert first.file_stats.num_rows == second.file_stats.num_rows == 4
+        assert notes.status == "failed"
+    queue = dir_tree_lib.get_analysis_queue(engine)
+    assert dir_tree_lib.status(engine, {}) == {"pending": 0, "capacity": queue.max_pending}
     assert sorted(get_all_files(TEST_DATA_FILE_DIR)) == sorted(
         [
             "0.csv",
-            "1.csv",
+            data_filename,
+            f"{data_filename}.rowidx",
+            f"{data_filename}.parquet",
+            _content_hash(os.path.join(TESTDATA_DIR, "baseline", "3.json")) + ".json",
             "test-file-1.csv",
             "test-file-5.csv",
             "3.json",
@@ -700,6 +1330,566 @@ def test_upload_success():
     )
 
 
+def test_upload_archive_more_entries_than_queue(monkeypatch):
+    """Test that an archive with more new data files than the analysis queue holds is added
+    whole and analyzed in one queued job."""
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_SIZE", 2)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    queue = dir_tree_lib.get_analysis_queue(engine)
+    # Leave one free slot, for the one job analyzing every entry.
+    assert queue.reserve()
+    num_entries = 5
+    archive = _archive(
+        "zip", {f"run-{i}.csv": f"a\n{i}\n{i + 1}\n".encode() for i in range(num_entries)}
+    )
+    response = dir_tree_lib.upload(
+        engine,
+        {"file": FileStorage(filename="sweep.zip", stream=archive)},
+        {"path": "sweep"},
+        data_file_dir=TEST_DATA_FILE_DIR,
+    )
+    assert response == {
+        "entries": [
+            {"entry": f"run-{i}.csv", "path": f"sweep/run-{i}", "status": "pending"}
+            for i in range(num_entries)
+        ]
+    }
+    queue.cancel()
+    assert dir_tree_lib.status(engine, {}) == {"pending": 0, "capacity": 2}
+    with Session(engine) as session:
+        for i in range(num_entries):
+            file_metadata = db_interface.get_db_object_by_key(
+                session, "file_metadata", "path", f"sweep/run-{i}"
+            )
+            assert file_metadata.status == "ready"
+            assert file_metadata.file_stats.num_rows == 2
+
+
+@pytest.mark.parametrize(
+    "filename, stream, want",
+    [
+        ("sweep.zip", io.BytesIO(b"a,b\n"), {"error": "File is not a valid zip archive."}),
+        ("sweep.tar", io.BytesIO(b"a,b\n"), {"error": "File is not a valid tar archive."}),
+        (
+            "sweep.zip",
+            _archive("zip", {f"run-{i}.csv": f"a\n{i}\n".encode() for i in range(3)}),
+            {"error": "Archive has more than 2 files."},
+        ),
+        (
+            "sweep.tar.gz",
+            _archive("tar", {"run-1.csv": b"a\n" + b"1\n" * 8, "run-2.csv": b"a\n" + b"2\n" * 8}),
+            {"error": "Archive expands to more than 32 bytes."},
+        ),
+    ],
+    ids=[
+        "bad-zip-gives-error",
+        "bad-tar-gives-error",
+        "too-many-files-gives-error",
+        "too-many-bytes-gives-error",
+    ],
+)
+def test_upload_archive_errors(monkeypatch, filename: str, stream: io.BytesIO, want: dict):
+    """Test that archives that cannot be expanded add no files and reserve no analysis,
+    whether or not uploads have a size limit."""
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    monkeypatch.setattr(dir_tree_lib, "MAX_UPLOAD_BYTES", 0)
+    monkeypatch.setattr(dir_tree_lib, "MAX_ARCHIVE_ENTRIES", 2)
+    monkeypatch.setattr(dir_tree_lib, "MAX_ARCHIVE_BYTES", 32)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    before = sorted(get_all_files(TEST_DATA_FILE_DIR))
+    response = dir_tree_lib.upload(
+        engine,
+        {"file": FileStorage(filename=filename, stream=stream)},
+        {"path": "sweep"},
+        data_file_dir=TEST_DATA_FILE_DIR,
+    )
+    assert response == want
+    assert dir_tree_lib.list_tree(engine) == _BASE_STRUCTURE
+    assert sorted(get_all_files(TEST_DATA_FILE_DIR)) == before
+    queue = dir_tree_lib.get_analysis_queue(engine)
+    assert dir_tree_lib.status(engine, {}) == {"pending": 0, "capacity": queue.max_pending}
+
+
+@pytest.mark.parametrize(
+    "error, want_response",
+    [
+        (
+            IntegrityError("INSERT INTO file_metadata", {}, Exception("UNIQUE constraint failed")),
+            {"error": "Path test-folder-1/test-6 already exists."},
+        ),
+        (RuntimeError("database went away"), None),
+    ],
+    ids=["path-added-by-other-process-gives-error", "failed-insert-raises"],
+)
+def test_upload_failed_insert(monkeypatch, error: Exception, want_response: dict | None):
+    """Test that an upload whose file metadata cannot be added leaves no temporary file and
+    gives back its analysis queue slot."""
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    before = sorted(get_all_files(TEST_DATA_FILE_DIR))
+
+    def fail_insert(*_args):
+        raise error
+
+    monkeypatch.setattr(db_interface, "create_or_get_object", fail_insert)
+    with open(os.path.join(TESTDATA_DIR, "test-csv.csv"), "rb") as f:
+        request_files = {"file": FileStorage(filename="test.csv", stream=f)}
+        request_form = {"path": "test-folder-1/test-6"}
+        if want_response is None:
+            with pytest.raises(type(error)):
+                dir_tree_lib.upload(
+                    engine, request_files, request_form, data_file_dir=TEST_DATA_FILE_DIR
+                )
+        else:
+            assert (
+                dir_tree_lib.upload(
+                    engine, request_files, request_form, data_file_dir=TEST_DATA_FILE_DIR
+                )
+                == want_response
+            )
+    assert sorted(get_all_files(TEST_DATA_FILE_DIR)) == before
+    queue = dir_tree_lib.get_analysis_queue(engine)
+    assert dir_tree_lib.status(engine, {}) == {"pending": 0, "capacity": queue.max_pending}
+
+
+def test_upload_too_large(monkeypatch):
+    """Test that uploads larger than the size limit are turned away."""
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    monkeypatch.setattr(dir_tree_lib, "MAX_UPLOAD_BYTES", 10)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    with open(os.path.join(TESTDATA_DIR, "test-csv.csv"), "rb") as f:
+        assert dir_tree_lib.upload(
+            engine,
+            {"file": FileStorage(filename="test.csv", stream=f)},
+            {"path": "test-folder-1/test-6"},
+            data_file_dir=TEST_DATA_FILE_DIR,
+        ) == {"error": "File is larger than the upload limit of 10 bytes."}
+    assert dir_tree_lib.list_tree(engine) == _BASE_STRUCTURE
+    queue = dir_tree_lib.get_analysis_queue(engine)
+    assert dir_tree_lib.status(engine, {}) == {"pending": 0, "capacity": queue.max_pending}
+
+
+@pytest.mark.parametrize(
+    "request_json, want",
+    [
+        ({"filename": "test.csv", "size": 1}, {"error": "Path not found in request."}),
+        ({"path": "test-6", "size": 1}, {"error": "File has no filename."}),
+        (
+            {"path": "test-6", "filename": "test.txt", "size": 1},
+            {"error": "File type txt is not supported."},
+        ),
+        (
+            {"path": "test-6", "filename": "test.csv", "size": -1},
+            {"error": "Size must be a non-negative integer."},
+        ),
+        (
+            {"path": "test-6", "filename": "test.csv", "size": 11},
+            {"error": "File is larger than the upload limit of 10 bytes."},
+        ),
+        (
+            {"path": "test-folder-1/test-file-1", "filename": "test.csv", "size": 1},
+            {"error": "Path test-folder-1/test-file-1 already exists."},
+        ),
+    ],
+    ids=[
+        "no-path-gives-error",
+        "no-filename-gives-error",
+        "unsupported-extension-gives-error",
+        "negative-size-gives-error",
+        "too-large-gives-error",
+        "existing-path-gives-error",
+    ],
+)
+def test_start_chunked_upload_errors(monkeypatch, request_json: dict[str, Any], want: dict):
+    """Test the errors of starting a resumable upload."""
+    monkeypatch.setattr(dir_tree_lib, "MAX_UPLOAD_BYTES", 10)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    assert (
+        dir_tree_lib.start_chunked_upload(engine, request_json, data_file_dir=TEST_DATA_FILE_DIR)
+        == want
+    )
+
+
+def test_chunked_upload(monkeypatch):
+    """Test that a file put in chunks, out of order and with retries, is uploaded once all
+    its chunks are put."""
+    # In-memory test databases are per thread, so analysis runs inline.
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    monkeypatch.setattr(upload_staging, "UPLOAD_CHUNK_SIZE", 16)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    with open(os.path.join(TESTDATA_DIR, "test-csv.csv"), "rb") as f:
+        content = f.read()
+
+    started = dir_tree_lib.start_chunked_upload(
+        engine,
+        {"path": "test-folder-1/test-6", "filename": "test.csv", "size": len(content)},
+        data_file_dir=TEST_DATA_FILE_DIR,
+    )
+    upload_id = started["upload_id"]
+    num_chunks = -(-len(content) // 16)
+    assert started == {"upload_id": upload_id, "chunk_size": 16, "num_chunks": num_chunks}
+    chunks = [content[i : i + 16] for i in range(0, len(content), 16)]
+    for index in reversed(range(1, num_chunks)):
+        assert not dir_tree_lib.upload_chunk(
+            upload_id, index, io.BytesIO(chunks[index]), data_file_dir=TEST_DATA_FILE_DIR
+        )
+    assert dir_tree_lib.finish_chunked_upload(
+        engine, upload_id, data_file_dir=TEST_DATA_FILE_DIR
+    ) == {"error": f"Upload {upload_id} is missing 1 chunks."}
+    assert dir_tree_lib.chunked_upload_status(upload_id, data_file_dir=TEST_DATA_FILE_DIR) == {
+        "upload_id": upload_id,
+        "path": "test-folder-1/test-6",
+        "data_file_type": "csv",
+        "size": len(content),
+        "chunk_size": 16,
+        "missing": [0],
+    }
+    for chunk in [b"x" * 16, chunks[0]]:
+        assert not dir_tree_lib.upload_chunk(
+            upload_id, 0, io.BytesIO(chunk), data_file_dir=TEST_DATA_FILE_DIR
+        )
+
+    assert not dir_tree_lib.finish_chunked_upload(
+        engine, upload_id, data_file_dir=TEST_DATA_FILE_DIR
+    )
+    assert dir_tree_lib.get_analysis_queue(engine).join(timeout=30)
+    assert dir_tree_lib.status(engine, {"path": "test-folder-1/test-6"}) == {
+        "path": "test-folder-1/test-6",
+        "status": "ready",
+    }
+    data_filename = _content_hash(os.path.join(TESTDATA_DIR, "test-csv.csv")) + ".csv"
+    with open(os.path.join(TEST_DATA_FILE_DIR, data_filename), "rb") as f:
+        assert f.read() == content
+    assert dir_tree_lib.chunked_upload_status(upload_id, data_file_dir=TEST_DATA_FILE_DIR) == {
+        "error": f"Upload {upload_id} not found."
+    }
+    assert not os.listdir(upload_staging.staging_dir(TEST_DATA_FILE_DIR))
+
+
+def test_finish_chunked_upload_keeps_chunks(monkeypatch):
+    """Test that the chunks of an upload that cannot be finished are kept for a retry,
+    until the upload is cancelled."""
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    upload_id = dir_tree_lib.start_chunked_upload(
+        engine,
+        {"path": "test-folder-1/test-6", "filename": "test.csv", "size": 4},
+        data_file_dir=TEST_DATA_FILE_DIR,
+    )["upload_id"]
+    assert not dir_tree_lib.upload_chunk(
+        upload_id, 0, io.BytesIO(b"a\n1\n"), data_file_dir=TEST_DATA_FILE_DIR
+    )
+    queue = dir_tree_lib.get_analysis_queue(engine)
+    for _ in range(queue.max_pending):
+        assert queue.reserve()
+    try:
+        assert dir_tree_lib.finish_chunked_upload(
+            engine, upload_id, data_file_dir=TEST_DATA_FILE_DIR
+        ) == {"error": "Analysis queue is full. Try again later."}
+    finally:
+        for _ in range(queue.max_pending):
+            queue.cancel()
+    assert (
+        dir_tree_lib.chunked_upload_status(upload_id, data_file_dir=TEST_DATA_FILE_DIR)["missing"]
+        == []
+    )
+    assert not dir_tree_lib.cancel_chunked_upload(upload_id, data_file_dir=TEST_DATA_FILE_DIR)
+    assert dir_tree_lib.cancel_chunked_upload(upload_id, data_file_dir=TEST_DATA_FILE_DIR) == {
+        "error": f"Upload {upload_id} not found."
+    }
+
+
+def test_upload_queue_full(monkeypatch):
+    """Test that uploads are turned away while the analysis queue is full."""
+    # In-memory test databases are per thread, so analysis runs inline.
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    queue = dir_tree_lib.get_analysis_queue(engine)
+    for _ in range(queue.max_pending):
+        assert queue.reserve()
+    try:
+        assert dir_tree_lib.status(engine, {}) == {
+            "pending": queue.max_pending,
+            "capacity": queue.max_pending,
+        }
+        with open(os.path.join(TESTDATA_DIR, "test-csv.csv"), "rb") as f:
+            assert dir_tree_lib.upload(
+                engine,
+                {"file": FileStorage(filename="test.csv", stream=f)},
+                {"path": "test-folder-1/test-6"},
+                data_file_dir=TEST_DATA_FILE_DIR,
+            ) == {"error": "Analysis queue is full. Try again later."}
+        assert dir_tree_lib.upload(
+            engine,
+            {
+                "file": FileStorage(
+                    filename="sweep.zip", stream=_archive("zip", {"run.csv": b"a\n"})
+                )
+            },
+            {"path": "test-folder-1"},
+            data_file_dir=TEST_DATA_FILE_DIR,
+        ) == {"error": "Analysis queue is full. Try again later."}
+    finally:
+        for _ in range(queue.max_pending):
+            queue.cancel()
+    assert dir_tree_lib.status(engine, {}) == {"pending": 0, "capacity": queue.max_pending}
+    assert "test-6" not in dir_tree_lib.list_tree(engine)["tree"]["test-folder-1"]["children"]
+
+
+def test_analyze_pending_file(monkeypatch):
+    """Test that pending files sharing a data file get its stats, or are marked as failed."""
+    # In-memory test databases are per thread, so analysis runs inline.
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    with Session(engine) as session:
+        for path, data_file_path in [
+            ("pending-1", "0.csv"),
+            ("pending-2", "0.csv"),
+            ("bad", "3.json"),
+        ]:
+            db_interface.create_or_get_object(
+                session,
+                "file_metadata",
+                {
+                    "name": path,
+                    "path": path,
+                    "data_file_type": os.path.splitext(data_file_path)[1][1:],
+                    "data_file_path": data_file_path,
+                    "status": "pending",
+                    "tags": [],
+                },
+            )
+        session.commit()
+
+    assert dir_tree_lib.copy(engine, {"source": "pending-1", "dest": "pending-copy"}) == {}
+    assert dir_tree_lib.status(engine, {"path": "pending-copy"})["status"] == "pending"
+    assert dir_tree_lib.resume_analysis(engine, data_file_dir=TEST_DATA_FILE_DIR) == 2
+    assert dir_tree_lib.get_analysis_queue(engine).join(timeout=30)
+
+    with Session(engine) as session:
+        for path in ["pending-1", "pending-2", "pending-copy"]:
+            assert dir_tree_lib.status(engine, {"path": path}) == {"path": path, "status": "ready"}
+            file_metadata = db_interface.get_db_object_by_key(
+                session, "file_metadata", "path", path
+            )
+            assert file_metadata.file_stats.path == path
+            assert file_metadata.file_stats.num_rows > 0
+    bad_status = dir_tree_lib.status(engine, {"path": "bad"})
+    assert bad_status["status"] == "failed"
+    assert bad_status["analysis_error"].startswith("Analysis failed: ")
+    assert dir_tree_lib.status(engine, {"path": "not-a-file"}) == {
+        "error": "File metadata not found for path not-a-file."
+    }
+    assert dir_tree_lib.resume_analysis(engine, data_file_dir=TEST_DATA_FILE_DIR) == 0
+
+
+def test_distribution(monkeypatch):
+    """Test getting the distribution of a column from the sketches stored with its stats."""
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    shutil.copy(os.path.join(TESTDATA_DIR, "test-csv.csv"), TEST_DATA_FILE_DIR)
+    with Session(engine) as session:
+        db_interface.create_or_get_object(
+            session,
+            "file_metadata",
+            {
+                "name": "stats",
+                "path": "stats",
+                "data_file_type": "csv",
+                "data_file_path": "test-csv.csv",
+                "status": "pending",
+                "tags": [],
+            },
+        )
+        session.commit()
+    assert dir_tree_lib.resume_analysis(engine, data_file_dir=TEST_DATA_FILE_DIR) == 1
+
+    numeric = dir_tree_lib.distribution(
+        engine, {"path": "stats", "column": "column-3", "quantiles": [0, 1]}
+    )
+    assert numeric == {
+        "path": "stats",
+        "column": "column-3",
+        "data_type": "numeric",
+        "histogram": numeric["histogram"],
+        "quantiles": [{"key": 0, "data": 3.0}, {"key": 1, "data": 4.0}],
+    }
+    assert [point["data"] for point in numeric["histogram"]] == [2] + [0] * 18 + [1]
+    assert numeric["histogram"][0]["key"] == "3.0-3.0"
+    assert dir_tree_lib.distribution(engine, {"path": "stats", "column": "column-2"}) == {
+        "path": "stats",
+        "column": "column-2",
+        "data_type": "string",
+        "top_values": [
+            {"key": "hello", "data": 1},
+            {"key": "universe", "data": 1},
+            {"key": "world", "data": 1},
+        ],
+        "top_values_error": 0,
+    }
+
+    for request_json, want_error in [
+        ({"column": "column-1"}, "Path cannot be empty."),
+        ({"path": "stats"}, "Column must be a column name."),
+        ({"path": "stats", "column": "column-1", "quantiles": [2]}, "Quantiles must be"),
+        ({"path": "stats", "column": "column-1", "quantiles": [True]}, "Quantiles must be"),
+        ({"path": "fake-path", "column": "column-1"}, "File metadata not found"),
+        ({"path": "stats", "column": "column-9"}, "Column column-9 not found."),
+    ]:
+        assert dir_tree_lib.distribution(engine, request_json)["error"].startswith(want_error)
+
+
+def test_tree_cache_is_patched_by_mutations(monkeypatch):
+    """Test that mutations patch the cached tree to match a fresh rebuild."""
+    # In-memory test databases are per thread, so analysis runs inline.
+    monkeypatch.setattr(dir_tree_lib, "ANALYSIS_QUEUE_WORKERS", 0)
+    engine = make_test_db()
+    create_test_data_files(os.path.join(TESTDATA_DIR, "baseline"), TEST_DATA_FILE_DIR)
+    assert dir_tree_lib.list_tree(engine) == _BASE_STRUCTURE
+    _, start_version = dir_tree_lib.get_tree_snapshot(engine)
+
+    assert not dir_tree_lib.move(
+        engine, {"source": "test-folder-1/test-file-1", "dest": "test-folder-4/test-file-1"}
+    )
+    assert not dir_tree_lib.copy(
+        engine, {"source": "test-folder-4/test-file-1", "dest": "test-file-1-copy"}
+    )
+    assert not dir_tree_lib.update(engine, {"path": "test-file-2", "tags": ["tag-3"]})
+    assert not dir_tree_lib.tree_delete(
+        engine,
+        {"path": "test-folder-3/test-sub-folder-1/test-file-5"},
+        data_file_dir=TEST_DATA_FILE_DIR,
+    )
+    with open(os.path.join(TESTDATA_DIR, "test-csv.csv"), "rb") as f:
+        assert not dir_tree_lib.upload(
+            engine,
+            {"file": FileStorage(filename="test.csv", stream=f)},
+            {"path": "test-folder-2/test-6"},
+            data_file_dir=TEST_DATA_FILE_DIR,
+        )
+
+    structure, version = dir_tree_lib.get_tree_snapshot(engine)
+    assert version == start_version + 5
+    rebuilt = tree_cache.TreeCache()
+    rebuilt.load(db_interface.get_tree_entries(engine), dir_tree_lib.get_all_tags(engine))
+    assert structure == rebuilt.snapshot()[0]
+    assert "test-folder-3" not in structure["tree"]
+    assert structure["tags"] == ["tag-1", "tag-2", "tag-3"]
+
+
+@pytest.mark.parametrize(
+    "request_json, want_response",
+    [
+        ({}, {"error": "Since must be a non-negative integer."}),
+        ({"since": -1}, {"error": "Since must be a non-negative integer."}),
+        ({"since": False}, {"error": "Since must be a non-negative integer."}),
+        ({"since": 0, "limit": 0}, {"error": "Limit must be a positive integer."}),
+        ({"since": 0, "limit": True}, {"error": "Limit must be a positive integer."}),
+        ({"since": 0}, {"version": 0, "changes": [], "has_more": False}),
+    ],
+    ids=["missing-since", "negative-since", "bool-since", "bad-limit", "bool-limit", "no-changes"],
+)
+def test_changes_errors(request_json: dict[str, Any], want_response: dict[str, Any]):
+    """Test the changes function on invalid requests and an unchanged tree."""
+    engine = make_test_db()
+    assert dir_tree_lib.changes(engine, request_json) == want_response
+
+
+def test_changes():
+    """Test that changes returns the mutations made after a version, oldest first."""
+    engine = make_test_db()
+    _, start_version = dir_tree_lib.get_tree_snapshot(engine)
+
+    assert not dir_tree_lib.move(
+        engine, {"source": "test-folder-1/test-file-1", "dest": "test-folder-4/test-file-1"}
+    )
+    assert not dir_tree_lib.update(engine, {"path": "test-file-2", "name": "test-file-2-new"})
+    assert not dir_tree_lib.update(engine, {"path": "test-file-2", "tags": ["tag-3"]})
+    assert not dir_tree_lib.copy(
+        engine, {"source": "test-folder-4/test-file-1", "dest": "test-folder-2/test-file-1"}
+    )
+    assert not dir_tree_lib.tree_delete(
+        engine,
+        {"path": "test-folder-1/test-file-3", "force": True},
+        data_file_dir=TEST_DATA_FILE_DIR,
+    )
+
+    want_changes = [
+        {
+            "version": start_version + 1,
+            "action": "move",
+            "path": "test-folder-1/test-file-1",
+            "dest": "test-folder-4/test-file-1",
+            "tags": ["tag-1", "tag-2"],
+        },
+        {
+            "version": start_version + 2,
+            "action": "retag",
+            "path": "test-file-2",
+            "dest": None,
+            "tags": ["tag-3"],
+        },
+        {
+            "version": start_version + 3,
+            "action": "add",
+            "path": "test-folder-2/test-file-1",
+            "dest": None,
+            "tags": ["tag-1", "tag-2"],
+        },
+        {
+            "version": start_version + 4,
+            "action": "remove",
+            "path": "test-folder-1/test-file-3",
+            "dest": None,
+            "tags": [],
+        },
+    ]
+    assert dir_tree_lib.changes(engine, {"since": start_version}) == {
+        "version": start_version + 4,
+        "changes": want_changes,
+        "has_more": False,
+    }
+    assert dir_tree_lib.changes(engine, {"since": start_version, "limit": 3}) == {
+        "version": start_version + 3,
+        "changes": want_changes[:3],
+        "has_more": True,
+    }
+    assert dir_tree_lib.changes(engine, {"since": start_version + 3}) == {
+        "version": start_version + 4,
+        "changes": want_changes[3:],
+        "has_more": False,
+    }
+
+    structure, version = dir_tree_lib.get_tree_snapshot(engine)
+    assert version == start_version + 4
+    replayed = tree_cache.TreeCache()
+    replayed.load(
+        [
+            {"path": "test-folder-1/test-file-1", "tags": ["tag-1", "tag-2"]},
+            {"path": "test-file-2", "tags": ["tag-1"]},
+            {"path": "test-folder-1/test-file-3", "tags": []},
+            {"path": "test-folder-2/test-file-4", "tags": []},
+            {"path": "test-folder-3/test-sub-folder-1/test-file-5", "tags": []},
+        ],
+        ["tag-1", "tag-2"],
+        start_version,
+    )
+    for change in want_changes:
+        replayed.apply_change(change)
+    assert replayed.snapshot() == (structure, version)
+
+
 _BASELINE_TEST_FILE_2 = {
     "name": "test-file-2",
     "path": "test-file-2",
@@ -0,0 +1,75 @@
+"""Module test_downsample contains tests for the downsample module."""
+
+import itertools
+import math
+
+import numpy as np
+import pytest
+from data import downsample
+
+
+def _reference_lttb(x: list[float], y: list[float], num_points: int) -> list[int]:
+    """Pick points by largest-triangle-three-buckets one point at a time."""
+    every = (len(x) - 2) / (num_points - 2)
+    kept = [0]
+    for i in range(num_points - 2):
+        next_start = math.floor((i + 1) * every) + 1
+        next_stop = min(math.floor((i + 2) * every) + 1, len(x))
+        cx = sum(x[next_start:next_stop]) / (next_stop - next_start)
+        cy = sum(y[next_start:next_stop]) / (next_stop - next_start)
+        a = kept[-1]
+        areas = [
+            abs((x[a] - cx) * (y[b] - y[a]) - (x[a] - x[b]) * (cy - y[a]))
+            for b in range(math.floor(i * every) + 1, next_start)
+        ]
+        kept.append(math.floor(i * every) + 1 + areas.index(max(areas)))
+    return kept + [len(x) - 1]
+
+
+@pytest.mark.parametrize(
+    "num_values, num_points",
+    [(10, 5), (100, 7), (1000, 50), (1001, 1000), (57, 3)],
+)
+def test_lttb(num_values: int, num_points: int):
+    """Test that the points picked match those picked one point at a time."""
+    rng = np.random.default_rng(num_values)
+    x = np.sort(rng.random(num_values))
+    y = rng.random(num_values)
+    kept = downsample.lttb(x, y, num_points)
+    assert kept.tolist() == _reference_lttb(x.tolist(), y.tolist(), num_points)
+
+
+@pytest.mark.parametrize("num_points", [2, 10, 11])
+def test_lttb_keeps_all(num_points: int):
+    """Test that all points are kept when they fit, or when there are too few buckets."""
+    assert downsample.lttb(np.arange(10), np.arange(10), num_points).tolist() == list(range(10))
+
+
+@pytest.mark.parametrize(
+    "num_values, num_points",
+    [(10, 6), (100, 7), (1000, 50), (1001, 1000), (57, 4), (57, 5)],
+)
+def test_min_max(num_values: int, num_points: int):
+    """Test that the first min and max of each bucket are kept, with the first and last
+    points, in order."""
+    rng = np.random.default_rng(num_values)
+    y = rng.integers(0, 5, num_values).astype(float)
+    kept = downsample.min_max(np.arange(num_values), y, num_points)
+
+    num_buckets = (num_points - 2) // 2
+    starts = [1 + (i * (num_values - 2)) // num_buckets for i in range(num_buckets + 1)]
+    want = {0, num_values - 1}
+    for start, stop in itertools.pairwise(starts):
+        want |= {start + int(np.argmin(y[start:stop])), start + int(np.argmax(y[start:stop]))}
+    assert kept.tolist() == sorted(want)
+    assert len(kept) <= num_points
+
+
+def test_min_max_keeps_spikes():
+    """Test that a spike is kept however few points are asked for."""
+    y = np.zeros(10_000)
+    y[1234] = 100.0
+    y[8765] = -100.0
+    kept = downsample.min_max(np.arange(len(y)), y, 4)
+    assert 1234 in kept
+    assert 8765 in kept
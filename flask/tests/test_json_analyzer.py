@@ -0,0 +1,150 @@
+"""Module test_json_analyzer tests the json_analyzer module."""
+
+import io
+import json
+import math
+from typing import Any
+
+import pandas as pd
+import pytest
+from data import csv_analyzer, json_analyzer, sketches
+
+
+def make_results(num_results: int) -> dict[str, Any]:
+    """Make a result file with numeric, string, boolean, list and sometimes missing values."""
+    return {
+        "type": "result",
+        "data": [
+            {
+                "metadata": {"run": i, "name": f"run-{i % 3}", "best": i % 4 == 0},
+                "sections": {
+                    "params": {"learning_rate": 0.01 * i, "layers": [i, 2 * i]},
+                    "results": {"loss": 1.5 * i} if i % 5 else {},
+                },
+                "section-order": ["params", "results"],
+            }
+            for i in range(num_results)
+        ],
+    }
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096], ids=["1-byte", "7-bytes", "4-KiB"])
+@pytest.mark.parametrize("indent", [None, 2], ids=["compact", "indented"])
+def test_iter_results(chunk_size: int, indent: int | None):
+    """Test that results are parsed the same however the file is split into chunks."""
+    results = make_results(20)
+    results["data"][3]["metadata"]["big"] = 123456789012345
+    f = io.StringIO(json.dumps(results, indent=indent))
+    assert list(json_analyzer.iter_results(f, chunk_size)) == results["data"]
+
+
+@pytest.mark.parametrize(
+    "text, want_error",
+    [
+        ("[]", "Only json result files can be analyzed."),
+        ("{}", "Only json result files can be analyzed."),
+        ('{"type": "result"}', "Only json result files can be analyzed."),
+        ('{"data": {}}', "Only json result files can be analyzed."),
+        ('{"data": [1]}', "Only json result files can be analyzed."),
+        ('{"data": []} []', "Only json result files can be analyzed."),
+        ('{"type": "other", "data": []}', "Unsupported json file type: other."),
+        ('{"data": [{"metadata": {}}', "Only json result files can be analyzed."),
+        ('{"data": [{"metadata": {', "Expecting property name"),
+    ],
+    ids=[
+        "array",
+        "empty-object",
+        "no-data",
+        "data-not-array",
+        "result-not-object",
+        "trailing-value",
+        "unsupported-type",
+        "unclosed-data",
+        "truncated-result",
+    ],
+)
+def test_iter_results_errors(text: str, want_error: str):
+    """Test that files other than json result files are rejected."""
+    with pytest.raises(ValueError, match=want_error):
+        list(json_analyzer.iter_results(io.StringIO(text), 4))
+
+
+def test_analyze_json_stats(tmp_path, monkeypatch):
+    """Test that batched json stats match the stats of the whole flattened results."""
+    monkeypatch.setattr(json_analyzer, "JSON_BATCH_RESULTS", 7)
+    results = make_results(50)
+    file_path = tmp_path / "results.json"
+    file_path.write_text(json.dumps(results), encoding="utf-8")
+
+    stats = json_analyzer.analyze_json_stats(str(file_path))
+
+    want = csv_analyzer.analyze_dataframe(
+        pd.DataFrame(
+            {
+                "metadata.run": [float(i) for i in range(50)],
+                "metadata.name": [f"run-{i % 3}" for i in range(50)],
+                "metadata.best": [float(i % 4 == 0) for i in range(50)],
+                "params.learning_rate": [0.01 * i for i in range(50)],
+                "params.layers": [json.dumps([i, 2 * i]) for i in range(50)],
+                "results.loss": [1.5 * i if i % 5 else math.nan for i in range(50)],
+            }
+        )
+    )
+    assert {key: stats[key] for key in ["num_columns", "num_rows"]} == {
+        "num_columns": 6,
+        "num_rows": 50,
+    }
+    for got_col, want_col in zip(stats["column_stats"], want["column_stats"], strict=True):
+        assert got_col.keys() == want_col.keys()
+        for key, want_value in want_col.items():
+            if isinstance(want_value, float):
+                assert got_col[key] == pytest.approx(want_value, rel=1e-12), key
+            else:
+                assert got_col[key] == want_value, key
+
+
+def test_analyze_json_stats_mixed_values(tmp_path, monkeypatch):
+    """Test that keys with mixed kinds of values, or missing from early results, are
+    analyzed as a whole."""
+    monkeypatch.setattr(json_analyzer, "JSON_BATCH_RESULTS", 2)
+    values = [1, 2, "two", True, None, [1]]
+    results = {
+        "data": [
+            {"sections": {"params": {"mixed": value, **({"late": i} if i >= 3 else {})}}}
+            for i, value in enumerate(values)
+        ],
+        "type": "result",
+    }
+    file_path = tmp_path / "results.json"
+    file_path.write_text(json.dumps(results), encoding="utf-8")
+
+    stats = json_analyzer.analyze_json_stats(str(file_path))
+
+    assert stats["num_rows"] == 6
+    mixed, late = stats["column_stats"]
+    top_values = sketches.TopValues.from_bytes(mixed.pop("top_values"))
+    assert top_values.counts.to_dict() == {"1": 1, "2": 1, "two": 1, "true": 1, "[1]": 1}
+    assert mixed == {
+        "column_name": "params.mixed",
+        "data_type": "string",
+        "num_rows": 6,
+        "num_unique_values": 5,
+        "num_null_values": 1,
+        "num_empty_values": 0,
+    }
+    assert late["column_name"] == "params.late"
+    assert (late["num_null_values"], late["min_value"], late["max_value"]) == (3, 3.0, 5.0)
+
+
+def test_analyze_json_stats_approximate(tmp_path):
+    """Test that approximate json stats come with sketches that can be combined."""
+    file_path = tmp_path / "results.json"
+    file_path.write_text(json.dumps(make_results(30)), encoding="utf-8")
+
+    stats = json_analyzer.analyze_json_stats(str(file_path), approximate=True)
+
+    loss = next(col for col in stats["column_stats"] if col["column_name"] == "results.loss")
+    assert loss["distinct_sketch"] and loss["quantile_sketch"]
+    combined = csv_analyzer.combine_column_stats([loss, loss])
+    assert combined["num_rows"] == 60
+    assert combined["num_unique_values"] == loss["num_unique_values"] == 24
@@ -0,0 +1,116 @@
+"""Module test_row_index contains tests for the row_index module."""
+
+import os
+
+import pytest
+from data import row_index
+from db import data_interface
+
+_ROWS = [
+    b"column-1,column-2\n",
+    b"1,plain\n",
+    b'2,"quoted, with comma"\n',
+    b'3,"quoted\nnewline"\n',
+    b"\n",
+    b'4,"escaped ""quotes"" and\r\nnewline"\r\n',
+    b"5,last",
+]
+
+
+def _row_starts(rows: list[bytes]) -> list[int]:
+    """Get the byte offsets of the data rows."""
+    starts = []
+    position = len(rows[0])
+    for row in rows[1:]:
+        starts.append(position)
+        position += len(row)
+    return starts
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1024], ids=lambda size: f"chunk-{size}")
+@pytest.mark.parametrize("stride", [1, 2, 4], ids=lambda stride: f"stride-{stride}")
+def test_row_index_builder(chunk_size: int, stride: int):
+    """Test that row offsets do not depend on how the file is chunked."""
+    content = b"".join(_ROWS)
+    builder = row_index.RowIndexBuilder(stride)
+    for start in range(0, len(content), chunk_size):
+        builder.feed(content[start : start + chunk_size])
+    builder.finish()
+
+    assert builder.valid
+    assert builder.num_rows == len(_ROWS) - 1
+    assert builder.size == len(content)
+    assert list(builder.offsets) == _row_starts(_ROWS)[::stride]
+
+
+@pytest.mark.parametrize(
+    "content, want_num_rows, want_valid",
+    [
+        (b"", 0, True),
+        (b"column-1\n", 0, True),
+        (b"column-1", 0, True),
+        (b'column-1\n"unclosed\n', 1, False),
+    ],
+    ids=["empty", "header-only", "header-without-newline", "unclosed-quote"],
+)
+def test_row_index_builder_edge_cases(content: bytes, want_num_rows: int, want_valid: bool):
+    """Test the row index builder on files without data rows."""
+    builder = row_index.RowIndexBuilder()
+    builder.feed(content)
+    builder.finish()
+    assert builder.num_rows == want_num_rows
+    assert builder.valid == want_valid
+
+
+def test_build_and_open_row_index(tmp_path):
+    """Test writing, memory-mapping and invalidating a row index."""
+    data_file = str(tmp_path / "0.csv")
+    with open(data_file, "wb") as f:
+        f.write(b"".join(_ROWS))
+
+    assert row_index.build_row_index(data_file, stride=2) is not None
+    with row_index.open_row_index(data_file) as index:
+        assert index.num_rows == len(_ROWS) - 1
+        assert list(index.offsets) == _row_starts(_ROWS)[::2]
+        assert index.locate(3) == (_row_starts(_ROWS)[2], 1)
+        assert index.locate(100) == (_row_starts(_ROWS)[4], 96)
+
+    with open(data_file, "ab") as f:
+        f.write(b"\n6,appended\n")
+    assert row_index.open_row_index(data_file) is None
+
+    with open(row_index.row_index_path(data_file), "wb") as f:
+        f.write(b"not a row index" * 4)
+    assert row_index.open_row_index(data_file) is None
+
+
+def test_build_row_index_unclosed_quote(tmp_path, monkeypatch):
+    """Test that files whose row boundaries cannot be trusted get an index marking them
+    unindexable, which is never opened and stops them from being scanned again."""
+    data_file = str(tmp_path / "0.csv")
+    with open(data_file, "wb") as f:
+        f.write(b'column-1\n"unclosed\n')
+    assert row_index.build_row_index(data_file) is None
+    assert sorted(os.listdir(tmp_path)) == ["0.csv", "0.csv" + row_index.ROW_INDEX_SUFFIX]
+    assert row_index.open_row_index(data_file) is None
+
+    calls = []
+    monkeypatch.setattr(row_index, "build_row_index", calls.append)
+    data_interface.load_data_page("0.csv", "csv", str(tmp_path), offset=row_index.ROW_INDEX_STRIDE)
+    assert not calls
+
+
+@pytest.mark.parametrize(
+    "offset, limit",
+    [(0, None), (1, 2), (2, 1), (3, None), (5, 10), (9, 1)],
+)
+def test_iter_csv_rows_with_row_index(tmp_path, offset: int, limit: int | None):
+    """Test that seeking with a row index reads the same rows as parsing from the start."""
+    data_file = str(tmp_path / "0.csv")
+    with open(data_file, "wb") as f:
+        f.write(b"".join(_ROWS))
+    want = list(data_interface.iter_csv_rows(data_file, offset, limit, ["column-2"]))
+
+    row_index.build_row_index(data_file, stride=2)
+    assert list(data_interface.iter_csv_rows(data_file, offset, limit, ["column-2"])) == want
+    assert data_interface.count_csv_rows(data_file) == len(_ROWS) - 1
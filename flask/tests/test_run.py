@@ -66,6 +66,22 @@ def test_version():
             {"control": "list"},
             test_dir_tree_lib._BASE_STRUCTURE,  # pylint: disable=protected-access
         ),
+        # Test list_folder control
+        (
+            {"control": "list_folder", "folder": "test-folder-2"},
+            {
+                "folder": "test-folder-2",
+                "children": [
+                    {
+                        "type": "file",
+                        "name": "test-file-4",
+                        "full-path": "test-folder-2/test-file-4",
+                        "tags": [],
+                    },
+                ],
+                "cursor": None,
+            },
+        ),
         # Test delete control - successful case
         (
             {"control": "delete", "path": "test-folder-1/test-file-1"},
@@ -179,6 +195,16 @@ def test_version():
             {"control": "update", "path": ""},
             {"error": "Could not find model object."},
         ),
+        # Test changes control - successful case
+        (
+            {"control": "changes", "since": 0},
+            {"version": 0, "changes": [], "has_more": False},
+        ),
+        # Test changes control - error case
+        (
+            {"control": "changes"},
+            {"error": "Since must be a non-negative integer."},
+        ),
         # Test invalid control
         (
             {"control": "invalid"},
@@ -187,6 +213,7 @@ def test_version():
     ],
     ids=[
         "list-control",
+        "list-folder-control",
         "delete-control-success",
         "delete-control-error",
         "move-control-success",
@@ -197,6 +224,8 @@ def test_version():
         "load-control-error",
         "update-control-success",
         "update-control-error",
+        "changes-control-success",
+        "changes-control-error",
         "invalid-control",
     ],
 )
@@ -223,6 +252,7 @@ def test_tree_control(request_json: dict[str, Any], want_response: dict[str, Any
         # Restore original DB_PATH
         dir_tree_lib.DB_PATH = original_db_path
         dir_tree_lib.DATA_FILE_DIR = original_data_file_dir
+        db_interface.dispose_engine(test_db_path)
 
         # Clean up test files
         if os.path.exists(test_db_path):
@@ -231,6 +261,211 @@ def test_tree_control(request_json: dict[str, Any], want_response: dict[str, Any
             shutil.rmtree(TEST_DATA_FILE_DIR)
 
 
+def test_tree_list_etag():
+    """Test that list responses carry the tree version and honor If-None-Match."""
+    test_db_path = setup_test_environment()
+
+    original_db_path = dir_tree_lib.DB_PATH
+    dir_tree_lib.DB_PATH = test_db_path
+    original_data_file_dir = dir_tree_lib.DATA_FILE_DIR
+    dir_tree_lib.DATA_FILE_DIR = TEST_DATA_FILE_DIR
+
+    try:
+        client = run.app.test_client()
+        response = client.post("/api/tree", json={"control": "list"})
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        version = int(response.headers["X-Tree-Version"])
+
+        response = client.post(
+            "/api/tree", json={"control": "list"}, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+
+        response = client.post(
+            "/api/tree",
+            json={
+                "control": "move",
+                "source": "test-folder-1/test-file-1",
+                "dest": "test-folder-2/test-file-1",
+            },
+        )
+        assert response.json == {}
+        assert int(response.headers["X-Tree-Version"]) == version + 1
+
+        response = client.post(
+            "/api/tree", json={"control": "list"}, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert "test-file-1" in response.json["tree"]["test-folder-2"]["children"]
+
+    finally:
+        dir_tree_lib.DB_PATH = original_db_path
+        dir_tree_lib.DATA_FILE_DIR = original_data_file_dir
+        db_interface.dispose_engine(test_db_path)
+
+        if os.path.exists(test_db_path):
+            os.remove(test_db_path)
+        if os.path.exists(TEST_DATA_FILE_DIR):
+            shutil.rmtree(TEST_DATA_FILE_DIR)
+
+
+def test_tree_list_etag_other_process():
+    """Test that list responses pick up changes made through another engine, as another
+    server process would."""
+    test_db_path = setup_test_environment()
+
+    original_db_path = dir_tree_lib.DB_PATH
+    dir_tree_lib.DB_PATH = test_db_path
+    original_data_file_dir = dir_tree_lib.DATA_FILE_DIR
+    dir_tree_lib.DATA_FILE_DIR = TEST_DATA_FILE_DIR
+    other_engine = db_interface.make_engine(test_db_path)
+
+    try:
+        client = run.app.test_client()
+        response = client.post("/api/tree", json={"control": "list"})
+        etag = response.headers["ETag"]
+        version = int(response.headers["X-Tree-Version"])
+
+        assert not dir_tree_lib.move(
+            other_engine,
+            {"source": "test-folder-1/test-file-1", "dest": "test-folder-2/test-file-1"},
+        )
+
+        response = client.post(
+            "/api/tree", json={"control": "list"}, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert int(response.headers["X-Tree-Version"]) == version + 1
+        assert "test-file-1" in response.json["tree"]["test-folder-2"]["children"]
+        assert "test-file-1" not in response.json["tree"]["test-folder-1"]["children"]
+
+        response = client.post(
+            "/api/tree",
+            json={"control": "list"},
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+        assert response.status_code == 304
+
+    finally:
+        dir_tree_lib.DB_PATH = original_db_path
+        dir_tree_lib.DATA_FILE_DIR = original_data_file_dir
+        db_interface.dispose_engine(test_db_path)
+        other_engine.dispose()
+
+        if os.path.exists(test_db_path):
+            os.remove(test_db_path)
+        if os.path.exists(TEST_DATA_FILE_DIR):
+            shutil.rmtree(TEST_DATA_FILE_DIR)
+
+
+@pytest.mark.parametrize(
+    "url, want_status, want_mimetype, want_headers, want_body",
+    [
+        (
+            "/api/data/test-folder-1/test-file-1",
+            200,
+            "application/x-ndjson",
+            {"X-Total-Rows": "2"},
+            b'["column-1", "column-2"]\n["value-1", "value-2"]\n["value-3", "value-4"]\n',
+        ),
+        (
+            "/api/data/test-folder-1/test-file-1?format=json&offset=1&columns=column-1",
+            200,
+            "application/json",
+            {"X-Total-Rows": "2"},
+            b'[["column-1"],["value-3"]]',
+        ),
+        (
+            "/api/data/test-file-2",
+            200,
+            "application/json",
+            {},
+            b'{\n  "column-1": "value-1"\n}\n',
+        ),
+        (
+            "/api/data/test-folder-1/fake-file",
+            200,
+            "application/json",
+            {},
+            b'{"error":"File metadata not found for path test-folder-1/fake-file."}\n',
+        ),
+    ],
+    ids=["stream-ndjson", "stream-json-window", "stream-json-file", "missing-file-gives-error"],
+)
+def test_stream_data(
+    url: str,
+    want_status: int,
+    want_mimetype: str,
+    want_headers: dict[str, str],
+    want_body: bytes,
+):
+    """Test streaming a data file."""
+    test_db_path = setup_test_environment()
+
+    original_db_path = dir_tree_lib.DB_PATH
+    dir_tree_lib.DB_PATH = test_db_path
+    original_data_file_dir = dir_tree_lib.DATA_FILE_DIR
+    dir_tree_lib.DATA_FILE_DIR = TEST_DATA_FILE_DIR
+
+    try:
+        response = run.app.test_client().get(url)
+        assert response.status_code == want_status
+        assert response.mimetype == want_mimetype
+        for header, value in want_headers.items():
+            assert response.headers[header] == value
+        assert response.data == want_body
+
+    finally:
+        dir_tree_lib.DB_PATH = original_db_path
+        dir_tree_lib.DATA_FILE_DIR = original_data_file_dir
+        db_interface.dispose_engine(test_db_path)
+
+        if os.path.exists(test_db_path):
+            os.remove(test_db_path)
+        if os.path.exists(TEST_DATA_FILE_DIR):
+            shutil.rmtree(TEST_DATA_FILE_DIR)
+
+
+def test_aggregate():
+    """Test aggregating the columns of a data file into chart series."""
+    test_db_path = setup_test_environment()
+
+    original_db_path = dir_tree_lib.DB_PATH
+    dir_tree_lib.DB_PATH = test_db_path
+    original_data_file_dir = dir_tree_lib.DATA_FILE_DIR
+    dir_tree_lib.DATA_FILE_DIR = TEST_DATA_FILE_DIR
+
+    try:
+        response = run.app.test_client().post(
+            "/api/aggregate",
+            json={
+                "path": "test-folder-1/test-file-1",
+                "chart_type": "heatmap",
+                "columns": ["column-1", "column-2", "column-1"],
+            },
+        )
+        assert response.status_code == 200
+        assert response.json == {
+            "path": "test-folder-1/test-file-1",
+            "chart_type": "heatmap",
+            "num_rows": 2,
+            "data": [],
+        }
+
+    finally:
+        dir_tree_lib.DB_PATH = original_db_path
+        dir_tree_lib.DATA_FILE_DIR = original_data_file_dir
+        db_interface.dispose_engine(test_db_path)
+
+        if os.path.exists(test_db_path):
+            os.remove(test_db_path)
+        if os.path.exists(TEST_DATA_FILE_DIR):
+            shutil.rmtree(TEST_DATA_FILE_DIR)
+
+
 def test_upload_file():
     """Test the upload file function - successful upload case."""
     # Set up test environment
@@ -258,14 +493,74 @@ def test_upload_file():
         # Assert response
         assert response.status_code == 200
         assert response.json == {}
+        engine = db_interface.get_engine(test_db_path)
+        assert dir_tree_lib.get_analysis_queue(engine).join(timeout=30)
+
+        response = run.app.test_client().post(
+            "/api/tree", json={"control": "status", "path": "test-folder-1/test-upload"}
+        )
+        assert response.json == {"path": "test-folder-1/test-upload", "status": "ready"}
 
     finally:
         # Restore original paths
         dir_tree_lib.DB_PATH = original_db_path
         dir_tree_lib.DATA_FILE_DIR = original_data_file_dir
+        db_interface.dispose_engine(test_db_path)
 
         # Clean up test files
         if os.path.exists(test_db_path):
             os.remove(test_db_path)
         if os.path.exists(TEST_DATA_FILE_DIR):
             shutil.rmtree(TEST_DATA_FILE_DIR)
+
+
+def test_chunked_upload_file():
+    """Test a resumable upload through its routes."""
+    test_db_path = setup_test_environment()
+    original_db_path = dir_tree_lib.DB_PATH
+    dir_tree_lib.DB_PATH = test_db_path
+    original_data_file_dir = dir_tree_lib.DATA_FILE_DIR
+    dir_tree_lib.DATA_FILE_DIR = TEST_DATA_FILE_DIR
+    content = b"col1,col2\n" + b"val1,val2\n" * 3
+
+    try:
+        client = run.app.test_client()
+        response = client.post(
+            "/api/upload/chunked",
+            json={
+                "path": "test-folder-1/test-upload",
+                "filename": "test.csv",
+                "size": len(content),
+            },
+        )
+        upload_id = response.json["upload_id"]
+        assert response.json["num_chunks"] == 1
+
+        response = client.put(f"/api/upload/chunked/{upload_id}/1", data=b"x")
+        assert response.json == {"error": "Chunk 1 is out of range."}
+        response = client.get(f"/api/upload/chunked/{upload_id}")
+        assert response.json["missing"] == [0]
+        response = client.put(f"/api/upload/chunked/{upload_id}/0", data=content)
+        assert response.json == {}
+
+        response = client.post(f"/api/upload/chunked/{upload_id}/finish")
+        assert response.json == {}
+        assert "X-Tree-Version" in response.headers
+        engine = db_interface.get_engine(test_db_path)
+        assert dir_tree_lib.get_analysis_queue(engine).join(timeout=30)
+        response = client.post(
+            "/api/tree", json={"control": "status", "path": "test-folder-1/test-upload"}
+        )
+        assert response.json == {"path": "test-folder-1/test-upload", "status": "ready"}
+
+        response = client.delete(f"/api/upload/chunked/{upload_id}")
+        assert response.json == {"error": f"Upload {upload_id} not found."}
+
+    finally:
+        dir_tree_lib.DB_PATH = original_db_path
+        dir_tree_lib.DATA_FILE_DIR = original_data_file_dir
+        db_interface.dispose_engine(test_db_path)
+        if os.path.exists(test_db_path):
+            os.remove(test_db_path)
+        if os.path.exists(TEST_DATA_FILE_DIR):
+            shutil.rmtree(TEST_DATA_FILE_DIR)
@@ -0,0 +1,227 @@
+"""Module test_sketches contains tests for the sketches module."""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from data import sketches
+
+
+@pytest.mark.parametrize(
+    "num_distinct, want_exact",
+    [(0, True), (10, True), (1000, True), (100000, False)],
+    ids=["empty", "few", "below-size", "above-size"],
+)
+def test_distinct_counter(num_distinct: int, want_exact: bool):
+    """Test that distinct counts are exact below the sketch size and close above it."""
+    values = np.repeat(np.arange(num_distinct, dtype=np.float64), 3)
+    counter = sketches.DistinctCounter(size=2048)
+    for chunk in np.array_split(values, 7):
+        counter.add(chunk)
+    assert counter.exact == want_exact
+    if want_exact:
+        assert counter.count() == num_distinct
+    else:
+        assert counter.count() == pytest.approx(num_distinct, rel=0.1)
+
+
+def test_distinct_counter_merge():
+    """Test that merging counters of overlapping parts counts the union."""
+    first, second = sketches.DistinctCounter(size=64), sketches.DistinctCounter(size=64)
+    first.add(np.array([0.0, 1.0, 2.0]))
+    second.add(np.array([-0.0, 2.0, 3.0]))
+    first.merge(second)
+    assert first.count() == 4
+
+    strings = sketches.DistinctCounter()
+    strings.add(np.array(["a", "b", "a"], dtype=object))
+    assert strings.count() == 2
+
+
+def test_value_sample():
+    """Test that samples stay bounded and merge into a sample of both parts."""
+    first, second = sketches.ValueSample(size=100, seed=1), sketches.ValueSample(size=100, seed=2)
+    first.add(np.zeros(1000))
+    second.add(np.ones(1000))
+    first.merge(second)
+    assert len(first.values) == 100
+    assert 0.2 < first.values.mean() < 0.8
+
+    small = sketches.ValueSample(size=100)
+    small.add(np.array([1.0, 2.0, 4.0]))
+    assert small.median() == 2.0
+
+
+@pytest.mark.parametrize(
+    "chunks, want_median",
+    [
+        ([[3.0, 1.0], [2.0]], 2.0),
+        ([[1.0, 1.0], [4.0, 5.0]], 2.5),
+        ([[7.0], [7.0, 7.0], [-1.0]], 7.0),
+    ],
+    ids=["odd", "even", "repeated"],
+)
+def test_value_counts_median(chunks: list[list[float]], want_median: float):
+    """Test that the median of merged value counts matches the median of all values."""
+    value_counts = sketches.ValueCounts(limit=10)
+    for chunk in chunks:
+        value_counts.add(np.array(chunk))
+    assert value_counts.median() == want_median
+    assert value_counts.median() == np.median(np.concatenate(chunks))
+
+
+def test_value_counts_overflow():
+    """Test that value counts are dropped once there are too many distinct values."""
+    value_counts = sketches.ValueCounts(limit=3)
+    value_counts.add(np.array([1.0, 2.0, 2.0]))
+    assert not value_counts.overflowed
+    value_counts.add(np.array([3.0, 4.0]))
+    assert value_counts.overflowed
+    value_counts.add(np.array([5.0]))
+    assert value_counts.overflowed
+
+
+@pytest.mark.parametrize("num_distinct", [0, 1, 100, 5000, 200000])
+def test_hyperloglog(num_distinct: int):
+    """Test that HyperLogLog counts are within the documented error and survive serializing."""
+    rng = np.random.default_rng(0)
+    values = rng.permutation(np.repeat(np.arange(num_distinct, dtype=np.float64), 2))
+    first, second = sketches.HyperLogLog(), sketches.HyperLogLog()
+    first.add(values[: len(values) // 2])
+    second.add(values[len(values) // 2 :])
+    first.merge(sketches.HyperLogLog.from_bytes(second.to_bytes()))
+    # Four standard errors of a precision 12 sketch.
+    assert first.count() == pytest.approx(num_distinct, rel=4 * 1.04 / 64, abs=1)
+
+
+def test_hyperloglog_errors():
+    """Test HyperLogLog precision errors."""
+    with pytest.raises(ValueError):
+        sketches.HyperLogLog(precision=4)
+    with pytest.raises(ValueError):
+        sketches.HyperLogLog(precision=12).merge(sketches.HyperLogLog(precision=14))
+
+
+@pytest.mark.parametrize("num_chunks", [1, 10])
+@pytest.mark.parametrize("distribution", ["normal", "exponential", "integers"])
+def test_tdigest(distribution: str, num_chunks: int):
+    """Test that t-digest quantiles are within 1% in rank of the exact quantiles."""
+    rng = np.random.default_rng(0)
+    values = {
+        "normal": rng.normal(size=100000),
+        "exponential": rng.exponential(size=100000),
+        "integers": rng.integers(0, 500, 100000).astype(np.float64),
+    }[distribution]
+    digest = sketches.TDigest()
+    for chunk in np.array_split(values, num_chunks):
+        chunk_digest = sketches.TDigest()
+        chunk_digest.add(chunk)
+        digest.merge(sketches.TDigest.from_bytes(chunk_digest.to_bytes()))
+
+    sorted_values = np.sort(values)
+    quantiles = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+    for quantile, estimate in zip(quantiles, digest.quantiles(quantiles), strict=True):
+        lower = np.searchsorted(sorted_values, estimate, side="left") / len(values)
+        upper = np.searchsorted(sorted_values, estimate, side="right") / len(values)
+        assert lower - 0.01 <= quantile <= upper + 0.01
+    assert digest.quantiles([0.0, 1.0]) == [values.min(), values.max()]
+    assert len(digest.means) <= digest.compression
+
+
+def test_tdigest_small():
+    """Test that quantiles of a few values are exact."""
+    digest = sketches.TDigest()
+    assert math.isnan(digest.quantile(0.5))
+    digest.add(np.array([4.0, 1.0]))
+    digest.add(np.array([3.0, 2.0]))
+    assert digest.quantile(0.5) == 2.5
+    digest.add(np.array([10.0]))
+    assert digest.quantile(0.5) == 3.0
+
+
+@pytest.mark.parametrize(
+    "values, counts, want_counts",
+    [
+        ([0.0, 1.0, 3.5, 4.0], None, [1, 1, 0, 2]),
+        ([0.0, 1.0, 4.0], [3, 1, 2], [3, 1, 0, 2]),
+        ([7.0, 7.0], None, [2]),
+        ([1e308, -1e308, 0.0, 5e307], None, [1, 0, 1, 2]),
+    ],
+    ids=["values", "counted-values", "single-value", "range-overflows"],
+)
+def test_histogram(values: list[float], counts: list[int] | None, want_counts: list[int]):
+    """Test that values are binned like the frontend bins them, max in the last bin."""
+    histogram = sketches.Histogram.from_values(np.array(values), counts, num_bins=4)
+    assert histogram.counts.tolist() == want_counts
+    restored = sketches.Histogram.from_bytes(histogram.to_bytes())
+    assert (restored.low, restored.high) == (min(values), max(values))
+    assert restored.counts.tolist() == want_counts
+    assert np.isfinite(restored.edges).all()
+
+
+def test_histogram_from_digest():
+    """Test that histograms estimated from a t-digest are close and count every value."""
+    values = np.random.default_rng(0).normal(size=100000)
+    digest = sketches.TDigest()
+    digest.add(values)
+    histogram = sketches.Histogram.from_digest(digest)
+    want = sketches.Histogram.from_values(values)
+    assert (histogram.low, histogram.high) == (want.low, want.high)
+    assert histogram.counts.sum() == len(values)
+    assert np.abs(histogram.counts - want.counts).max() < 0.005 * len(values)
+
+
+def test_top_values():
+    """Test that top values are exact within capacity and otherwise keep heavy hitters
+    with counts low by at most the error."""
+    exact = sketches.TopValues(capacity=10)
+    exact.add(np.array(["a", "b", "a", "c"], dtype=object))
+    exact.add(np.array(["a", "c"], dtype=object))
+    assert exact.top(2).to_dict() == {"a": 3, "c": 2}
+    assert exact.error == 0
+
+    rng = np.random.default_rng(0)
+    values = np.concatenate(
+        [np.repeat(["x", "y"], [3000, 2000]), rng.integers(0, 5000, 10000).astype(str)]
+    ).astype(object)
+    rng.shuffle(values)
+    summary = sketches.TopValues(capacity=50)
+    for chunk in np.array_split(values, 13):
+        summary.add(chunk)
+    want = pd.Series(values).value_counts()
+    assert summary.error <= len(values) / 51
+    assert list(summary.top(2).index) == ["x", "y"]
+    for value, count in summary.counts.items():
+        assert want[value] - summary.error <= count <= want[value]
+
+
+def test_top_values_mixed_types():
+    """Test that values of types that cannot be compared, as in a csv column holding both
+    numbers and text, are still counted and merged."""
+    summary = sketches.TopValues()
+    summary.add(np.array([1, "a", 2.5, "a"], dtype=object))
+    summary.merge_counts(pd.Series([2, 1], index=pd.Index([1, "b"], dtype=object)))
+    assert summary.top(2).to_dict() == {1: 3, "a": 2}
+    assert summary.counts.sum() == 7
+
+    value_counts = sketches.ValueCounts(limit=10)
+    value_counts.add(np.array(["a", 1, "a"], dtype=object))
+    value_counts.add(np.array([1, 2.5], dtype=object))
+    assert value_counts.counts.to_dict() == {1: 2, 2.5: 1, "a": 2}
+
+
+def test_top_values_bytes():
+    """Test that serialized top values keep the k highest counts and count the values left
+    out in the error, so merging them keeps the error bound."""
+    summary = sketches.TopValues()
+    summary.merge_counts(pd.Series({"a": 5, "é": 4, "": 3, "d": 1}))
+    restored = sketches.TopValues.from_bytes(summary.to_bytes(k=3))
+    assert restored.counts.to_dict() == {"a": 5, "é": 4, "": 3}
+    assert restored.error == 1
+
+    other = sketches.TopValues()
+    other.merge_counts(pd.Series({"d": 2}))
+    restored.merge(sketches.TopValues.from_bytes(other.to_bytes(k=3)))
+    assert restored.counts["d"] == 2
+    assert restored.counts["d"] + restored.error >= 3
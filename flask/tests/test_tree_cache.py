@@ -0,0 +1,119 @@
+"""Module test_tree_cache contains tests for the tree_cache module."""
+
+import copy
+from typing import Any
+
+import pytest
+import tree_cache
+
+_ENTRIES = [
+    {"path": "folder-1/file-1", "tags": ["tag-1"]},
+    {"path": "folder-1/sub-folder-1/file-2", "tags": []},
+    {"path": "file-3", "tags": ["tag-2"]},
+]
+
+
+@pytest.mark.parametrize(
+    "change, want_entries, want_tags",
+    [
+        (
+            {"action": "add", "path": "folder-2/file-4", "tags": ["tag-3"]},
+            [*_ENTRIES, {"path": "folder-2/file-4", "tags": ["tag-3"]}],
+            ["tag-1", "tag-2", "tag-3"],
+        ),
+        (
+            {"action": "remove", "path": "folder-1/sub-folder-1/file-2", "tags": []},
+            [_ENTRIES[0], _ENTRIES[2]],
+            ["tag-1", "tag-2"],
+        ),
+        (
+            {"action": "remove", "path": "folder-1/fake-file", "tags": []},
+            _ENTRIES,
+            ["tag-1", "tag-2"],
+        ),
+        (
+            {
+                "action": "move",
+                "path": "folder-1/file-1",
+                "dest": "folder-3/file-1",
+                "tags": ["tag-1"],
+            },
+            [_ENTRIES[1], _ENTRIES[2], {"path": "folder-3/file-1", "tags": ["tag-1"]}],
+            ["tag-1", "tag-2"],
+        ),
+        (
+            {"action": "retag", "path": "file-3", "tags": ["tag-1", "tag-4"]},
+            [_ENTRIES[0], _ENTRIES[1], {"path": "file-3", "tags": ["tag-1", "tag-4"]}],
+            ["tag-1", "tag-2", "tag-4"],
+        ),
+    ],
+    ids=["add", "remove-prunes-empty-folders", "remove-missing-file", "move", "retag"],
+)
+def test_apply_change(
+    change: dict[str, Any], want_entries: list[dict[str, Any]], want_tags: list[str]
+):
+    """Test that patching the cache matches rebuilding it and leaves old snapshots alone."""
+    cache = tree_cache.TreeCache()
+    cache.load(copy.deepcopy(_ENTRIES), ["tag-1", "tag-2"])
+    old_snapshot, old_version = cache.snapshot()
+    old_snapshot_copy = copy.deepcopy(old_snapshot)
+
+    assert cache.apply_change(change) == old_version + 1
+    # Applying the same change twice must not change the tree again.
+    cache.apply_change(change)
+
+    snapshot, version = cache.snapshot()
+    assert version == old_version + 2
+    assert snapshot == {"tree": tree_cache.build_structure(want_entries), "tags": want_tags}
+    assert old_snapshot == old_snapshot_copy
+
+
+def test_apply_change_before_load():
+    """Test that changes before the first load only bump the version."""
+    cache = tree_cache.TreeCache()
+    assert cache.apply_change({"action": "add", "path": "file-1", "tags": []}) == 1
+    assert not cache.loaded
+    assert cache.snapshot() == ({"tree": {}, "tags": []}, 1)
+    assert cache.etag == cache.make_etag(1)
+
+
+def test_apply_versioned_change_before_load():
+    """Test that versioned changes before the first load are dropped rather than held."""
+    cache = tree_cache.TreeCache()
+    assert cache.apply_change({"version": 3, "action": "add", "path": "file-1", "tags": []}) == 0
+    assert not cache._pending  # pylint: disable=protected-access
+    cache.load(copy.deepcopy(_ENTRIES), ["tag-1", "tag-2"], 2)
+    assert cache.apply_change({"version": 3, "action": "add", "path": "file-4", "tags": []}) == 3
+    assert cache.snapshot() == (
+        {
+            "tree": tree_cache.build_structure([*_ENTRIES, {"path": "file-4", "tags": []}]),
+            "tags": ["tag-1", "tag-2"],
+        },
+        3,
+    )
+
+
+def test_apply_change_out_of_order():
+    """Test that versioned changes are applied in version order whatever order they arrive in."""
+    cache = tree_cache.TreeCache()
+    cache.load(copy.deepcopy(_ENTRIES), ["tag-1", "tag-2"], 5)
+    add = {"version": 6, "action": "add", "path": "file-4", "tags": []}
+    remove = {"version": 7, "action": "remove", "path": "file-4", "tags": []}
+
+    assert cache.apply_change(remove) == 5
+    assert cache.etag == cache.make_etag(5)
+    assert cache.apply_change(add) == 7
+    assert cache.apply_change(add) == 7
+    assert cache.apply_change({**remove, "version": 5}) == 7
+    assert cache.snapshot() == (
+        {"tree": tree_cache.build_structure(_ENTRIES), "tags": ["tag-1", "tag-2"]},
+        7,
+    )
+
+
+def test_apply_change_unknown_action():
+    """Test that unknown change actions are rejected."""
+    cache = tree_cache.TreeCache()
+    cache.load([], [])
+    with pytest.raises(ValueError):
+        cache.apply_change({"action": "fake-action", "path": "file-1"})
@@ -0,0 +1,111 @@
+"""Module test_upload_staging contains tests for the upload_staging module."""
+
+import io
+import os
+import shutil
+import time
+
+import pytest
+import upload_staging
+
+TEST_DATA_FILE_DIR = os.environ.get(
+    "TEST_DATA_FILE_DIR", os.path.join("flask", "untracked", "tests", "data")
+)
+
+
+def make_data_file_dir() -> str:
+    """Make an empty data file directory."""
+    if os.path.isdir(TEST_DATA_FILE_DIR):
+        shutil.rmtree(TEST_DATA_FILE_DIR)
+    os.makedirs(TEST_DATA_FILE_DIR)
+    return TEST_DATA_FILE_DIR
+
+
+def _read_all(reader: upload_staging.ChunkReader) -> bytes:
+    """Read a chunk reader to the end in small reads."""
+    data = b""
+    while block := reader.read(3):
+        data += block
+    reader.close()
+    return data
+
+
+@pytest.mark.parametrize(
+    "size, chunk_size, want", [(0, 4, 1), (4, 4, 1), (5, 4, 2), (8, 4, 2), (9, 4, 3)]
+)
+def test_num_chunks(size: int, chunk_size: int, want: int):
+    """Test the number of chunks of an upload."""
+    assert upload_staging.num_chunks(size, chunk_size) == want
+
+
+def test_chunks_in_any_order():
+    """Test that chunks put out of order and retried are assembled in order."""
+    data_file_dir = make_data_file_dir()
+    content = b"step,loss\n1,0.5\n2,0.25\n"
+    upload_id = upload_staging.create_upload(
+        data_file_dir, {"path": "a", "size": len(content), "chunk_size": 10}
+    )
+    assert upload_staging.get_upload(data_file_dir, upload_id)["missing"] == [0, 1, 2]
+    assert not upload_staging.write_chunk(data_file_dir, upload_id, 2, io.BytesIO(content[20:]))
+    assert not upload_staging.write_chunk(data_file_dir, upload_id, 0, io.BytesIO(b"x" * 10))
+    assert upload_staging.get_upload(data_file_dir, upload_id)["missing"] == [1]
+
+    upload, error = upload_staging.start_finishing(data_file_dir, upload_id)
+    assert upload is None
+    assert error == f"Upload {upload_id} is missing 1 chunks."
+
+    assert not upload_staging.write_chunk(data_file_dir, upload_id, 1, io.BytesIO(content[10:20]))
+    assert not upload_staging.write_chunk(data_file_dir, upload_id, 0, io.BytesIO(content[:10]))
+    upload, error = upload_staging.start_finishing(data_file_dir, upload_id)
+    assert not error
+    assert upload["missing"] == []
+    assert upload_staging.start_finishing(data_file_dir, upload_id) == (
+        None,
+        f"Upload {upload_id} not found.",
+    )
+    assert _read_all(upload_staging.open_chunks(data_file_dir, upload_id, upload)) == content
+
+    upload_staging.stop_finishing(data_file_dir, upload_id, done=False)
+    assert upload_staging.get_upload(data_file_dir, upload_id)["missing"] == []
+    upload_staging.start_finishing(data_file_dir, upload_id)
+    upload_staging.stop_finishing(data_file_dir, upload_id, done=True)
+    assert upload_staging.get_upload(data_file_dir, upload_id) is None
+    assert os.listdir(upload_staging.staging_dir(data_file_dir)) == []
+
+
+@pytest.mark.parametrize(
+    "upload_id, index, chunk, want",
+    [
+        ("../../etc", 0, b"abcd", "Upload ../../etc not found."),
+        ("0" * 32, 0, b"abcd", f"Upload {'0' * 32} not found."),
+        (None, 3, b"abcd", "Chunk 3 is out of range."),
+        (None, 0, b"abc", "Chunk 0 must be 4 bytes."),
+        (None, 0, b"abcde", "Chunk 0 must be 4 bytes."),
+        (None, 2, b"ab", "Chunk 2 must be 1 bytes."),
+    ],
+    ids=["bad-id", "unknown-id", "out-of-range", "short", "long", "long-last"],
+)
+def test_write_chunk_errors(upload_id: str | None, index: int, chunk: bytes, want: str):
+    """Test that bad chunks are turned away without being kept."""
+    data_file_dir = make_data_file_dir()
+    created = upload_staging.create_upload(data_file_dir, {"size": 9, "chunk_size": 4})
+    upload_id = upload_id or created
+    assert upload_staging.write_chunk(data_file_dir, upload_id, index, io.BytesIO(chunk)) == want
+    assert sorted(os.listdir(os.path.join(upload_staging.staging_dir(data_file_dir), created))) == [
+        "upload.json"
+    ]
+
+
+def test_remove_stale_uploads():
+    """Test that only uploads idle for longer than the max age are removed."""
+    data_file_dir = make_data_file_dir()
+    assert upload_staging.remove_stale_uploads(data_file_dir, 60) == 0
+    stale = upload_staging.create_upload(data_file_dir, {"size": 1, "chunk_size": 4})
+    fresh = upload_staging.create_upload(data_file_dir, {"size": 1, "chunk_size": 4})
+    an_hour_ago = time.time() - 3600
+    os.utime(os.path.join(upload_staging.staging_dir(data_file_dir), stale), (an_hour_ago,) * 2)
+    assert upload_staging.remove_stale_uploads(data_file_dir, 60) == 1
+    assert upload_staging.get_upload(data_file_dir, stale) is None
+    assert upload_staging.get_upload(data_file_dir, fresh) is not None
+    assert upload_staging.delete_upload(data_file_dir, fresh)
+    assert not upload_staging.delete_upload(data_file_dir, fresh)
@@ -0,0 +1,196 @@
+"""Module tree_cache keeps an in-process copy of the directory tree for each database engine."""
+
+import os
+import threading
+import uuid
+import weakref
+from typing import Any
+
+from sqlalchemy import Engine
+
+_TREE_CACHES: "weakref.WeakKeyDictionary[Engine, TreeCache]" = weakref.WeakKeyDictionary()
+_TREE_CACHES_LOCK = threading.Lock()
+
+
+def build_structure(entries: list[dict[str, Any]]) -> dict[str, Any]:
+    """Build the nested tree structure from a list of file paths and tags."""
+    structure = {}
+    for entry in entries:
+        path = entry["path"].split("/")
+        cur_folder = structure
+        cur_path = ""
+        for folder in path[:-1]:
+            cur_path = os.path.join(cur_path, folder) if cur_path else folder
+            if folder not in cur_folder:
+                cur_folder[folder] = {
+                    "type": "folder",
+                    "full-path": cur_path,
+                    "children": {},
+                }
+            cur_folder = cur_folder[folder]["children"]
+        cur_folder[path[-1]] = {
+            "type": "file",
+            "full-path": entry["path"],
+            "tags": entry["tags"],
+        }
+    return structure
+
+
+def _with_file(
+    structure: dict[str, Any], parts: list[str], node: dict[str, Any], cur_path: str = ""
+) -> dict[str, Any]:
+    """Return a copy of structure with node placed at parts.
+    Only the folders along the path are copied, so earlier snapshots are never modified."""
+    structure = dict(structure)
+    name = parts[0]
+    if len(parts) == 1:
+        structure[name] = node
+        return structure
+    folder_path = os.path.join(cur_path, name) if cur_path else name
+    folder = structure.get(name)
+    children = folder["children"] if folder and folder["type"] == "folder" else {}
+    structure[name] = {
+        "type": "folder",
+        "full-path": folder_path,
+        "children": _with_file(children, parts[1:], node, folder_path),
+    }
+    return structure
+
+
+def _without_file(
+    structure: dict[str, Any], parts: list[str]
+) -> tuple[dict[str, Any], dict[str, Any] | None]:
+    """Return a copy of structure without the file at parts, and the removed file node.
+    Folders left empty are removed. If there is no file at parts, structure is returned as is."""
+    name = parts[0]
+    node = structure.get(name)
+    if node is None:
+        return structure, None
+    if len(parts) == 1:
+        if node["type"] != "file":
+            return structure, None
+        structure = dict(structure)
+        del structure[name]
+        return structure, node
+    if node["type"] != "folder":
+        return structure, None
+    children, removed = _without_file(node["children"], parts[1:])
+    if removed is None:
+        return structure, None
+    structure = dict(structure)
+    if children:
+        structure[name] = {**node, "children": children}
+    else:
+        del structure[name]
+    return structure, removed
+
+
+class TreeCache:
+    """Directory tree built once from the database and patched in place by each mutation.
+    The published structure is never modified after it is handed out; patches copy the
+    folders along the changed path instead, so readers can serialize a snapshot without
+    holding the lock."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.instance = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.loaded = False
+        self.structure: dict[str, Any] = {}
+        self.tags: list[str] = []
+        # Changes received ahead of a missing earlier change, by version.
+        self._pending: dict[int, dict[str, Any]] = {}
+
+    @property
+    def etag(self) -> str:
+        """ETag for the current version."""
+        return self.make_etag(self.version)
+
+    def make_etag(self, version: int) -> str:
+        """Make the ETag for a version. ETags are unique to this process, so a restarted
+        server never matches an ETag handed out before the restart."""
+        return f"{self.instance}-{version}"
+
+    def load(self, entries: list[dict[str, Any]], tags: list[str], version: int = 0):
+        """Replace the cached tree with one built from the database at version."""
+        with self.lock:
+            self.structure = build_structure(entries)
+            self.tags = list(tags)
+            self.version = max(self.version, version)
+            self._pending = {v: c for v, c in self._pending.items() if v > self.version}
+            self.loaded = True
+            self._apply_pending()
+
+    def snapshot(self) -> tuple[dict[str, Any], int]:
+        """Get the current tree and tags along with their version."""
+        with self.lock:
+            return {"tree": self.structure, "tags": self.tags}, self.version
+
+    def apply_change(self, change: dict[str, Any]) -> int:
+        """Patch the cached tree with a change and return the new version.
+        Changes are dicts with an "action" of "add", "remove", "move" or "retag", the
+        file "path", the file "tags", for moves the "dest" path and optionally the
+        "version" the change produced. Versioned changes are applied in version order:
+        one that arrives ahead of the changes before it is held until they are applied,
+        and one at or below the current version is already reflected and is skipped.
+        Versioned changes are dropped until the tree is loaded, as loading reads them from
+        the database. Applying a change that is already reflected in the tree leaves it
+        unchanged."""
+        with self.lock:
+            version = change.get("version")
+            if version is None:
+                self.version += 1
+                self._patch(change)
+                return self.version
+            if not self.loaded or version <= self.version:
+                return self.version
+            self._pending[version] = change
+            self._apply_pending()
+            return self.version
+
+    def _apply_pending(self):
+        """Apply the held changes that follow on from the current version."""
+        while self.version + 1 in self._pending:
+            self.version += 1
+            self._patch(self._pending.pop(self.version))
+
+    def _patch(self, change: dict[str, Any]):
+        """Patch the cached tree with a change, if the tree is loaded."""
+        if not self.loaded:
+            return
+
+        path = change["path"]
+        tags = change.get("tags") or []
+        match change["action"]:
+            case "add" | "retag":
+                self.structure = _with_file(
+                    self.structure,
+                    path.split("/"),
+                    {"type": "file", "full-path": path, "tags": tags},
+                )
+            case "remove":
+                self.structure, _ = _without_file(self.structure, path.split("/"))
+            case "move":
+                dest = change["dest"]
+                self.structure, _ = _without_file(self.structure, path.split("/"))
+                self.structure = _with_file(
+                    self.structure,
+                    dest.split("/"),
+                    {"type": "file", "full-path": dest, "tags": tags},
+                )
+            case _:
+                raise ValueError(f"Unknown tree change action '{change['action']}'")
+
+        new_tags = [tag for tag in dict.fromkeys(tags) if tag not in self.tags]
+        if new_tags:
+            self.tags = self.tags + new_tags
+
+
+def get_tree_cache(engine: Engine) -> TreeCache:
+    """Get the tree cache for an engine, creating an empty one on first use."""
+    with _TREE_CACHES_LOCK:
+        cache = _TREE_CACHES.get(engine)
+        if cache is None:
+            cache = TreeCache()
+            _TREE_CACHES[engine] = cache
+        return cache
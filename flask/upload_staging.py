@@ -0,0 +1,197 @@
+"""Module upload_staging keeps the chunks of resumable uploads until they are complete.
+
+Each upload has its own directory in the staging directory, holding its description in
+upload.json and each chunk received so far in a file named by its index. Chunks can
+arrive in any order, and a retried chunk replaces the earlier copy atomically, so an
+interrupted upload resumes by sending only its missing chunks. Every chunk but the last
+has the chunk size of the upload, so the size of each chunk is known up front.
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Any, BinaryIO
+
+STAGING_DIR_NAME = ".staging"
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Seconds an upload is kept after its last chunk before it is removed as abandoned.
+UPLOAD_STAGING_MAX_AGE = int(os.environ.get("UPLOAD_STAGING_MAX_AGE", str(24 * 60 * 60)))
+COPY_CHUNK_SIZE = 64 * 1024
+
+_UPLOAD_FILE = "upload.json"
+_UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+_FINISHING_SUFFIX = ".finishing"
+
+
+def staging_dir(data_file_dir: str) -> str:
+    """Get the staging directory of a data file directory."""
+    return os.path.join(data_file_dir, STAGING_DIR_NAME)
+
+
+def _upload_dir(data_file_dir: str, upload_id: str) -> str | None:
+    """Get the directory of an upload, or None if the upload id is malformed."""
+    if not _UPLOAD_ID.fullmatch(upload_id):
+        return None
+    return os.path.join(staging_dir(data_file_dir), upload_id)
+
+
+def num_chunks(size: int, chunk_size: int) -> int:
+    """Get the number of chunks of an upload, which has one chunk even when empty."""
+    return max(-(-size // chunk_size), 1)
+
+
+def chunk_length(upload: dict[str, Any], index: int) -> int:
+    """Get the size of a chunk of an upload."""
+    return min(upload["chunk_size"], upload["size"] - index * upload["chunk_size"])
+
+
+def create_upload(data_file_dir: str, upload: dict[str, Any]) -> str:
+    """Create a staging directory for a new upload described by upload, which holds at
+    least its size and chunk_size. Returns the id of the upload."""
+    upload_id = uuid.uuid4().hex
+    upload_dir = _upload_dir(data_file_dir, upload_id)
+    os.makedirs(upload_dir)
+    with open(os.path.join(upload_dir, _UPLOAD_FILE), "w", encoding="utf-8") as f:
+        json.dump(upload, f)
+    return upload_id
+
+
+def get_upload(data_file_dir: str, upload_id: str) -> dict[str, Any] | None:
+    """Get the description of an upload with the indices of the chunks it is missing.
+    Returns None if there is no such upload, or it is being finished."""
+    upload_dir = _upload_dir(data_file_dir, upload_id)
+    if upload_dir is None:
+        return None
+    try:
+        with open(os.path.join(upload_dir, _UPLOAD_FILE), encoding="utf-8") as f:
+            upload = json.load(f)
+        received = {int(name) for name in os.listdir(upload_dir) if name.isdigit()}
+    except FileNotFoundError:
+        return None
+    upload["missing"] = [
+        index
+        for index in range(num_chunks(upload["size"], upload["chunk_size"]))
+        if index not in received
+    ]
+    return upload
+
+
+def write_chunk(data_file_dir: str, upload_id: str, index: int, stream: BinaryIO) -> str:
+    """Write a chunk of an upload from a stream, replacing any earlier copy of it.
+    Returns an error message, which is empty if the chunk was written."""
+    upload = get_upload(data_file_dir, upload_id)
+    if upload is None:
+        return f"Upload {upload_id} not found."
+    if not 0 <= index < num_chunks(upload["size"], upload["chunk_size"]):
+        return f"Chunk {index} is out of range."
+    want = chunk_length(upload, index)
+    chunk_path = os.path.join(_upload_dir(data_file_dir, upload_id), str(index))
+    tmp_path = f"{chunk_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            size = 0
+            while block := stream.read(min(COPY_CHUNK_SIZE, want + 1 - size)):
+                size += len(block)
+                if size > want:
+                    break
+                f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        if size != want:
+            os.remove(tmp_path)
+            return f"Chunk {index} must be {want} bytes."
+        os.replace(tmp_path, chunk_path)
+    except FileNotFoundError:
+        # The upload was finished or cancelled while the chunk was written.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return f"Upload {upload_id} not found."
+    return ""
+
+
+class ChunkReader:
+    """Reads the chunks of an upload in order, as one stream."""
+
+    def __init__(self, upload_dir: str, count: int):
+        self._paths = [os.path.join(upload_dir, str(index)) for index in range(count)]
+        self._file = None
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to size bytes, from a single chunk at a time."""
+        while True:
+            if self._file is None:
+                if not self._paths:
+                    return b""
+                self._file = open(self._paths.pop(0), "rb")  # noqa: SIM115
+            data = self._file.read(size)
+            if data:
+                return data
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """Close the chunk being read."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def start_finishing(data_file_dir: str, upload_id: str) -> tuple[dict[str, Any] | None, str]:
+    """Claim a complete upload to be finished, so no more chunks are accepted and it cannot
+    be finished twice. Returns its description and an error message."""
+    upload = get_upload(data_file_dir, upload_id)
+    if upload is None:
+        return None, f"Upload {upload_id} not found."
+    if upload["missing"]:
+        return None, f"Upload {upload_id} is missing {len(upload['missing'])} chunks."
+    upload_dir = _upload_dir(data_file_dir, upload_id)
+    try:
+        os.rename(upload_dir, upload_dir + _FINISHING_SUFFIX)
+    except FileNotFoundError:
+        return None, f"Upload {upload_id} not found."
+    return upload, ""
+
+
+def open_chunks(data_file_dir: str, upload_id: str, upload: dict[str, Any]) -> ChunkReader:
+    """Open the chunks of an upload claimed by start_finishing."""
+    return ChunkReader(
+        _upload_dir(data_file_dir, upload_id) + _FINISHING_SUFFIX,
+        num_chunks(upload["size"], upload["chunk_size"]),
+    )
+
+
+def stop_finishing(data_file_dir: str, upload_id: str, done: bool):
+    """Release an upload claimed by start_finishing, removing it if it is done and
+    otherwise giving it back so it can be finished again."""
+    upload_dir = _upload_dir(data_file_dir, upload_id)
+    if done:
+        shutil.rmtree(upload_dir + _FINISHING_SUFFIX, ignore_errors=True)
+    else:
+        os.rename(upload_dir + _FINISHING_SUFFIX, upload_dir)
+
+
+def delete_upload(data_file_dir: str, upload_id: str) -> bool:
+    """Delete an upload and its chunks. Returns whether there was such an upload."""
+    upload_dir = _upload_dir(data_file_dir, upload_id)
+    if upload_dir is None or not os.path.isdir(upload_dir):
+        return False
+    shutil.rmtree(upload_dir, ignore_errors=True)
+    return True
+
+
+def remove_stale_uploads(data_file_dir: str, max_age: int = UPLOAD_STAGING_MAX_AGE) -> int:
+    """Remove uploads that have not received a chunk for max_age seconds.
+    Returns the number of uploads removed."""
+    root = staging_dir(data_file_dir)
+    if not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(root):
+        if _UPLOAD_ID.fullmatch(entry.name) and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
@@ -13,7 +13,7 @@ function help {
 }
 
 output_dir="untracked/tests/pytests"
-omit="db_control.py,logging_helper.py"
+omit="db_control.py,logging_helper.py,benchmarks/*"
 min_passing_coverage=80
 
 while [ $# -gt 0 ]; do